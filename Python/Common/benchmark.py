@@ -0,0 +1,184 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The benchmark module provides an end-to-end benchmark of the preprocessing
+stages on synthetic raw files of several sizes. Each stage is timed several
+times (the best run counts) and the peak memory of the allocations of one
+further run is traced. The results are reported as rows per second and peak
+memory per stage and compared with a stored baseline, so that a change that
+makes a stage slower or hungrier shows up as regression.
+
+The peak memory is traced with the tracemalloc module, i.e. it contains all
+allocations of numpy and pandas but not the internal buffers of the csv
+parsers.
+
+Required packages are the preprocessing, pandashelper and synthetic modules
+that are also included in this project.
+"""
+
+import os
+import json
+import time
+import tracemalloc
+import Util.pandashelper as pandashelper
+import Util.synthetic as synthetic
+import Common.preprocessing as preprocessing
+
+# define global settings for the benchmark
+repeat = 3 # number of timed runs per stage (the best run counts)
+tolerance = 0.2 # relative deviation from the baseline that is a regression
+sizes = {"small": {"tickers": 1, "days": 2, "trades": 2000,
+                   "quotes": 20000},
+         "medium": {"tickers": 2, "days": 5, "trades": 5000,
+                    "quotes": 50000},
+         "large": {"tickers": 2, "days": 20, "trades": 20000,
+                   "quotes": 200000}}
+stages = ["get_dates_with_first_row", "get_dataframe_by_chunks",
+          "get_filtered_dataframes", "get_new_aggregation_trades",
+          "get_new_aggregation_quotes", "get_distribution"]
+
+
+def measure(function, prepare, rows):
+    """
+    Function runs the given function with the arguments that are returned by
+    the prepare function (e.g. fresh copies of dataframes that are changed by
+    the function) and returns the number of rows, the best time and the
+    peak memory of the allocations of the function.
+    """
+    seconds = []
+    for k in range(repeat):
+        args = prepare()
+        start = time.perf_counter()
+        function(*args)
+        seconds.append(time.perf_counter() - start)
+    args = prepare()
+    tracemalloc.start()
+    try:
+        function(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"rows": rows, "seconds": min(seconds), "peak": peak}
+
+
+def get_stage_results(pp, source):
+    """
+    Function measures all stages for one raw file. The input of each stage
+    is the output of the stage in front of it. The return value is a
+    dictionary with the stage names as keys.
+    """
+    results = {}
+    chunks = list(pandashelper.get_dataframe_by_chunks(source))
+    df = pandashelper.pd.concat(chunks)
+    rows = len(df)
+    results["get_dates_with_first_row"] = measure(
+        pandashelper.get_dates_with_first_row, lambda: (source,), rows)
+    results["get_dataframe_by_chunks"] = measure(
+        lambda s: list(pandashelper.get_dataframe_by_chunks(s)),
+        lambda: (source,), rows)
+    results["get_filtered_dataframes"] = measure(
+        pp.get_filtered_dataframes, lambda: (df.copy(),), rows)
+    df_trades, df_quotes = pp.get_filtered_dataframes(df.copy())
+    results["get_new_aggregation_trades"] = measure(
+        pandashelper.get_new_aggregation_trades,
+        lambda: (df_trades.copy(),), len(df_trades))
+    results["get_new_aggregation_quotes"] = measure(
+        pandashelper.get_new_aggregation_quotes,
+        lambda: (df_quotes.copy(),), len(df_quotes))
+    results["get_distribution"] = measure(
+        pandashelper.get_distribution, lambda: (df_trades, 60),
+        len(df_trades))
+    return results
+
+
+def run(names, folder):
+    """
+    Function generates the synthetic raw files of the given sizes (if they
+    don't exist yet) and measures all stages for each file. The rows and
+    seconds of all files of a size are summed up, the peak memory is the
+    maximum. The return value is a dictionary with the sizes and stages as
+    keys. The csv backend is part of the size key, because the results of
+    different backends can't be compared.
+    """
+    results = {}
+    for name in names:
+        print("Benchmarking size " + name + " ...")
+        input_folder = os.path.join(folder, name, "DAX Xetra")
+        files = synthetic.write_sources(input_folder, **sizes[name])
+        pp = preprocessing.PreProcessor(input_folder)
+        key = name + "/" + pandashelper.csv_backend
+        results[key] = {}
+        for file in files:
+            file_results = get_stage_results(
+                pp, os.path.join(input_folder, file))
+            for stage, result in file_results.items():
+                total = results[key].setdefault(
+                    stage, {"rows": 0, "seconds": 0.0, "peak": 0})
+                total["rows"] += result["rows"]
+                total["seconds"] += result["seconds"]
+                total["peak"] = max(total["peak"], result["peak"])
+        for result in results[key].values():
+            result["rows_per_second"] = result["rows"] / result["seconds"] \
+                if result["seconds"] else None
+    return results
+
+
+def load_baseline(target):
+    """
+    Load the baseline of a former run. An empty baseline is returned if the
+    file doesn't exist.
+    """
+    if not os.path.isfile(target):
+        return {}
+    f = open(target)
+    baseline = json.load(f)
+    f.close()
+    return baseline
+
+
+def save_baseline(results, target):
+    """
+    Save the results as baseline for later runs. The results of sizes that
+    are not included are kept from the existing baseline.
+    """
+    baseline = load_baseline(target)
+    baseline.update(results)
+    f = open(target + ".tmp", "w")
+    f.write(json.dumps(baseline, indent=1))
+    f.close()
+    os.replace(target + ".tmp", target)
+
+
+def get_regressions(result, reference):
+    """
+    Returns a text with the regressions of a result compared with the result
+    of the baseline, i.e. a lower throughput or a higher peak memory than the
+    tolerance setting allows.
+    """
+    if not reference or not reference.get("rows_per_second"):
+        return "no baseline"
+    regressions = []
+    speed = result["rows_per_second"] / reference["rows_per_second"]
+    if speed < 1 - tolerance:
+        regressions.append("SLOWER")
+    if reference["peak"] and result["peak"] > reference["peak"] * (
+            1 + tolerance):
+        regressions.append("MEMORY")
+    return (" ".join(regressions) or "ok") + " (" + str(round(speed, 2)) + \
+        "x)"
+
+
+def print_report(results, baseline):
+    """
+    Print a table with the throughput and the peak memory of all sizes and
+    stages together with the regressions compared with the baseline.
+    """
+    print("%-14s %-28s %10s %12s %10s  %s" % (
+        "size", "stage", "rows", "rows/s", "peak MB", "baseline"))
+    for name, size_results in results.items():
+        for stage in stages:
+            result = size_results[stage]
+            print("%-14s %-28s %10d %12.0f %10.1f  %s" % (
+                name, stage, result["rows"], result["rows_per_second"],
+                result["peak"] / 2 ** 20, get_regressions(
+                    result, baseline.get(name, {}).get(stage))))
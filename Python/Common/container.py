@@ -0,0 +1,221 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The container module provides a class that builds the panel of all trading
+venues which every R script builds row by row before any model is estimated
+(the "container"): the daily aggregations of trades and quotes of all venues
+merged on ticker and date, without the excluded tickers and the days with a
+negative spread in average, with the trading activity W and the labels of
+month, stock, venue, market and index. The aggregations of all venues are
+merged with one vectorized join.
+
+The panel is cached in the folder of the aggregations together with a key
+of all input files (their size and time of modification or the fingerprints
+of the parquet partitions) and of the settings below, so it's built again
+only if any aggregation changed. The columns are named like the container
+in the R scripts (e.g. N.x and N.y), so the panel can be loaded there with
+read.csv("./Container.csv") or with the arrow package from the folder
+Aggregationen. The folder of the aggregations depends on the output format
+(see get_folder()).
+
+Required packages are the pandashelper, parquetstore and manifest modules
+that are also included in this project.
+"""
+
+import os
+import json
+import hashlib
+import Util.pandashelper as pandashelper
+import Util.parquetstore as parquetstore
+import Util.instrumentation as instrumentation
+import Common.manifest as manifest
+
+# define global settings for the panel
+excluded_tickers = ['FTIp.BS','FTIp.CHI','FTIp.TQ','TECp.BS',
+                    'TECp.CHI','TECp.TQ','VLOF.PA','VNAd.BS',
+                    'VNAd.CHI','VNAd.TQ','VNAn.DE','FRp.BS',
+                    'FRp.CHI','FRp.TQ','FRTp.BS','FTI.PA']
+drop_crossed = True # drop the days with a negative spread in average
+container_version = 1 # increase whenever the columns of the panel change
+container_name = "Container" # file name of the cached panel (the extension
+                             # depends on the output format)
+key_file = "_container.json"
+
+
+def get_folder():
+    """
+    Returns the folder of the aggregations in the output format of the
+    pandashelper module, i.e. the folder in which the preprocessor saves
+    them.
+    """
+    if pandashelper.output_format == "parquet":
+        return pandashelper.parquet_folder
+    return "./"
+
+
+class ContainerBuilder:
+    """
+    The ContainerBuilder class builds and caches the panel of the
+    aggregations of all trading venues that are located in the given folder
+    (by default the folder in which the preprocessor saves them in the
+    output format of the pandashelper module, see get_folder()). The output
+    format defines which aggregations are read and in which format the
+    panel is cached.
+    """
+    def __init__(self, folder=None):
+
+        if folder is None:
+            folder = get_folder()
+        self.folder = folder if folder[-1:] == "/" else folder + "/"
+        self.container = pandashelper.pd.DataFrame()
+        self.verbose = True
+
+    def get_marketplaces(self):
+        """
+        Returns the sorted names of all trading venues with aggregations of
+        both trades and quotes in the folder.
+        """
+        if pandashelper.output_format == "parquet":
+            return sorted(
+                name[len("venue="):] for name in os.listdir(
+                    self.folder + "Trades")
+                if name.startswith("venue=") and all(
+                    parquetstore.has_partitions(
+                        self.folder, kind, name[len("venue="):])
+                    for kind in ["Trades", "Quotes"]))
+        return sorted(
+            file[:-len(" Trades.csv")] for file in os.listdir(self.folder)
+            if file.endswith(" Trades.csv") and os.path.isfile(
+                self.folder + file[:-len(" Trades.csv")] + " Quotes.csv"))
+
+    def get_key(self):
+        """
+        Returns the key of the panel that changes with any of the input
+        aggregations, the output format or the settings of this module.
+        """
+        sources = {}
+        for marketplace in self.get_marketplaces():
+            for kind in ["Trades", "Quotes"]:
+                if pandashelper.output_format == "parquet":
+                    state = parquetstore.load_fingerprints(
+                        self.folder, kind, marketplace)
+                else:
+                    state = manifest.get_file_state(
+                        self.folder + marketplace + " " + kind + ".csv")
+                sources[marketplace + " " + kind] = state
+        content = json.dumps({"version": container_version,
+                              "format": pandashelper.output_format,
+                              "excluded_tickers": sorted(excluded_tickers),
+                              "drop_crossed": drop_crossed,
+                              "sources": sources}, sort_keys=True)
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def get_container_file(self):
+        """
+        Gives the path of the cached panel in the output format.
+        """
+        return self.folder + container_name + (
+            ".parquet" if pandashelper.output_format == "parquet" else ".csv")
+
+    def load_aggregations(self):
+        """
+        Returns the aggregations of trades and quotes of all trading venues
+        in the folder, each with the name of the venue in the column
+        marketplace.
+        """
+        if pandashelper.output_format == "parquet":
+            aggregations = []
+            for kind in ["Trades", "Quotes"]:
+                df = parquetstore.read_partitions(self.folder, kind, None)
+                aggregations.append(df.rename(
+                    columns={"venue": "marketplace"}))
+            return tuple(aggregations)
+        aggregations = {"Trades": [], "Quotes": []}
+        for marketplace in self.get_marketplaces():
+            for kind, dfs in aggregations.items():
+                df = pandashelper.pd.read_csv(
+                    self.folder + marketplace + " " + kind + ".csv",
+                    header=0)
+                df.insert(2, "marketplace", marketplace)
+                dfs.append(df)
+        return tuple(
+            pandashelper.pd.concat(dfs, ignore_index=True) if dfs else
+            pandashelper.pd.DataFrame(columns=["ticker", "date",
+                                               "marketplace"])
+            for dfs in aggregations.values())
+
+    def init_container(self):
+        """
+        Build the panel of all trading venues from their aggregations.
+        """
+        with instrumentation.stage("container") as record:
+            df_trades, df_quotes = self.load_aggregations()
+            container = pandashelper.get_merged_container(
+                df_trades, df_quotes, excluded_tickers, drop_crossed)
+            self.container = pandashelper.add_invariance_variables(
+                container)
+            record["rows_in"] = len(df_trades) + len(df_quotes)
+            record["rows_out"] = len(self.container)
+
+    def load_container(self, key=None):
+        """
+        Load the cached panel if its key equals the current key of the
+        input aggregations. Returns False if there isn't a valid cache.
+        """
+        target = self.folder + key_file
+        if not os.path.isfile(target) or not os.path.isfile(
+                self.get_container_file()):
+            return False
+        f = open(target)
+        cached = json.load(f)
+        f.close()
+        if cached.get("key") != (self.get_key() if key is None else key):
+            return False
+        if pandashelper.output_format == "parquet":
+            parquetstore.check_backend()
+            self.container = parquetstore.parquet.read_table(
+                self.get_container_file()).to_pandas()
+        else:
+            self.container = pandashelper.pd.read_csv(
+                self.get_container_file(), header=0)
+        return True
+
+    def save_container(self, key=None):
+        """
+        Save the panel in the output format together with the key of the
+        input aggregations. Both files are written under a temporary name
+        first, the key is replaced last.
+        """
+        target = self.get_container_file()
+        if pandashelper.output_format == "parquet":
+            parquetstore.check_backend()
+            parquetstore.parquet.write_table(
+                parquetstore.pa.Table.from_pandas(
+                    self.container, preserve_index=False), target + ".tmp",
+                compression=parquetstore.compression)
+        else:
+            self.container.to_csv(target + ".tmp", index=False)
+        os.replace(target + ".tmp", target)
+        f = open(self.folder + key_file + ".tmp", "w")
+        f.write(json.dumps({"key": self.get_key() if key is None else key,
+                            "rows": len(self.container)}))
+        f.close()
+        os.replace(self.folder + key_file + ".tmp", self.folder + key_file)
+
+    def get_container(self):
+        """
+        Returns the panel of all trading venues. The cached panel is loaded
+        if no aggregation changed since it has been built, otherwise it's
+        built and cached again.
+        """
+        key = self.get_key()
+        if self.load_container(key):
+            if self.verbose:
+                print("Loaded container from cache.")
+            return self.container
+        if self.verbose:
+            print("Building container of " + str(len(
+                self.get_marketplaces())) + " trading venues ...")
+        self.init_container()
+        self.save_container(key)
+        return self.container
@@ -0,0 +1,205 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The manifest module keeps track of the partitions of raw data (source file,
+ticker and date) that are aggregated already. For each source file the size
+and the time of the last modification are recorded together with the dates
+and a fingerprint of their rows (the count of rows and a checksum of their
+bytes), and the whole manifest is tied to a version of the aggregation
+code. This allows to resume an interrupted run of a trading venue and to
+aggregate only new or changed partitions of further deliveries.
+
+The version consists of the version number of the aggregation code and a
+hash of all settings that change the results of the aggregation (see
+result_settings below), so a manifest is reset whenever one of them changes.
+The same settings are part of the keys of the workflow module and are
+passed to the worker processes of the parallel module.
+
+The numpy package must be installed to use this module. Required packages
+are the pandashelper, orderflow, sessions and qualifiers modules that are
+also included in this project.
+"""
+
+import os
+import gzip
+import json
+import zlib
+import hashlib
+import numpy as np
+import Util.pandashelper as pandashelper
+import Util.orderflow as orderflow
+import Util.sessions as sessions
+import Util.qualifiers as qualifiers
+
+# define global settings for the manifest
+read_size = 16 * 2 ** 20 # bytes per read while computing the fingerprints
+# settings of other modules that change the results of the aggregation
+result_settings = [(pandashelper, ["aggregation_version",
+                                   "sampling_frequency",
+                                   "distribution_windows",
+                                   "bar_resolutions"]),
+                   (orderflow, ["quote_lag"]),
+                   (sessions, ["calendars", "default_calendar"]),
+                   (qualifiers, ["flags", "rules", "default_rule"])]
+
+
+def get_settings():
+    """
+    Returns the values of all settings that change the results of the
+    aggregation as dictionary with the name of the module and the name of
+    the setting as key, e.g. "orderflow.quote_lag".
+    """
+    return {module.__name__.split(".")[-1] + "." + name: getattr(
+        module, name) for module, names in result_settings for name in names}
+
+
+def set_settings(settings):
+    """
+    Function takes over the values of the given settings (a dictionary like
+    the result of get_settings()), e.g. in a worker process.
+    """
+    for module, names in result_settings:
+        for name in names:
+            key = module.__name__.split(".")[-1] + "." + name
+            if key in settings:
+                setattr(module, name, settings[key])
+
+
+def get_version():
+    """
+    Returns the version of the aggregation code including a hash of all
+    settings that change the results of the aggregation.
+    """
+    return str(pandashelper.aggregation_version) + "/" + hashlib.sha1(
+        json.dumps(get_settings(), sort_keys=True, default=str).encode(
+            "utf-8")).hexdigest()[:12]
+
+
+def get_empty_manifest():
+    """
+    Returns a new manifest without any aggregated partitions.
+    """
+    return {"version": get_version(), "files": {}}
+
+
+def load_manifest(target):
+    """
+    Load a manifest from a json file. If the file doesn't exist or belongs
+    to another version of the aggregation code, an empty manifest is returned
+    so that all partitions are aggregated again.
+    """
+    if not os.path.isfile(target):
+        return get_empty_manifest()
+    f = open(target)
+    manifest = json.load(f)
+    f.close()
+    if manifest.get("version") != get_version():
+        return get_empty_manifest()
+    return manifest
+
+
+def save_manifest(manifest, target):
+    """
+    Save a manifest in a json file. The file is written under a temporary
+    name first and replaced afterwards, so that an interruption never leaves
+    a broken manifest.
+    """
+    f = open(target + ".tmp", "w")
+    f.write(json.dumps(manifest))
+    f.close()
+    os.replace(target + ".tmp", target)
+
+
+def get_file_state(source):
+    """
+    Returns the size and the time of the last modification of a file.
+    """
+    stat = os.stat(source)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def is_file_unchanged(manifest, file, source):
+    """
+    Returns True if the given source file is recorded in the manifest and
+    neither its size nor its time of modification changed since then.
+    """
+    entry = manifest["files"].get(file)
+    if entry is None:
+        return False
+    state = get_file_state(source)
+    return entry["size"] == state["size"] and entry["mtime"] == state["mtime"]
+
+
+def get_date_fingerprints(source, index):
+    """
+    Function returns the fingerprint of each date of a source file as
+    dictionary in the order of the dates in the file. The dates are given by
+    the records of the row index of the file (see the rowindex module). The
+    fingerprint consists of the count of rows and the CRC-32 checksum of the
+    uncompressed bytes of all rows of the date, so a revised price or size
+    changes the fingerprint even if the count of rows stays the same.
+    """
+    index = np.sort(np.asarray(index), order="first_row")
+    ends = index["first_row"] + index["rows"]
+    checksums = []
+    f = gzip.open(source, "rb")
+    try:
+        f.readline()
+        row = 0
+        checksum = 0
+        while len(checksums) < len(index):
+            data = f.read(read_size)
+            if not data:
+                break
+            breaks = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)
+            position = 0
+            # the line break with the number k (counted from 0) ends the row
+            # with the number k, so a date ends with the break of its last row
+            while len(checksums) < len(index) and \
+                    ends[len(checksums)] - 1 < row + len(breaks):
+                end = breaks[ends[len(checksums)] - 1 - row] + 1
+                checksums.append(zlib.crc32(data[position:end], checksum))
+                checksum = 0
+                position = end
+            checksum = zlib.crc32(data[position:], checksum)
+            row += len(breaks)
+        # the last row of the file may lack a line break
+        if len(checksums) < len(index):
+            checksums.append(checksum)
+    finally:
+        f.close()
+    return {record["date"].decode(): "%d/%08x" % (record["rows"], checksum)
+            for record, checksum in zip(index, checksums)}
+
+
+def get_changed_dates(manifest, file, dates):
+    """
+    Returns all dates of a file that are new or changed compared to the
+    manifest. The dates must be given as dictionary with the fingerprint per
+    date (see get_date_fingerprints(), None if unknown). A date with unknown
+    fingerprint is always treated as changed.
+    """
+    recorded = manifest["files"].get(file, {}).get("dates", {})
+    return [date for date, fingerprint in dates.items()
+            if fingerprint is None or recorded.get(date) != fingerprint]
+
+
+def get_removed_dates(manifest, file, dates):
+    """
+    Returns all dates that are recorded in the manifest for a file but are
+    not part of the file anymore (e.g. after a revised delivery). The dates
+    must be given as dictionary like in get_changed_dates().
+    """
+    recorded = manifest["files"].get(file, {}).get("dates", {})
+    return [date for date in recorded if date not in dates]
+
+
+def set_file(manifest, file, source, ticker, dates):
+    """
+    Record a source file with its ticker and all its aggregated dates (as
+    dictionary with the fingerprint per date) in the manifest.
+    """
+    entry = get_file_state(source)
+    entry["ticker"] = ticker
+    entry["dates"] = dates
+    manifest["files"][file] = entry
@@ -0,0 +1,154 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The parallel module provides a parallel execution mode for the aggregation
+of the preprocessor class. The tickers of one or more trading venues are
+spread across a pool of worker processes, each of them aggregates all days of
+one ticker at a time. The results are merged in the same order as in the
+serial execution, so that the output is identical.
+
+All settings that change the results of the aggregation (the result
+settings of the manifest module) are passed to the workers, because they
+start without the changes of the main process on systems that spawn new
+processes (e.g. Windows).
+
+Required packages are the pandashelper and manifest modules that are also
+included in this project. The memory limit per worker is supported on unix
+systems only.
+"""
+
+import os
+import copy
+import time
+import multiprocessing
+import concurrent.futures
+import Util.pandashelper as pandashelper
+import Util.distribution as distribution
+import Util.instrumentation as instrumentation
+import Common.manifest as manifest
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# settings of the pandashelper module that are passed to the workers besides
+# the result settings of the manifest module
+shared_settings = ["rows_limit_per_iter", "csv_backend", "prefetch_depth"]
+# settings of the instrumentation module that are passed to the workers
+shared_instrumentation = ["enabled", "log_file", "profile_ticker"]
+start_method = None # start method of the worker processes (None for the
+                    # default of the system, "spawn" like on Windows)
+
+
+def init_worker(settings, result_settings, instrumentation_settings,
+                memory_limit):
+    """
+    Initialization of each worker process. The settings of the pandashelper
+    and instrumentation modules and the result settings are taken over from
+    the main process and the address space of the worker is limited to the
+    given number of megabytes (if set).
+    """
+    manifest.set_settings(result_settings)
+    for name, value in settings.items():
+        setattr(pandashelper, name, value)
+    for name, value in instrumentation_settings.items():
+        setattr(instrumentation, name, value)
+    if memory_limit is not None and resource is not None:
+        limit = int(memory_limit) * 2 ** 20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def get_aggregations_of_ticker(pp, ticker):
+    """
+    Worker function that calculates the aggregations of one ticker with a
+    copy of the preprocessor class. The return value is a tuple of the
+    aggregated trades and quotes, the distributions of trades, the intraday
+    bars of trades and quotes and the instrumentation records of the ticker.
+    """
+    pp.verbose = False
+    instrumentation.start_run()
+    instrumentation.set_context(worker=os.getpid())
+    pp.init_aggregations_of_ticker(ticker)
+    return (pp.aggregations_trades, pp.aggregations_quotes,
+            pp.distributions, pp.bars_trades, pp.bars_quotes,
+            instrumentation.records[:])
+
+
+def get_worker_copy(pp, ticker):
+    """
+    Returns a copy of the preprocessor class that contains only the row
+    numbers of the given ticker and no aggregations, so that the copy can be
+    sent to a worker process quickly.
+    """
+    pp_copy = copy.copy(pp)
+    pp_copy.rows = {ticker: pp.rows[ticker]}
+    pp_copy.row_index = pp.row_index[:0]
+    pp_copy.aggregations_trades = pandashelper.get_empty_aggregation_trades()
+    pp_copy.aggregations_quotes = pandashelper.get_empty_aggregation_quotes()
+    pp_copy.distributions = {}
+    pp_copy.bars_trades = {}
+    pp_copy.bars_quotes = {}
+    return pp_copy
+
+
+def init_aggregations(preprocessors, workers=None, memory_limit=None):
+    """
+    Calculate the aggregations of all tickers of the given preprocessor
+    classes (typically one per trading venue) in a pool of worker processes.
+    The aggregations of each ticker are appended to the preprocessor class it
+    belongs to in the same order as the tickers are processed serially.
+    The memory limit (in MB per worker) is only enforced on unix systems, on
+    other systems a warning is printed.
+    """
+    settings = {name: getattr(pandashelper, name) for name in shared_settings}
+    instrumentation_settings = {name: getattr(instrumentation, name)
+                                for name in shared_instrumentation}
+    if memory_limit is not None and resource is None:
+        print("Warning: the memory limit of " + str(memory_limit) + " MB " +
+              "per worker can't be enforced on this system (the resource " +
+              "module is missing), the workers run without limit.")
+    instrumentation.start_run()
+    tasks = []
+    for pp in preprocessors:
+        for ticker in pp.rows:
+            if ticker in pp.exluded_tickers:
+                print("Ticker " + ticker + " is skipped.")
+                continue
+            tasks.append((pp, ticker))
+    results = [None] * len(tasks)
+    start = time.time()
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=init_worker,
+            initargs=(settings, manifest.get_settings(),
+                      instrumentation_settings, memory_limit)) as executor:
+        futures = {executor.submit(
+            get_aggregations_of_ticker, get_worker_copy(pp, ticker),
+            ticker): k for k, (pp, ticker) in enumerate(tasks)}
+        done = 0
+        for future in concurrent.futures.as_completed(futures):
+            k = futures[future]
+            results[k] = future.result()
+            done += 1
+            print("Finished ticker " + tasks[k][1] + " of " +
+                  tasks[k][0].marketplace + " (" + str(done) + " of " +
+                  str(len(tasks)) + " after " +
+                  str(round(time.time() - start)) + " seconds) ...")
+    for k in range(len(tasks)):
+        pp = tasks[k][0]
+        pp.aggregations_trades = pandashelper.concat_dfs(
+            pp.aggregations_trades, results[k][0])
+        pp.aggregations_quotes = pandashelper.concat_dfs(
+            pp.aggregations_quotes, results[k][1])
+        for key, histogram in results[k][2].items():
+            pp.distributions[key] = distribution.add_histograms(
+                pp.distributions.get(key, histogram[:0]), histogram)
+        for bars, new_bars in [(pp.bars_trades, results[k][3]),
+                               (pp.bars_quotes, results[k][4])]:
+            for seconds, df in new_bars.items():
+                bars[seconds] = pandashelper.concat_dfs(
+                    bars[seconds], df) if seconds in bars else df
+        instrumentation.records.extend(results[k][5])
+    instrumentation.print_summary()
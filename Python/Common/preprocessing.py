@@ -14,6 +14,17 @@ import re
 import json
 import math
 import Util.pandashelper as pandashelper
+import Util.rowindex as rowindex
+import Util.gzipindex as gzipindex
+import Util.accumulators as accumulators
+import Util.distribution as distribution
+import Util.instrumentation as instrumentation
+import Util.prefetch as prefetch
+import Util.parquetstore as parquetstore
+import Util.sessions as sessions
+import Util.qualifiers as qualifiers
+import Common.parallel as parallel
+import Common.manifest as manifest
 
 
 class PreProcessor:
@@ -32,8 +43,14 @@ class PreProcessor:
             " " + additional_filter.replace(
             "_", "").replace(".", "")))
         self.files = []
-        self.bod = pandashelper.pd.Timestamp("1900-01-01 09:00:00.000")
-        self.eod = pandashelper.pd.Timestamp("1900-01-01 16:30:00.000")
+        self.cache_folder = self.marketplace + " Cache/"
+        self.parquet_folder = pandashelper.parquet_folder
+        self.calendar = sessions.get_calendar(self.marketplace)
+        self.bod = sessions.get_time_of_day(
+            sessions.get_milliseconds_of_time(self.calendar["open"]))
+        self.eod = sessions.get_time_of_day(
+            sessions.get_milliseconds_of_time(self.calendar["close"]))
+        self.trade_rule = qualifiers.get_rule(self.marketplace)
         self.exluded_tickers = ['FTIp.BS','FTIp.CHI','FTIp.TQ','TECp.BS',
                                 'TECp.CHI','TECp.TQ','VLOF.PA','VNAd.BS',
                                 'VNAd.CHI','VNAd.TQ','VNAn.DE','FRp.BS',
@@ -41,26 +58,58 @@ class PreProcessor:
         for file in os.listdir(self.input_folder):
             if file.endswith(".csv.gz") and additional_filter in file:
                 self.files.append(file)
+        self.verbose = True
         self.rows = {}
+        self.row_index = rowindex.np.zeros(0, dtype=rowindex.index_dtype)
         self.aggregations_trades = pandashelper.get_empty_aggregation_trades()
         self.aggregations_quotes = pandashelper.get_empty_aggregation_quotes()
-        self.distribution = pandashelper.pd.Series([])
+        self.distributions = {}
+        self.bars_trades = {}
+        self.bars_quotes = {}
 
     def init_rows_per_date(self):
         """
         Analyze raw data to get all row numbers for each day in the data.
         The result is a dictionary with one value per ticker that again
-        represents a dictionary with one row number per day.
+        represents a dictionary with one row number per day. Additionally
+        the full index with counts of rows, trades and quotes and the time
+        range per ticker and day is kept as record array.
         """
         print("Getting rows (indices) per ticker and day ... ")
-        rows = {}
+        instrumentation.start_run()
+        indices = []
         for i in range(len(self.files)):
             print("Processing file " + str(i + 1) + " of " +
                   str(len(self.files)) + " ...")
             source = self.input_folder + self.files[i]
             ticker = self.files[i].split('_')[1]
-            rows[ticker] = pandashelper.get_dates_with_first_row(source)
-        self.rows = rows
+            instrumentation.set_context(venue=self.marketplace,
+                                        ticker=ticker)
+            with instrumentation.stage("index") as record:
+                indices.append(rowindex.get_date_index(source, ticker))
+                record["rows_out"] = int(indices[-1]["rows"].sum())
+                record["bytes"] = os.path.getsize(source)
+        if self.verbose:
+            instrumentation.print_summary()
+        self.row_index = rowindex.np.concatenate(indices) if indices \
+            else rowindex.np.zeros(0, dtype=rowindex.index_dtype)
+        self.rows = rowindex.get_rows_from_index(self.row_index)
+
+    def init_checkpoints(self):
+        """
+        Build a checkpoint index for each raw file so that the rows of a
+        single day can be read without decompressing the whole file in front
+        of it. The first rows of all days are stored as well if the row
+        numbers are known already. Requires the indexed_gzip package.
+        """
+        print("Getting checkpoints per file ... ")
+        for i in range(len(self.files)):
+            print("Processing file " + str(i + 1) + " of " +
+                  str(len(self.files)) + " ...")
+            source = self.input_folder + self.files[i]
+            ticker = self.files[i].split('_')[1]
+            gzipindex.build_index(
+                source, list(self.rows.get(ticker, {}).values()))
 
     def get_dataframe_per_date(self, ticker, date, date_next):
         """
@@ -102,42 +151,168 @@ class PreProcessor:
         data outside of official trading hours. Finally the columns will be
         converted to the right data type if it's different to string.
         """
-        df.loc[:, "Time[G]"] = pandashelper.pd.to_datetime(
-            df["Time[G]"], format="%H:%M:%S.%f")
-
-        # add GMT offset plus difference between Berlin and London local time
-        # trading hours of DAX Xetra and CAC Paris:
-        #   9:00 am to 5:30 pm (Berlin local time)
-        # trading hours of MTFs:
-        #   8:00 am to 4:30 pm (London local time)        
-        df.loc[:, "Time[G]"] = df["Time[G]"] + pandashelper.pd.Timedelta(
-            hours=df["GMT Offset"].iloc[0]+int(
-                self.marketplace != "DAX Xetra" and
-                self.marketplace != "CAC Paris"))
-        df = df.loc[(df["Time[G]"] >= self.bod) & (df["Time[G]"] <= self.eod)]
-
-        df_trades = df.query("Type=='Trade' and " +
-                             "Qualifiers.str.startswith(' [ACT_FLAG1]')")
-        df_quotes = df.query("Type=='Quote'")
-
-        for col in ["Price", "Volume"]:
-            pandashelper.convert_column_to_numeric(df_trades, col)
-        for col in ["Bid Price", "Bid Size", "Ask Price", "Ask Size"]:
-            pandashelper.convert_column_to_numeric(df_quotes, col)
+        df_trades, df_quotes = pandashelper.get_dataframes_by_type(df)
+        return self.get_filtered_streams(df_trades, df_quotes)
+
+    def get_filtered_streams(self, df_trades, df_quotes):
+        """
+        This function applies the same filters and conversions as
+        get_filtered_dataframes() on trades and quotes that are separated by
+        the reader already. The rows outside of the trading session are
+        dropped before any conversion of times or numbers.
+        """
+        if df_trades.empty and df_quotes.empty:
+            return df_trades, df_quotes
+        rows_in = len(df_trades) + len(df_quotes)
+        with instrumentation.stage("filter", rows_in) as record:
+            # the typed columns of the arrow backend don't need any
+            # conversion but the integer milliseconds into datetimes
+            typed = pandashelper.csvreader.is_typed(df_trades) or \
+                pandashelper.csvreader.is_typed(df_quotes)
+            df_trades, df_quotes = [self.get_session_dataframe(df)
+                                    for df in [df_trades, df_quotes]]
+
+            df_trades = self.get_screened_trades(df_trades)
+
+            if not typed:
+                with instrumentation.stage("filter.convert_numbers",
+                                           len(df_trades) + len(df_quotes)):
+                    for col in ["Price", "Volume"]:
+                        pandashelper.convert_column_to_numeric(df_trades, col)
+                    for col in ["Bid Price", "Bid Size", "Ask Price",
+                                "Ask Size"]:
+                        pandashelper.convert_column_to_numeric(df_quotes, col)
+            record["rows_out"] = len(df_trades) + len(df_quotes)
 
         return df_trades, df_quotes
 
-    def get_splitted_dataframes(self, df, ticker, last_tail_length):
+    def get_session_dataframe(self, df):
         """
-        This function is included because of legacy reasons. It splits an
-        input dataframe 'on the fly' without information about the rows of
-        each day in the raw data. As a consequence this function becomes
-        very slow for large dataframes.
+        This function drops all rows outside of the trading session in the
+        calendar of the trading venue and converts the times of the other
+        rows into local time of the venue. The offset to GMT, the trading
+        hours and the holidays are looked up per date, so a dataframe may
+        span a change of the daylight saving time. The Time[G] column
+        contains either time strings or integer milliseconds (typed columns
+        of the arrow backend or the columnar cache). The session is checked
+        on integer milliseconds, so only the rows within the session are
+        converted into datetimes.
         """
-        date = str(df["Date[G]"].iloc[-1])
-        index = self.rows[ticker][date]
-        row = index % pandashelper.rows_limit_per_iter + last_tail_length
-        return df.iloc[:row, :], df.iloc[row:, :]
+        if df.empty:
+            return df
+        # all venues are measured in the local time of their calendar, e.g.
+        # the MTFs (GMT offset of London) in the local time of Berlin or Paris
+        typed = df["Time[G]"].dtype.kind in "iu"
+        with instrumentation.stage("filter.session", len(df)):
+            times = df["Time[G]"].values if typed else \
+                pandashelper.get_milliseconds(df["Time[G]"].values)
+            mask, offsets = sessions.get_session_mask(
+                df["Date[G]"].values, times, self.calendar)
+            df = df.loc[mask]
+        with instrumentation.stage("filter.convert_times", len(df)):
+            if typed:
+                df.loc[:, "Time[G]"] = pandashelper.get_datetimes(
+                    times[mask] + offsets[mask]).values
+            else:
+                df.loc[:, "Time[G]"] = (pandashelper.pd.to_datetime(
+                    df["Time[G]"], format="%H:%M:%S.%f") +
+                    pandashelper.pd.to_timedelta(offsets[mask], unit="ms")
+                    ).values
+        return df
+
+    def get_filtered_partitions(self, df_trades, df_quotes):
+        """
+        This function applies the same filters as get_filtered_dataframes()
+        on trades and quotes that are loaded from the columnar cache. These
+        dataframes are separated and typed already, only the times must be
+        converted from integer milliseconds.
+        """
+        df_trades, df_quotes = [self.get_session_dataframe(df)
+                                for df in [df_trades, df_quotes]]
+        df_trades = self.get_screened_trades(df_trades)
+        return df_trades, df_quotes
+
+    def get_screened_trades(self, df):
+        """
+        This function keeps only the trades whose qualifiers satisfy the
+        screening rule of the trading venue (see the qualifiers module). The
+        distinct qualifiers are parsed once, the rows are selected by the
+        bitmasks of their codes.
+        """
+        with instrumentation.stage("filter.qualifiers", len(df)):
+            return df.loc[qualifiers.get_screening_mask(df["Qualifiers"],
+                                                        self.trade_rule)]
+
+    def init_cache(self):
+        """
+        Convert all raw files of the trading venue into the columnar cache
+        that is partitioned by ticker and day. This step is needed only once,
+        afterwards the aggregations can be computed from the cache without
+        decompressing and parsing the raw files again.
+        """
+        print("Converting raw files into columnar cache ... ")
+        for i in range(len(self.files)):
+            print("Processing file " + str(i + 1) + " of " +
+                  str(len(self.files)) + " ...")
+            source = self.input_folder + self.files[i]
+            ticker = self.files[i].split('_')[1]
+            pandashelper.convert_source_to_cache(
+                source, self.cache_folder, ticker)
+
+    def init_aggregations_from_cache(self):
+        """
+        This method calculates the same aggregations as init_aggregations()
+        but loads the typed partitions from the columnar cache. The days of
+        each ticker are combined in batches with respect to the limit of rows
+        per iteration that is defined in the pandashelper module.
+        """
+        print("Getting aggregations per ticker and day from cache ...")
+        tickers = pandashelper.columnstore.get_tickers(self.cache_folder)
+        for i in range(len(tickers)):
+            ticker = tickers[i]
+            # skip tickers that has been excluded from the sample
+            if ticker in self.exluded_tickers:
+                print("Ticker " + ticker + " is skipped.")
+                continue
+            print("Processing ticker " + str(i + 1) + " of " +
+                  str(len(tickers)) + " ...")
+            dates = pandashelper.columnstore.get_dates(
+                self.cache_folder, ticker)
+            batch = []
+            rows = 0
+            for k in range(len(dates)):
+                for kind in ["trades", "quotes"]:
+                    path = pandashelper.columnstore.get_partition_folder(
+                        self.cache_folder, ticker, dates[k], kind)
+                    rows += pandashelper.columnstore.read_meta(path)["rows"]
+                batch.append(dates[k])
+                if rows < pandashelper.rows_limit_per_iter and \
+                        k < len(dates) - 1:
+                    continue
+                df_trades, df_quotes = self.get_filtered_partitions(
+                    pandashelper.get_dataframe_by_partitions(
+                        self.cache_folder, ticker, batch, "trades"),
+                    pandashelper.get_dataframe_by_partitions(
+                        self.cache_folder, ticker, batch, "quotes"))
+                self.init_aggregation(df_trades, df_quotes)
+                batch = []
+                rows = 0
+
+    def get_splitted_dataframes(self, dfs, ticker):
+        """
+        This function splits the trades and quotes of a chunk in front of the
+        first row of the last date within the chunk, so that the rows of this
+        date can be completed by the next chunk. The index of the dataframes
+        must contain the row numbers in the source file. The return value is
+        a tuple of the dataframes in front of the split and the tails.
+        """
+        last = max(dfs, key=lambda df: df.index[-1] if len(df) else -1)
+        if last.empty:
+            return dfs, dfs
+        row = self.rows[ticker][str(last["Date[G]"].iloc[-1])]
+        splits = [df.index.searchsorted(row) for df in dfs]
+        return ([df.iloc[:k] for df, k in zip(dfs, splits)],
+                [df.iloc[k:] for df, k in zip(dfs, splits)])
 
     def init_aggregations(self):
         """
@@ -147,33 +322,276 @@ class PreProcessor:
 
         The iterating loop cuts the dataframe only between rows of different
         dates (days) so that the aggregation function always gets all rows of
-        one day at once.
+        one day at once. The chunks of all files are read in one pipeline, so
+        that with the prefetch_depth setting of the pandashelper module the
+        reading of the next chunk (and of the next file) overlaps with the
+        aggregation of the current chunk.
         """
         print("Getting aggregations per ticker and day ...")
-        for i in range(len(self.rows)):
-            ticker = list(self.rows)[i]
+        instrumentation.start_run()
+        tickers = list(self.rows)
+        groups = prefetch.get_prefetched_groups(
+            [(ticker, self.get_chunks_of_ticker(ticker)) for ticker in tickers
+             if ticker not in self.exluded_tickers],
+            pandashelper.prefetch_depth)
+        try:
+            for i in range(len(tickers)):
+                chunks = None
+                if tickers[i] not in self.exluded_tickers:
+                    chunks = next(groups)[1]
+                self.init_aggregations_of_ticker(tickers[i], i, len(tickers),
+                                                 chunks)
+        finally:
+            groups.close()
+        if self.verbose:
+            instrumentation.print_summary()
+
+    def get_chunks_of_ticker(self, ticker):
+        """
+        Generator that yields the chunks of the source file of a ticker as
+        tuples of trades and quotes. The time of the decompression and the
+        parsing of each chunk is recorded and the file is closed as soon as
+        the generator is exhausted or closed.
+        """
+        reader = instrumentation.open_source(self.get_source_by_ticker(ticker))
+        try:
+            yield from instrumentation.get_instrumented_chunks(
+                pandashelper.get_dataframes_by_chunks(reader), reader,
+                venue=self.marketplace, ticker=ticker)
+        finally:
+            reader.close()
+
+    def init_aggregations_of_ticker(self, ticker, i=0, count_files=1,
+                                    chunks=None):
+        """
+        Calculate the aggregations of all days of one ticker and append them
+        to the existing aggregations. The counter i of the file and the count
+        of files are used for the progress messages only. The chunks of the
+        source file may be given as iterator (e.g. if they are read ahead),
+        otherwise they are read ahead with the prefetch_depth setting of the
+        pandashelper module.
+        """
+        # skip tickers that has been excluded from the sample
+        if ticker in self.exluded_tickers:
+            print("Ticker " + ticker + " is skipped.")
+            return
+        if chunks is None:
+            chunks = prefetch.get_prefetched(
+                self.get_chunks_of_ticker(ticker),
+                pandashelper.prefetch_depth)
+        count_rows = self.rows[ticker][list(self.rows[ticker].keys())[-1]]
+        max_iter = math.ceil(count_rows /
+                             pandashelper.rows_limit_per_iter)
+        instrumentation.set_context(venue=self.marketplace, ticker=ticker)
+        j = 0
+        tails = [pandashelper.pd.DataFrame(), pandashelper.pd.DataFrame()]
+        try:
+            with instrumentation.profile(
+                    ticker, self.marketplace + " Profile " + ticker + ".txt"):
+                for dfs in chunks:
+                    if self.verbose:
+                        print("Processing iteration " + str(j + 1) + " of " +
+                              str(max_iter) + " in file " + str(i + 1) +
+                              " of " + str(count_files) + " ...")
+                    instrumentation.set_context(chunk=j)
+                    with instrumentation.stage("split") as record:
+                        dfs = [pandashelper.concat_dfs(tail, df)
+                               for tail, df in zip(tails, dfs)]
+                        if j < max_iter - 1:
+                            dfs, tails = self.get_splitted_dataframes(
+                                dfs, ticker)
+                        record["rows_out"] = len(dfs[0]) + len(dfs[1])
+                    df_trades, df_quotes = self.get_filtered_streams(*dfs)
+                    self.init_aggregation(df_trades, df_quotes)
+                    j += 1
+        finally:
+            instrumentation.set_context(chunk=None)
+
+    def init_aggregations_streaming(self):
+        """
+        This method calculates the aggregations with mergeable accumulators
+        per day instead of aggregating whole days at once. Each chunk of the
+        raw data is passed to the accumulators as it is, so that no row
+        numbers per day are required and a day may be spread over several
+        chunks. The aggregation of each day is appended as soon as the day is
+        closed.
+
+        The measures of the order flow are accumulated with the quotes that
+        may still prevail for the trades of the next chunk. The distributions
+        and the intraday bars are calculated from the buffered rows of each
+        day as soon as the day is closed, so the results are the same as in
+        init_aggregations().
+        """
+        print("Getting aggregations per ticker and day (streaming) ...")
+        tickers = [file.split('_')[1] for file in self.files]
+        results_trades = [self.aggregations_trades]
+        results_quotes = [self.aggregations_quotes]
+        for i in range(len(tickers)):
+            ticker = tickers[i]
             # skip tickers that has been excluded from the sample
             if ticker in self.exluded_tickers:
                 print("Ticker " + ticker + " is skipped.")
                 continue
             source = self.get_source_by_ticker(ticker)
-            count_rows = self.rows[ticker][list(self.rows[ticker].keys())[-1]]
-            max_iter = math.ceil(count_rows /
-                                 pandashelper.rows_limit_per_iter)
+            trades = accumulators.TradeAccumulator()
+            quotes = accumulators.QuoteAccumulator(
+                pandashelper.sampling_frequency)
+            flows = accumulators.OrderflowAccumulator()
+            buffers = [accumulators.DayBuffer(), accumulators.DayBuffer(
+                quotes.fill_columns)]
+            aggregations, orderflows = [], []
             j = 0
-            df_tail = pandashelper.pd.DataFrame()
-            for df in pandashelper.get_dataframe_by_chunks(source):
-                print("Processing iteration " + str(j + 1) + " of " +
-                      str(max_iter) + " in file " + str(i + 1) + " of " +
-                      str(len(self.rows)) + " ...")
-                df = pandashelper.concat_dfs(df_tail, df)
-                if j < max_iter - 1:
-                    last_tail_length = len(df_tail)
-                    df, df_tail = self.get_splitted_dataframes(
-                        df, ticker, last_tail_length)
-                df_trades, df_quotes = self.get_filtered_dataframes(df)
-                self.init_aggregation(df_trades, df_quotes)
+            for dfs in pandashelper.get_dataframes_by_chunks(source):
+                if self.verbose:
+                    print("Processing iteration " + str(j + 1) +
+                          " in file " + str(i + 1) + " of " +
+                          str(len(tickers)) + " ...")
+                df_trades, df_quotes = self.get_filtered_streams(*dfs)
+                self.init_closed_days(buffers[0].add(df_trades),
+                                      buffers[1].add(df_quotes)
+                                      if pandashelper.bar_resolutions
+                                      else None)
+                orderflows.append(flows.add(df_trades, df_quotes))
+                aggregations.append(trades.add(df_trades))
+                results_quotes.append(quotes.add(df_quotes))
                 j += 1
+            self.init_closed_days(buffers[0].close(), buffers[1].close()
+                                  if pandashelper.bar_resolutions else None)
+            orderflows.append(flows.close())
+            aggregations.append(trades.close())
+            results_trades.append(pandashelper.add_aggregation_orderflow(
+                pandashelper.pd.concat(aggregations),
+                pandashelper.pd.concat(orderflows)))
+            results_quotes.append(quotes.close())
+        self.aggregations_trades = pandashelper.pd.concat(results_trades)
+        self.aggregations_quotes = pandashelper.pd.concat(results_quotes)
+
+    def init_closed_days(self, df_trades, df_quotes=None):
+        """
+        Function calculates the distributions and, if the quotes are given,
+        the intraday bars of the days that are closed in streaming mode. The
+        dataframes contain all rows of these days.
+        """
+        self.init_distribution(df_trades)
+        if df_quotes is not None and not (df_trades.empty and
+                                          df_quotes.empty):
+            self.init_bars(df_trades, df_quotes)
+
+    def init_aggregations_incremental(self):
+        """
+        This method aggregates only those partitions (source file, ticker and
+        date) that are not recorded in the manifest of the trading venue yet
+        or that changed since then, and merges them into the existing output
+        files. The output files, the row index and the manifest are saved
+        after each file, so that an interrupted run continues with the next
+        file. The row index of each new or changed file is determined again
+        and the fingerprint of each day (the count of rows and a checksum of
+        their bytes) is compared with the manifest, so that only new or
+        changed days are read. The days that a changed file doesn't contain
+        anymore are dropped (and the file is aggregated again completely),
+        and the output is sorted like in a full run.
+        """
+        print("Getting aggregations of new or changed partitions ...")
+        target = self.marketplace + " Manifest.json"
+        status = manifest.load_manifest(target)
+        if self.has_aggregations() and status["files"]:
+            self.load_aggregations()
+        # the records of the unchanged files are kept, the index is copied
+        # into memory because the file is replaced after each file
+        if os.path.isfile(self.marketplace + ".npy"):
+            self.row_index = rowindex.np.array(
+                rowindex.load_index(self.marketplace + ".npy"))
+            self.rows = rowindex.get_rows_from_index(self.row_index)
+        for i in range(len(self.files)):
+            file = self.files[i]
+            source = self.input_folder + file
+            ticker = file.split('_')[1]
+            if ticker in self.exluded_tickers or \
+                    manifest.is_file_unchanged(status, file, source):
+                continue
+            # the row numbers of a new or changed file are determined again
+            records = rowindex.get_date_index(source, ticker)
+            self.row_index = rowindex.np.concatenate((self.row_index[
+                self.row_index["ticker"] != ticker.encode()], records))
+            self.rows[ticker] = rowindex.get_rows_from_index(
+                records).get(ticker, {})
+            dates = manifest.get_date_fingerprints(source, records)
+            changed = manifest.get_changed_dates(status, file, dates)
+            removed = manifest.get_removed_dates(status, file, dates)
+            # the quotes of a day are filled up with the last quotes of the
+            # day in front of it, so if a day was removed all days of the
+            # file are aggregated again like in a full run
+            if removed:
+                changed = list(dates)
+            print("Processing " + str(len(changed)) + " of " +
+                  str(len(dates)) + " days in file " + str(i + 1) + " of " +
+                  str(len(self.files)) + " ...")
+            self.drop_aggregations(ticker, changed + removed)
+            if len(changed) == len(dates):
+                self.init_aggregations_of_ticker(ticker, i, len(self.files))
+            else:
+                following = list(dates)[1:] + [None]
+                for date, date_next in zip(dates, following):
+                    if date in changed:
+                        df_trades, df_quotes = self.get_filtered_dataframes(
+                            self.get_dataframe_per_date(
+                                ticker, date, date_next))
+                        self.init_aggregation(df_trades, df_quotes)
+            manifest.set_file(status, file, source, ticker, dates)
+            self.sort_aggregations()
+            self.save_aggregations()
+            self.save_rows_to_index()
+            manifest.save_manifest(status, target)
+
+    def drop_aggregations(self, ticker, dates):
+        """
+        Drop the aggregations of trades and quotes of the given ticker and
+        dates, e.g. before these days are aggregated again.
+        """
+        for name in ["aggregations_trades", "aggregations_quotes"]:
+            df = getattr(self, name)
+            setattr(self, name, df.loc[~((df["ticker"] == ticker) & (
+                df["date"].astype(str).isin(dates)))])
+        for bars in [self.bars_trades, self.bars_quotes]:
+            for seconds, df in bars.items():
+                bars[seconds] = df.loc[~((df["ticker"] == ticker) & (
+                    df["date"].astype(str).isin(dates)))]
+        for key in [key for key in self.distributions
+                    if key[0] == ticker and key[1] in dates]:
+            del self.distributions[key]
+
+    def sort_aggregations(self):
+        """
+        Sort the aggregations, the intraday bars and the distributions by
+        ticker (in the order of the files) and date like in a full run, e.g.
+        after some days are aggregated again and appended.
+        """
+        tickers = [file.split('_')[1] for file in self.files]
+        self.aggregations_trades = pandashelper.get_sorted_rows(
+            self.aggregations_trades, tickers)
+        self.aggregations_quotes = pandashelper.get_sorted_rows(
+            self.aggregations_quotes, tickers)
+        for bars in [self.bars_trades, self.bars_quotes]:
+            for seconds, df in bars.items():
+                bars[seconds] = pandashelper.get_sorted_rows(df, tickers)
+        keys = list(self.distributions)
+        positions = pandashelper.get_sorted_rows(pandashelper.pd.DataFrame({
+            "ticker": [key[0] for key in keys],
+            "date": [key[1] for key in keys],
+            "position": range(len(keys))}), tickers)["position"]
+        self.distributions = {keys[k]: self.distributions[keys[k]]
+                              for k in positions}
+
+    def init_aggregations_parallel(self, workers=None, memory_limit=None):
+        """
+        This method calculates the same aggregations as init_aggregations()
+        but spreads the tickers across a pool of worker processes. The number
+        of workers defaults to the number of cores, the memory limit (in MB)
+        applies to each worker process. The results are merged in the same
+        order as in the serial method.
+        """
+        print("Getting aggregations per ticker and day in parallel ...")
+        parallel.init_aggregations([self], workers, memory_limit)
 
     def init_aggregation(self, df_trades, df_quotes):
         """
@@ -181,19 +599,115 @@ class PreProcessor:
         It calculates an aggregation and appends it to the existing aggregation
         data structure in this class.
         """
-        # calculating the distribution of the input data is optional. it only
-        # makes sense if input dataframe doesn't contain more than one stock.
-        #self.distribution = self.distribution.add(
-        #    pandashelper.get_distribution(df_trades, 60), fill_value=0)
-        #    #, df_trades["Date[G]"].iloc[0])
-        aggregation_trades = pandashelper.get_new_aggregation_trades(
-            df_trades)
-        aggregation_quotes = pandashelper.get_new_aggregation_quotes(
-            df_quotes)
-        self.aggregations_trades = pandashelper.concat_dfs(
-            self.aggregations_trades, aggregation_trades)
-        self.aggregations_quotes = pandashelper.concat_dfs(
-            self.aggregations_quotes, aggregation_quotes)
+        with instrumentation.stage("distribution", len(df_trades)):
+            self.init_distribution(df_trades)
+        if pandashelper.bar_resolutions:
+            with instrumentation.stage("bars",
+                                       len(df_trades) + len(df_quotes)):
+                self.init_bars(df_trades, df_quotes)
+        # the as-of join of trades and quotes must be done before the
+        # aggregation of quotes changes the dataframe of quotes
+        with instrumentation.stage("orderflow",
+                                   len(df_trades) + len(df_quotes)):
+            aggregation_orderflow = \
+                pandashelper.get_new_aggregation_orderflow(
+                    df_trades, df_quotes)
+        with instrumentation.stage("aggregate_trades",
+                                   len(df_trades)) as record:
+            aggregation_trades = pandashelper.add_aggregation_orderflow(
+                pandashelper.get_new_aggregation_trades(df_trades),
+                aggregation_orderflow)
+            record["rows_out"] = len(aggregation_trades)
+        with instrumentation.stage("aggregate_quotes",
+                                   len(df_quotes)) as record:
+            aggregation_quotes = pandashelper.get_new_aggregation_quotes(
+                df_quotes)
+            record["rows_out"] = len(aggregation_quotes)
+        with instrumentation.stage("concat"):
+            self.aggregations_trades = pandashelper.concat_dfs(
+                self.aggregations_trades, aggregation_trades)
+            self.aggregations_quotes = pandashelper.concat_dfs(
+                self.aggregations_quotes, aggregation_quotes)
+
+    def init_distribution(self, df_trades):
+        """
+        Function calculates the distribution of trades per interval for all
+        window lengths that are defined in the pandashelper module at once.
+        The distributions are kept per ticker and day, because they only make
+        sense for one stock and the days can be replaced by incremental runs.
+        The distribution of one minute intervals is always kept, because it's
+        summed up across all tickers as in former versions.
+        """
+        if df_trades.empty:
+            return
+        ticker = str(df_trades["#RIC"].iloc[0])
+        windows = sorted(set(pandashelper.distribution_windows) | {60})
+        dates, histograms = distribution.get_daily_histograms(
+            df_trades["Date[G]"].values, df_trades["Time[G]"].values,
+            windows)
+        for k, date in enumerate(dates):
+            for seconds in windows:
+                key = (ticker, str(date), seconds)
+                self.distributions[key] = distribution.add_histograms(
+                    self.distributions.get(key, histograms[seconds][k][:0]),
+                    histograms[seconds][k])
+
+    def init_bars(self, df_trades, df_quotes):
+        """
+        Function calculates the intraday bars of trades and quotes for all
+        resolutions that are defined in the pandashelper module within the
+        trading hours of this class and appends them to the existing bars.
+        It must be called before the aggregation of quotes, because this
+        aggregation changes the dataframe of quotes.
+        """
+        for bars, new_bars in [
+                (self.bars_trades, pandashelper.get_new_bars_trades(
+                    df_trades, self.bod, self.eod)),
+                (self.bars_quotes, pandashelper.get_new_bars_quotes(
+                    df_quotes, self.bod, self.eod))]:
+            for seconds, df in new_bars.items():
+                bars[seconds] = pandashelper.concat_dfs(bars[seconds], df) \
+                    if seconds in bars else df
+
+    def get_bars_file(self, kind, seconds):
+        """
+        Returns the name of the output file of the bars of trades or quotes
+        (kind) with the given resolution in seconds.
+        """
+        return self.marketplace + " " + kind + " " + str(seconds) + "s.csv"
+
+    def get_distribution(self):
+        """
+        Returns the distribution of one minute intervals across all tickers
+        and days as pandas series like get_distribution() of the pandashelper
+        module (empty if there aren't any distributions).
+        """
+        histograms = [histogram for (ticker, date, seconds), histogram in
+                      self.distributions.items() if seconds == 60]
+        if not histograms:
+            return pandashelper.pd.Series([], dtype=pandashelper.np.int64)
+        total = histograms[0][:0]
+        for histogram in histograms:
+            total = distribution.add_histograms(total, histogram)
+        return pandashelper.get_distribution_by_histogram(total)
+
+    def get_distributions(self):
+        """
+        Returns the distributions of all tickers, days and window lengths as
+        one dataframe in long format with the columns ticker, date, window,
+        events and frequency. Only the observed numbers of events are
+        included.
+        """
+        frames = []
+        for (ticker, date, seconds), histogram in \
+                self.distributions.items():
+            events = pandashelper.np.flatnonzero(histogram)
+            frames.append(pandashelper.pd.DataFrame({
+                "ticker": ticker, "date": date, "window": seconds,
+                "events": events, "frequency": histogram[events]}))
+        if not frames:
+            return pandashelper.get_empty_distributions()
+        return pandashelper.pd.concat(frames, ignore_index=True)
 
     def save_rows_to_json(self):
         """
@@ -205,39 +719,136 @@ class PreProcessor:
         f.write(j)
         f.close()
 
+    def save_rows_to_index(self):
+        """
+        Save the index of rows per ticker and day in a binary file for later
+        iterations. The name of the ouput file is given by the trading venue.
+        """
+        rowindex.save_index(self.row_index, self.marketplace + ".npy")
+
     def load_rows_per_date(self):
         """
-        Load row numbers from json file into a dictionary. The file name is
-        derived from the trading venue that is derived again from the input
-        folder and the additional filter.
+        Load row numbers from the binary index file (or from the json file of
+        former versions if there is no index file) into a dictionary. The file
+        name is derived from the trading venue that is derived again from the
+        input folder and the additional filter.
         """
+        if os.path.isfile(self.marketplace + ".npy"):
+            self.row_index = rowindex.load_index(self.marketplace + ".npy")
+            self.rows = rowindex.get_rows_from_index(self.row_index)
+            return
         f = open(self.marketplace + ".json")
         self.rows = json.load(f)
         f.close()
 
-    def load_aggregations(self):
+    def has_aggregations(self):
+        """
+        Returns True if there are saved aggregations of trades and quotes of
+        this trading venue in the output format of the pandashelper module.
+        """
+        if pandashelper.output_format == "parquet":
+            return all(parquetstore.has_partitions(
+                self.parquet_folder, kind, self.marketplace)
+                       for kind in ["Trades", "Quotes"])
+        return os.path.isfile(self.marketplace + " Trades.csv") and \
+            os.path.isfile(self.marketplace + " Quotes.csv")
+
+    def load_aggregations(self, tickers=None, first_date=None,
+                          last_date=None):
         """
         An aggregation of trades and quotes that is already done can be
         loaded from file to continue processing tasks within this class.
+        The aggregations can be restricted to a list of tickers and a range
+        of dates (both inclusive, e.g. "01-JAN-2018"). In the parquet output
+        format only the partitions of these tickers and months are read.
+        """
+        aggregations = []
+        for kind in ["Trades", "Quotes"]:
+            if pandashelper.output_format == "parquet":
+                df = parquetstore.read_partitions(
+                    self.parquet_folder, kind, self.marketplace, tickers,
+                    first_date, last_date)
+            else:
+                df = pandashelper.pd.read_csv(
+                    self.marketplace + " " + kind + ".csv", header=0)
+            aggregations.append(pandashelper.get_selected_rows(
+                df, tickers, first_date, last_date))
+        self.aggregations_trades, self.aggregations_quotes = aggregations
+        for kind, bars in [("Trades", self.bars_trades),
+                           ("Quotes", self.bars_quotes)]:
+            for seconds in pandashelper.bar_resolutions:
+                if os.path.isfile(self.get_bars_file(kind, seconds)):
+                    bars[seconds] = pandashelper.pd.read_csv(
+                        self.get_bars_file(kind, seconds), header=0)
+        if os.path.isfile(self.marketplace + " Verteilungen.csv"):
+            self.distributions = pandashelper.get_histograms_by_distributions(
+                pandashelper.get_selected_rows(pandashelper.pd.read_csv(
+                    self.marketplace + " Verteilungen.csv", header=0),
+                    tickers, first_date, last_date))
+
+    def save_aggregations(self):
+        """
+        Save the aggregations in the output format of the pandashelper module
+        (csv files or partitioned parquet files).
         """
-        self.aggregations_trades = pandashelper.pd.read_csv(
-            self.marketplace + " Trades.csv", header=0)
-        self.aggregations_quotes = pandashelper.pd.read_csv(
-            self.marketplace + " Quotes.csv", header=0)
+        if pandashelper.output_format == "parquet":
+            self.save_aggregations_to_parquet()
+        else:
+            self.save_aggregations_to_csv()
+
+    def save_aggregations_to_parquet(self):
+        """
+        Save the aggregations of trades and quotes as parquet files that are
+        partitioned by trading venue, ticker and month in the parquet folder.
+        Only partitions that are new or changed since the last call are
+        written. The distributions and the intraday bars are saved as csv
+        files like in save_aggregations_to_csv().
+        """
+        parquetstore.write_partitions(self.aggregations_trades,
+                                      self.parquet_folder, "Trades",
+                                      self.marketplace)
+        parquetstore.write_partitions(self.aggregations_quotes,
+                                      self.parquet_folder, "Quotes",
+                                      self.marketplace)
+        self.save_distributions_and_bars_to_csv()
 
     def save_aggregations_to_csv(self):
         """
         Save the aggregations of trades and quotes separately with the
         trading venue as file name. If there are data about the distribution
-        of the data, it will be saved as well.
+        of the data, it will be saved as well (the distribution of one minute
+        intervals across all tickers and the distributions per ticker, day
+        and window length in long format). The intraday bars are saved in one
+        file per kind and resolution, e.g. "DAX Xetra Trades 300s.csv".
         """
+        # write temporary files first to keep the former files in case of
+        # an interruption
         self.aggregations_trades.to_csv(
-            self.marketplace + " Trades.csv", index=False)
+            self.marketplace + " Trades.csv.tmp", index=False)
         self.aggregations_quotes.to_csv(
-            self.marketplace + " Quotes.csv", index=False)
-        if not self.distribution.empty:
-            self.distribution.to_csv(
+            self.marketplace + " Quotes.csv.tmp", index=False)
+        os.replace(self.marketplace + " Trades.csv.tmp",
+                   self.marketplace + " Trades.csv")
+        os.replace(self.marketplace + " Quotes.csv.tmp",
+                   self.marketplace + " Quotes.csv")
+        self.save_distributions_and_bars_to_csv()
+
+    def save_distributions_and_bars_to_csv(self):
+        """
+        Save the distributions and the intraday bars (if there are any) with
+        the trading venue as file name.
+        """
+        if self.distributions:
+            self.get_distribution().to_csv(
                 self.marketplace + " Verteilung.csv")
+            self.get_distributions().to_csv(
+                self.marketplace + " Verteilungen.csv", index=False)
+        for kind, bars in [("Trades", self.bars_trades),
+                           ("Quotes", self.bars_quotes)]:
+            for seconds, df in bars.items():
+                target = self.get_bars_file(kind, seconds)
+                df.to_csv(target + ".tmp", index=False)
+                os.replace(target + ".tmp", target)
 
     def get_marketplace(self):
         """
@@ -0,0 +1,386 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The workflow module provides a small workflow engine over the stages of the
+preprocessing and the analyses, which are otherwise run by commenting lines
+of the program module in and out:
+
+    index -> (cache) -> aggregation -> container -> regression, panel
+
+The index, the columnar cache and the aggregation are stages of each trading
+venue, the container and the regressions are stages of all venues. Each
+stage is keyed by a hash of its inputs (the size and the time of
+modification of the raw files or the keys of the stages it depends on), its
+parameters (e.g. the rows per iteration, the trading session, the screening
+rule, the excluded tickers and the sampling frequency) and the version of
+its code. The keys of all stages that have been run are recorded in a state
+file, so a stage is run only if its key changed or its output is missing,
+and every stage that depends on it is invalidated by the changed key.
+
+The workflow can be run from the command line, e.g. everything needed for
+the aggregations of one venue or for the regressions of all venues:
+
+    python program.py "DAX Xetra" --data <folder of the venue folders>
+    python program.py all --data <folder> --target regression --dry-run
+
+Required packages are the preprocessing and container modules and the
+pandashelper, regression and panel modules that are also included in this
+project.
+"""
+
+import os
+import json
+import hashlib
+import argparse
+import Util.pandashelper as pandashelper
+import Util.regression as regression
+import Util.panel as panel
+import Common.preprocessing as preprocessing
+import Common.container as container
+import Common.manifest as manifest
+
+# define global settings for the workflow
+data_folder = "." # folder that contains the folders of the trading venues
+venues = [("DAX Xetra", ""), # folder and filter of the raw files per venue
+          ("DAX MTF", ".BS_"),
+          ("DAX MTF", ".TQ_"),
+          ("DAX MTF", ".CHI_"),
+          ("CAC Paris", ""),
+          ("CAC MTF", ".BS_"),
+          ("CAC MTF", ".TQ_"),
+          ("CAC MTF", ".CHI_")]
+regression_folder = "Regression/" # output folder of the coefficients
+state_file = "Workflow.json" # keys of all stages that have been run
+# versions of the code of each stage, increase whenever the results of a
+# stage change (the aggregation and the container have versions of their own
+# that are part of their keys as well)
+stage_versions = {"index": 1, "cache": 1, "aggregation": 1, "container": 1,
+                  "regression": 1, "panel": 1}
+venue_stages = ["index", "cache", "aggregation"]
+
+
+def get_marketplace_name(folder, additional_filter):
+    """
+    Returns the name of a trading venue like the preprocessor class derives
+    it from the input folder and the additional filter.
+    """
+    return folder + ("" if additional_filter == "" else (
+        " " + additional_filter.replace("_", "").replace(".", "")))
+
+
+def load_state(target):
+    """
+    Load the keys of all stages that have been run from a json file (an
+    empty state if the file doesn't exist).
+    """
+    if not os.path.isfile(target):
+        return {}
+    f = open(target)
+    state = json.load(f)
+    f.close()
+    return state
+
+
+def save_state(state, target):
+    """
+    Save the keys of all stages that have been run in a json file. The file
+    is written under a temporary name first and replaced afterwards.
+    """
+    f = open(target + ".tmp", "w")
+    f.write(json.dumps(state, indent=1, sort_keys=True))
+    f.close()
+    os.replace(target + ".tmp", target)
+
+
+def get_hash(content):
+    """
+    Returns the sha1 hash of a dictionary that can be converted to json.
+    """
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).
+                        encode("utf-8")).hexdigest()
+
+
+class Workflow:
+    """
+    The Workflow class resolves the stages that are needed for a target
+    stage of the given trading venues (names like "DAX MTF BS", all venues of
+    the venues setting with a folder in the data folder if None) and runs
+    those stages whose key changed since their last run. With the columnar
+    cache the aggregation is computed from the cache instead of the raw
+    files.
+    """
+    def __init__(self, folder=None, names=None, use_cache=False):
+
+        self.folder = data_folder if folder is None else folder
+        self.folder = self.folder if self.folder[-1:] == "/" else \
+            self.folder + "/"
+        self.venues = {get_marketplace_name(venue, additional_filter):
+                       (venue, additional_filter)
+                       for venue, additional_filter in venues}
+        # without names all venues with a folder in the data folder are run
+        self.names = [name for name, (venue, additional_filter) in
+                      self.venues.items() if os.path.isdir(
+                          self.folder + venue)] if names is None else names
+        for name in self.names:
+            if name not in self.venues:
+                raise ValueError("Unknown trading venue: " + str(name))
+        self.use_cache = use_cache
+        self.workers = 0
+        self.force = []
+        self.dry_run = False
+        self.state = load_state(state_file)
+        self.preprocessors = {}
+        self.keys = {}
+        self.builder = None
+
+    def get_preprocessor(self, name):
+        """
+        Returns the preprocessor class of a trading venue (instantiated once).
+        """
+        if name not in self.preprocessors:
+            venue, additional_filter = self.venues[name]
+            pp = preprocessing.PreProcessor(self.folder + venue,
+                                            additional_filter)
+            self.preprocessors[name] = pp
+        return self.preprocessors[name]
+
+    def get_builder(self):
+        """
+        Returns the builder of the panel of the aggregations of all venues.
+        """
+        if self.builder is None:
+            self.builder = container.ContainerBuilder()
+            self.builder.verbose = False
+        return self.builder
+
+    def get_dependencies(self, stage, name):
+        """
+        Returns the stages (tuples of stage and venue) that the given stage
+        depends on directly.
+        """
+        if stage in ["index", "cache"]:
+            return []
+        if stage == "aggregation":
+            return [("cache" if self.use_cache else "index", name)]
+        if stage == "container":
+            return [("aggregation", venue) for venue in self.names]
+        return [("container", None)]
+
+    def get_parameters(self, stage, name):
+        """
+        Returns the inputs and parameters of a stage that are part of its key
+        besides the keys of its dependencies.
+        """
+        if stage in ["index", "cache"]:
+            pp = self.get_preprocessor(name)
+            return {"files": {file: manifest.get_file_state(
+                pp.input_folder + file) for file in sorted(pp.files)}}
+        if stage == "aggregation":
+            pp = self.get_preprocessor(name)
+            return {"settings": manifest.get_settings(),
+                    "rows_limit_per_iter": pandashelper.rows_limit_per_iter,
+                    "output_format": pandashelper.output_format,
+                    "bod": pp.bod, "eod": pp.eod, "calendar": pp.calendar,
+                    "trade_rule": pp.trade_rule,
+                    "excluded_tickers": sorted(pp.exluded_tickers)}
+        if stage == "container":
+            # the key of the builder covers the aggregations of all venues
+            # in the folder (including venues that are not run here) and the
+            # settings of the container module
+            return {"sources": self.get_builder().get_key()}
+        if stage == "regression":
+            return {"models": regression.models}
+        return {"models": regression.models, "effect": panel.effect,
+                "cluster": panel.cluster}
+
+    def get_key(self, stage, name=None):
+        """
+        Returns the key of a stage, i.e. the hash of its version, its inputs
+        and parameters and the keys of all stages it depends on.
+        """
+        if (stage, name) not in self.keys:
+            self.keys[(stage, name)] = get_hash({
+                "stage": stage, "version": stage_versions[stage],
+                "parameters": self.get_parameters(stage, name),
+                "dependencies": [self.get_key(*dependency) for dependency in
+                                 self.get_dependencies(stage, name)]})
+        return self.keys[(stage, name)]
+
+    def get_stages(self, target):
+        """
+        Returns all stages (tuples of stage and venue) that are needed for
+        the target stage in the order in which they must be run.
+        """
+        stages = []
+
+        def add_stage(stage, name):
+            for dependency in self.get_dependencies(stage, name):
+                add_stage(*dependency)
+            if (stage, name) not in stages:
+                stages.append((stage, name))
+
+        if target in venue_stages:
+            for name in self.names:
+                add_stage(target, name)
+        else:
+            add_stage(target, None)
+        return stages
+
+    def get_state_name(self, stage, name):
+        """
+        Returns the name of a stage in the state file.
+        """
+        return stage if name is None else stage + "/" + name
+
+    def has_output(self, stage, name):
+        """
+        Returns True if the output of a stage exists.
+        """
+        if stage == "index":
+            return os.path.isfile(self.get_preprocessor(name).marketplace +
+                                  ".npy")
+        if stage == "cache":
+            return len(pandashelper.columnstore.get_tickers(
+                self.get_preprocessor(name).cache_folder)) > 0
+        if stage == "aggregation":
+            return self.get_preprocessor(name).has_aggregations()
+        if stage == "container":
+            return os.path.isfile(self.get_builder().get_container_file())
+        return os.path.isfile(self.get_output_file(stage))
+
+    def get_output_file(self, stage):
+        """
+        Gives the path of the coefficients of a regression stage.
+        """
+        return regression_folder + ("coefficient.csv" if stage ==
+                                    "regression" else
+                                    "coefficient_panel.csv")
+
+    def is_valid(self, stage, name):
+        """
+        Returns True if a stage has been run with its current key and its
+        output still exists.
+        """
+        return stage not in self.force and self.state.get(
+            self.get_state_name(stage, name)) == self.get_key(stage, name) \
+            and self.has_output(stage, name)
+
+    def run_stage(self, stage, name):
+        """
+        Run a single stage and save its output.
+        """
+        if stage == "index":
+            pp = self.get_preprocessor(name)
+            pp.init_rows_per_date()
+            pp.save_rows_to_index()
+        elif stage == "cache":
+            self.get_preprocessor(name).init_cache()
+        elif stage == "aggregation":
+            pp = self.get_preprocessor(name)
+            # the aggregations of a former run of this object are dropped
+            pp.aggregations_trades = \
+                pandashelper.get_empty_aggregation_trades()
+            pp.aggregations_quotes = \
+                pandashelper.get_empty_aggregation_quotes()
+            if self.use_cache:
+                pp.init_aggregations_from_cache()
+            else:
+                pp.load_rows_per_date()
+                if self.workers:
+                    pp.init_aggregations_parallel(self.workers)
+                else:
+                    pp.init_aggregations()
+            pp.save_aggregations()
+        elif stage == "container":
+            builder = self.get_builder()
+            builder.init_container()
+            builder.save_container()
+        else:
+            df = self.get_builder().get_container()
+            os.makedirs(regression_folder, exist_ok=True)
+            if stage == "regression":
+                coefficients = regression.get_coefficients(df)
+            else:
+                coefficients = panel.get_panel_coefficients(
+                    df, workers=self.workers)
+            coefficients.to_csv(self.get_output_file(stage), index=False)
+
+    def run(self, target="aggregation"):
+        """
+        Run all stages that are needed for the target stage and whose key
+        changed since their last run (or that are forced). The state file is
+        saved after each stage, so an interrupted run continues with the
+        stage that has been interrupted. Returns the stages that have been
+        run (or would be run in a dry run).
+        """
+        if target not in stage_versions:
+            raise ValueError("Unknown stage: " + str(target))
+        run = []
+        for stage, name in self.get_stages(target):
+            label = self.get_state_name(stage, name)
+            if self.is_valid(stage, name):
+                print("Stage " + label + " is up to date.")
+                continue
+            run.append((stage, name))
+            if self.dry_run:
+                print("Stage " + label + " would be run.")
+                continue
+            print("Running stage " + label + " ...")
+            self.run_stage(stage, name)
+            self.state[label] = self.get_key(stage, name)
+            save_state(self.state, state_file)
+        return run
+
+
+def get_parser():
+    """
+    Returns the parser of the command line arguments of the workflow.
+    """
+    parser = argparse.ArgumentParser(
+        description="Run all stages that are needed for the target stage " +
+        "of the given trading venues and whose inputs, parameters or code " +
+        "changed since their last run.")
+    parser.add_argument("venues", nargs="+", help="names of the trading " +
+                        "venues (e.g. \"DAX Xetra\" or \"DAX MTF BS\") or " +
+                        "all")
+    parser.add_argument("--data", default=None, help="folder that " +
+                        "contains the folders of the trading venues")
+    parser.add_argument("--target", default="aggregation",
+                        choices=list(stage_versions), help="last stage " +
+                        "to run (default: aggregation)")
+    parser.add_argument("--use-cache", action="store_true", help="compute " +
+                        "the aggregations from the columnar cache")
+    parser.add_argument("--force", nargs="*", default=[],
+                        choices=list(stage_versions), help="stages that " +
+                        "are run even if they are up to date")
+    parser.add_argument("--workers", type=int, default=0, help="number of " +
+                        "worker processes (0 for the serial mode)")
+    parser.add_argument("--backend", default=None,
+                        choices=["pandas", "arrow"], help="csv backend")
+    parser.add_argument("--output-format", default=None,
+                        choices=["csv", "parquet"], help="output format " +
+                        "of the aggregations")
+    parser.add_argument("--dry-run", action="store_true", help="only list " +
+                        "the stages that would be run")
+    return parser
+
+
+def main(args=None):
+    """
+    Run the workflow with the given command line arguments.
+    """
+    parser = get_parser()
+    args = parser.parse_args(args)
+    if args.backend:
+        pandashelper.csv_backend = args.backend
+    if args.output_format:
+        pandashelper.output_format = args.output_format
+    names = None if args.venues == ["all"] else args.venues
+    for name in names or []:
+        if name not in [get_marketplace_name(*venue) for venue in venues]:
+            parser.error("unknown trading venue: " + name)
+    engine = Workflow(args.data, names, args.use_cache)
+    engine.workers = args.workers
+    engine.force = args.force
+    engine.dry_run = args.dry_run
+    return engine.run(args.target)
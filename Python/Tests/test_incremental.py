@@ -0,0 +1,192 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tests of the incremental aggregation of the preprocessor class: a venue is
+aggregated incrementally, a further raw file is delivered (or a raw file is
+revised, or a setting changed) and the venue is aggregated incrementally
+again. The row index and the output files (including the order of their
+rows) must equal those of a full run over all raw files.
+
+The tests are run with the synthetic raw files of the synthetic module
+(python -m pytest from the Python folder).
+"""
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+import warnings
+import pandas as pd
+import Common.preprocessing as preprocessing
+import Util.pandashelper as pandashelper
+import Common.manifest as manifest
+import Util.rowindex as rowindex
+import Util.synthetic as synthetic
+
+# define global settings of the synthetic raw files
+sizes = {"days": 3, "trades": 200, "quotes": 2000}
+
+
+def get_preprocessor(input_folder):
+    """
+    Returns a preprocessor class of the synthetic venue without output.
+    """
+    pp = preprocessing.PreProcessor(input_folder)
+    pp.verbose = False
+    return pp
+
+
+def revise_volumes(source, date):
+    """
+    Function sets the volume of all trades of the given date in a raw file
+    to 1, so that the day changes but keeps its count of rows.
+    """
+    f = gzip.open(source, "rt")
+    lines = f.readlines()
+    f.close()
+    for k, line in enumerate(lines):
+        fields = line.split(",")
+        if fields[1] == date and fields[4] == "Trade":
+            fields[7] = "1"
+            lines[k] = ",".join(fields)
+    f = gzip.open(source, "wt")
+    f.writelines(lines)
+    f.close()
+
+
+def remove_date(source, date):
+    """
+    Function removes all rows of the given date from a raw file, like a
+    revised delivery without this day.
+    """
+    f = gzip.open(source, "rt")
+    lines = f.readlines()
+    f.close()
+    f = gzip.open(source, "wt")
+    f.writelines([line for line in lines if line.split(",")[1] != date])
+    f.close()
+
+
+def read_output(folder, name):
+    """
+    Returns an output file of the synthetic venue in the order of its rows.
+    """
+    return pd.read_csv(os.path.join(folder, "DAX Xetra " + name + ".csv"))
+
+
+class IncrementalTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter("ignore")
+        self.cwd = os.getcwd()
+        self.folder = tempfile.mkdtemp()
+        self.input_folder = os.path.join(self.folder, "DAX Xetra")
+        synthetic.write_sources(self.input_folder, tickers=2, **sizes)
+        self.windows = pandashelper.distribution_windows
+
+    def tearDown(self):
+        pandashelper.distribution_windows = self.windows
+        os.chdir(self.cwd)
+        shutil.rmtree(self.folder)
+
+    def run_incremental(self):
+        """
+        Aggregate the synthetic venue incrementally in the folder of the
+        incremental runs.
+        """
+        os.makedirs(os.path.join(self.folder, "incremental"), exist_ok=True)
+        os.chdir(os.path.join(self.folder, "incremental"))
+        get_preprocessor(self.input_folder).init_aggregations_incremental()
+
+    def run_full(self):
+        """
+        Aggregate the synthetic venue completely in the folder of the full
+        run.
+        """
+        os.makedirs(os.path.join(self.folder, "full"), exist_ok=True)
+        os.chdir(os.path.join(self.folder, "full"))
+        pp = get_preprocessor(self.input_folder)
+        pp.init_rows_per_date()
+        pp.save_rows_to_index()
+        pp.init_aggregations()
+        pp.save_aggregations()
+
+    def test_new_file(self):
+        self.run_incremental()
+        synthetic.write_sources(self.input_folder, tickers=3, **sizes)
+        self.run_incremental()
+        self.run_full()
+
+        # the index keeps the records of the files of the first run
+        index = rowindex.load_index(os.path.join(
+            self.folder, "incremental", "DAX Xetra.npy"))
+        full = rowindex.load_index(os.path.join(
+            self.folder, "full", "DAX Xetra.npy"))
+        self.assertEqual(sorted(set(index["ticker"])),
+                         [ticker.encode() for ticker in
+                          synthetic.get_tickers(3)])
+        self.assertEqual(sorted(index.tolist()), sorted(full.tolist()))
+        pp = get_preprocessor(self.input_folder)
+        os.chdir(os.path.join(self.folder, "incremental"))
+        pp.load_rows_per_date()
+        self.assertEqual(sorted(pp.rows), synthetic.get_tickers(3))
+
+        for name in ["Trades", "Quotes", "Verteilung", "Verteilungen"]:
+            pd.testing.assert_frame_equal(
+                read_output(os.path.join(self.folder, "incremental"), name),
+                read_output(os.path.join(self.folder, "full"), name))
+
+    def test_revised_day(self):
+        self.run_incremental()
+        file = synthetic.get_file_name(synthetic.get_tickers(2)[1])
+        source = os.path.join(self.input_folder, file)
+        date = synthetic.get_date_string(synthetic.get_trading_days(2)[1])
+        revise_volumes(source, date)
+
+        # only the revised day is aggregated again
+        status = manifest.load_manifest(os.path.join(
+            self.folder, "incremental", "DAX Xetra Manifest.json"))
+        self.assertEqual(manifest.get_changed_dates(
+            status, file, manifest.get_date_fingerprints(
+                source, rowindex.get_date_index(source))), [date])
+
+        self.run_incremental()
+        self.run_full()
+        for name in ["Trades", "Quotes", "Verteilung", "Verteilungen"]:
+            pd.testing.assert_frame_equal(
+                read_output(os.path.join(self.folder, "incremental"), name),
+                read_output(os.path.join(self.folder, "full"), name))
+
+    def test_removed_day(self):
+        self.run_incremental()
+        file = synthetic.get_file_name(synthetic.get_tickers(2)[0])
+        date = synthetic.get_date_string(synthetic.get_trading_days(3)[1])
+        remove_date(os.path.join(self.input_folder, file), date)
+
+        # the removed day is dropped from all outputs
+        self.run_incremental()
+        self.run_full()
+        for name in ["Trades", "Quotes", "Verteilung", "Verteilungen"]:
+            pd.testing.assert_frame_equal(
+                read_output(os.path.join(self.folder, "incremental"), name),
+                read_output(os.path.join(self.folder, "full"), name))
+
+    def test_changed_setting(self):
+        self.run_incremental()
+        # a setting that changes the results resets the manifest, so all
+        # days are aggregated again with the new setting
+        pandashelper.distribution_windows = [1, 30]
+        self.run_incremental()
+        self.run_full()
+        distributions = read_output(os.path.join(
+            self.folder, "incremental"), "Verteilungen")
+        self.assertEqual(sorted(set(distributions["window"])), [1, 30, 60])
+        for name in ["Trades", "Quotes", "Verteilungen"]:
+            pd.testing.assert_frame_equal(
+                read_output(os.path.join(self.folder, "incremental"), name),
+                read_output(os.path.join(self.folder, "full"), name))
+
+
+if __name__ == "__main__":
+    unittest.main()
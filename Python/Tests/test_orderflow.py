@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tests of the as-of join of trades and quotes and of the signing of the
+trades with the Lee-Ready algorithm of the orderflow module: quotes with
+the timestamp of a trade, trades in front of the first quote of a day,
+quotes that end at the boundary of a day and the tick test for trades at
+the midpoint.
+
+The tests are run with small hand-made days (python -m pytest from the
+Python folder).
+"""
+
+import unittest
+import numpy as np
+import Util.orderflow as orderflow
+
+
+def get_times(milliseconds):
+    """
+    Returns the given milliseconds since midnight as datetime64[ns] like the
+    times of the raw data.
+    """
+    return np.array(milliseconds, dtype="datetime64[ms]").astype(
+        "datetime64[ns]")
+
+
+def get_quotes(bids, asks):
+    """
+    Returns a dictionary of quote columns with the given bid and ask prices
+    (a null price is a quote without that side) and sizes of 100.
+    """
+    bids = np.array(bids, dtype=np.float64)
+    asks = np.array(asks, dtype=np.float64)
+    return {"bid_price": bids,
+            "bid_size": np.where(np.isnan(bids), np.nan, 100.0),
+            "ask_price": asks,
+            "ask_size": np.where(np.isnan(asks), np.nan, 100.0)}
+
+
+def get_prevailing_quotes(trade_dates, trade_times, quote_dates,
+                          quote_times):
+    """
+    Returns the positions of the prevailing quotes of the given trades and
+    quotes (dates as strings, times in milliseconds).
+    """
+    days = np.unique(np.concatenate((trade_dates, quote_dates)))
+    return orderflow.get_prevailing_quotes(
+        orderflow.get_codes(trade_dates, days),
+        get_times(trade_times).view(np.int64),
+        orderflow.get_codes(quote_dates, days),
+        get_times(quote_times).view(np.int64))
+
+
+class OrderflowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.quote_lag = orderflow.quote_lag
+
+    def tearDown(self):
+        orderflow.quote_lag = self.quote_lag
+
+    def test_same_timestamp(self):
+        # a quote with the timestamp of the trade never prevails
+        dates = np.array(["02-JAN-2018"] * 3)
+        prevailing = get_prevailing_quotes(dates, [1000, 2000, 2001],
+                                           dates[:2], [1000, 2000])
+        np.testing.assert_array_equal(prevailing, [-1, 0, 1])
+
+    def test_quote_lag(self):
+        # the quote must be at least quote_lag milliseconds older
+        orderflow.quote_lag = 5
+        dates = np.array(["02-JAN-2018"] * 3)
+        prevailing = get_prevailing_quotes(dates, [1004, 1005, 1010],
+                                           dates[:2], [1000, 1005])
+        np.testing.assert_array_equal(prevailing, [-1, 0, 1])
+
+    def test_day_boundary(self):
+        # the quotes of the first day end in the evening, the trades of the
+        # second day in front of its first quote have no prevailing quote
+        trade_dates = np.array(["02-JAN-2018", "03-JAN-2018",
+                                "03-JAN-2018"])
+        quote_dates = np.array(["02-JAN-2018", "02-JAN-2018",
+                                "03-JAN-2018"])
+        prevailing = get_prevailing_quotes(
+            trade_dates, [36000000, 32000000, 33000000],
+            quote_dates, [35000000, 70000000, 32500000])
+        np.testing.assert_array_equal(prevailing, [0, -1, 2])
+
+    def test_dates_in_other_order(self):
+        # the days are coded in the order of their strings, which differs
+        # from the order of the dates here
+        trade_dates = np.array(["31-JAN-2018", "01-FEB-2018"])
+        prevailing = get_prevailing_quotes(trade_dates, [2000, 2000],
+                                           trade_dates, [1000, 1000])
+        np.testing.assert_array_equal(prevailing, [0, 1])
+
+    def test_signs(self):
+        # quote rule above and below the midpoint of 10.0, tick test at the
+        # midpoint and no sign in front of the first quote of the day
+        dates = np.array(["02-JAN-2018"] * 6)
+        prices = np.array([9.9, 10.1, 9.9, 10.0, 10.1, 10.0])
+        volumes = np.array([1000, 100, 200, 300, 400, 500])
+        days, columns = orderflow.get_orderflow(
+            dates, get_times([500, 1500, 2500, 3500, 4500, 5500]), prices,
+            volumes, dates[:2], get_times([1000, 4000]),
+            get_quotes([9.9, 9.8], [10.1, 10.2]))
+        # signs: none (no quote), buy, sell, buy (uptick from 9.9), buy
+        # (10.1 above 10.0), sell (downtick from 10.1)
+        np.testing.assert_array_equal(days, ["02-JAN-2018"])
+        self.assertEqual(columns["signed_volume"][0],
+                         100 - 200 + 300 + 400 - 500)
+        self.assertAlmostEqual(columns["order_imbalance"][0],
+                               100.0 / 1500)
+        # relative effective spreads in basis points of the five trades
+        # with a prevailing quote
+        spreads = [2 * 0.1 / 10 * 10000] * 2 + [0, 2 * 0.1 / 10 * 10000, 0]
+        self.assertAlmostEqual(columns["eff_spread"][0], np.mean(spreads))
+
+    def test_first_trade_at_midpoint(self):
+        # without a price change in front of it a trade at the midpoint is
+        # not signed, the tick test doesn't look at the day before
+        trade_dates = np.array(["02-JAN-2018", "03-JAN-2018",
+                                "03-JAN-2018"])
+        days, columns = orderflow.get_orderflow(
+            trade_dates, get_times([2000, 2000, 3000]),
+            np.array([9.0, 10.0, 10.0]), np.array([100, 200, 300]),
+            trade_dates[:2], get_times([1000, 1000]),
+            get_quotes([8.9, 9.9], [9.1, 10.1]))
+        np.testing.assert_array_equal(days, ["02-JAN-2018", "03-JAN-2018"])
+        np.testing.assert_array_equal(columns["signed_volume"], [0, 0])
+        self.assertTrue(np.isnan(columns["order_imbalance"][1]))
+
+    def test_one_sided_quotes(self):
+        # a quote without ask is filled up with the ask before, a quote at
+        # the beginning of a day without ask never prevails
+        dates = np.array(["02-JAN-2018"] * 2)
+        days, columns = orderflow.get_orderflow(
+            dates, get_times([1500, 2500]), np.array([10.1, 10.1]),
+            np.array([100, 100]), np.array(["02-JAN-2018"] * 2),
+            get_times([1000, 2000]), get_quotes([9.9, 10.0], [np.nan, 10.2]))
+        # the first trade has no valid quote, the second trade is at the
+        # midpoint of 10.1 and follows no price change
+        self.assertEqual(columns["signed_volume"][0], 0)
+        self.assertAlmostEqual(columns["eff_spread"][0], 0)
+
+        days, columns = orderflow.get_orderflow(
+            dates, get_times([1500, 2500]), np.array([10.1, 10.1]),
+            np.array([100, 100]), np.array(["02-JAN-2018"] * 2),
+            get_times([1000, 2000]), get_quotes([9.9, 9.8], [10.1, np.nan]))
+        # the second quote keeps the ask of 10.1 (midpoint 9.95)
+        self.assertEqual(columns["signed_volume"][0], 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
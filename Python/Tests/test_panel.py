@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tests of the batched fixed effects panel regressions of the panel module:
+the slopes and standard errors of the within regressions are compared with
+a least squares fit with one dummy variable per entity (and per date for
+twoways effects) of each sample and model, for classical and for
+cluster-robust standard errors.
+
+The tests are run with a random unbalanced container (python -m pytest from
+the Python folder).
+"""
+
+import math
+import unittest
+import numpy as np
+import pandas as pd
+import Util.panel as panel
+import Util.regression as regression
+
+
+def get_container(seed=0):
+    """
+    Returns a random unbalanced container of two samples (index and venue)
+    with effects of the tickers and of the dates.
+    """
+    rng = np.random.RandomState(seed)
+    dates = pd.date_range("2018-01-02", periods=30, freq="B").strftime(
+        "%d-%b-%Y").str.upper()
+    rows = [(index, venue, "T%d.%s" % (k, venue), date)
+            for index, venue in [("DAX", "DE"), ("CAC", "PA")]
+            for k in range(6) for date in dates if rng.uniform() > 0.15]
+    df = pd.DataFrame(rows, columns=["index", "venue", "ticker", "date"])
+    n = len(df)
+    entity = df["ticker"].map(dict(zip(df["ticker"].unique(), rng.normal(
+        0, 1, df["ticker"].nunique())))).values
+    time = df["date"].map(dict(zip(dates, rng.normal(0, 1, len(
+        dates))))).values
+    df["W"] = np.exp(rng.normal(12, 1, n) + entity)
+    log_w = np.log(df["W"].values)
+    for col, slope in [("N.x", 2. / 3), ("N.y", 0.5), ("X", 1. / 3),
+                       ("bid_size", 0.2), ("ask_size", 0.2),
+                       ("rel_spread", -1. / 3)]:
+        df[col] = np.exp(slope * log_w + entity + time +
+                         rng.normal(0, 0.3, n))
+    df["V"] = 100.0
+    df["P"] = 1.0
+    df["bid_price"] = 10.0
+    df["ask_price"] = 10 + np.exp(-0.2 * log_w + rng.normal(0, 0.1, n))
+    # a row without trades is left out of the trade frequency model
+    df.loc[7, "N.x"] = 0
+    return df
+
+
+def get_dummy_regression(sample, model, twoways, cluster=None):
+    """
+    Returns the slope, its standard error and the degrees of freedom of the
+    least squares fit of a model with dummy variables of the entities (and
+    of the dates for twoways effects). The standard error is clustered by
+    the given column (HC0) if any.
+    """
+    x, ys = regression.get_model_variables(sample, 1)
+    valid = np.isfinite(x) & np.isfinite(ys[model])
+    sample, x, y = sample.loc[valid], x[valid], ys[model][valid]
+    columns = [x[:, None], pd.get_dummies(sample["ticker"]).values]
+    if twoways:
+        columns.append(pd.get_dummies(sample["date"]).values[:, 1:])
+    design = np.hstack(columns).astype(np.float64)
+    beta = np.linalg.lstsq(design, y, rcond=None)[0]
+    residuals = y - design.dot(beta)
+    df = len(y) - np.linalg.matrix_rank(design)
+    inverse = np.linalg.pinv(design.T.dot(design))
+    if cluster is None:
+        return beta[0], math.sqrt(residuals.dot(residuals) / df *
+                                  inverse[0, 0]), df
+    codes = pd.factorize(sample[cluster])[0]
+    meat = np.zeros(inverse.shape)
+    for code in np.unique(codes):
+        score = design[codes == code].T.dot(residuals[codes == code])
+        meat += np.outer(score, score)
+    return beta[0], math.sqrt(inverse.dot(meat).dot(inverse)[0, 0]), df
+
+
+class PanelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = (panel.effect, panel.cluster)
+
+    def tearDown(self):
+        panel.effect, panel.cluster = self.settings
+
+    def test_within_regressions(self):
+        container = get_container()
+        for effect in ["individual", "twoways"]:
+            for cluster, column in [(None, None), ("entity", "ticker"),
+                                    ("time", "date")]:
+                panel.effect, panel.cluster = effect, cluster
+                coefficients = panel.get_panel_coefficients(container)
+                self.assertEqual(len(coefficients),
+                                 2 * len(regression.models))
+                for _, row in coefficients.iterrows():
+                    sample = container.loc[
+                        (container["index"] == row["index"]) &
+                        (container["venue"] == row["venue"])]
+                    a, a_se, df = get_dummy_regression(
+                        sample, row["model"], effect == "twoways", column)
+                    self.assertAlmostEqual(row["a"], a, places=8)
+                    self.assertAlmostEqual(row["a_se"], a_se, places=8)
+                    self.assertAlmostEqual(row["p"], float(
+                        regression.get_t_p_values(a / a_se, df)), places=8)
+
+
+if __name__ == "__main__":
+    unittest.main()
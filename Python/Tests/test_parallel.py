@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tests of the parallel aggregation of the parallel module: the aggregations,
+distributions and bars of a synthetic venue that are calculated by worker
+processes must equal those of the serial aggregation, also if the settings
+differ from their defaults and the workers are started by spawning new
+processes like on Windows.
+
+The tests are run with the synthetic raw files of the synthetic module
+(python -m pytest from the Python folder).
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+import contextlib
+import pandas as pd
+import Common.preprocessing as preprocessing
+import Common.parallel as parallel
+import Common.manifest as manifest
+import Util.pandashelper as pandashelper
+import Util.orderflow as orderflow
+import Util.synthetic as synthetic
+
+
+class ParallelTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter("ignore")
+        self.settings = manifest.get_settings()
+        self.start_method = parallel.start_method
+        self.resource = parallel.resource
+        self.folder = tempfile.mkdtemp()
+        self.input_folder = os.path.join(self.folder, "DAX Xetra")
+        synthetic.write_sources(self.input_folder, tickers=3, days=2,
+                                trades=200, quotes=2000)
+
+    def tearDown(self):
+        manifest.set_settings(self.settings)
+        parallel.start_method = self.start_method
+        parallel.resource = self.resource
+        shutil.rmtree(self.folder)
+
+    def get_preprocessor(self):
+        """
+        Returns a preprocessor class of the synthetic venue with the row
+        numbers of all files.
+        """
+        pp = preprocessing.PreProcessor(self.input_folder)
+        pp.verbose = False
+        pp.init_rows_per_date()
+        return pp
+
+    def test_spawned_workers(self):
+        pandashelper.distribution_windows = [1, 30]
+        pandashelper.bar_resolutions = [300]
+        orderflow.quote_lag = 50
+        parallel.start_method = "spawn"
+        serial = self.get_preprocessor()
+        serial.init_aggregations()
+        workers = self.get_preprocessor()
+        parallel.init_aggregations([workers], 2)
+
+        for name in ["aggregations_trades", "aggregations_quotes"]:
+            pd.testing.assert_frame_equal(
+                getattr(workers, name).reset_index(drop=True),
+                getattr(serial, name).reset_index(drop=True))
+        pd.testing.assert_frame_equal(workers.get_distributions(),
+                                      serial.get_distributions())
+        self.assertEqual(sorted(set(workers.get_distributions()["window"])),
+                         [1, 30, 60])
+        pd.testing.assert_frame_equal(workers.bars_trades[300],
+                                      serial.bars_trades[300])
+
+    def test_memory_limit_warning(self):
+        # without the resource module (e.g. on Windows) the memory limit
+        # can't be enforced, which must not pass silently
+        parallel.resource = None
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            parallel.init_aggregations([], 1, memory_limit=512)
+        self.assertIn("Warning: the memory limit", output.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tests of the batched regressions of the regression module: the coefficients
+of all tickers and models are compared with a least squares fit of each
+ticker on its own, and the p-values with the closed forms of the t
+distribution with one and two degrees of freedom.
+
+The tests are run with a random container (python -m pytest from the Python
+folder).
+"""
+
+import unittest
+import numpy as np
+import pandas as pd
+import Util.regression as regression
+
+
+def get_container(tickers=4, days=60, seed=0):
+    """
+    Returns a random container with the columns that are used by the
+    regression module. The days of the tickers are shuffled, so that the
+    rows of a ticker are not contiguous.
+    """
+    rng = np.random.RandomState(seed)
+    n = tickers * days
+    dates = pd.date_range("2018-01-02", periods=days, freq="B")
+    w = np.exp(rng.normal(10, 1, n))
+    df = pd.DataFrame({
+        "ticker": np.repeat(["T%d.DE" % k for k in range(tickers)], days),
+        "date": np.tile(dates.strftime("%d-%b-%Y").str.upper(), tickers),
+        "W": w})
+    for col, slope in [("N.x", 2. / 3), ("N.y", 0.5), ("X", 1. / 3),
+                       ("V", 1.0), ("P", 0.1), ("bid_size", 0.2),
+                       ("ask_size", 0.2), ("rel_spread", -1. / 3)]:
+        df[col] = np.exp(slope * np.log(w) + rng.normal(0, 0.5, n))
+    df["bid_price"] = 50 + rng.uniform(0, 1, n)
+    df["ask_price"] = df["bid_price"] + np.exp(
+        -np.log(w) / 3 + rng.normal(0, 0.5, n))
+    df["index"] = "DAX"
+    df["venue"] = "Xetra"
+    df["market"] = "RM"
+    # rows without trades are left out of the trade frequency model
+    df.loc[[3, 70], "N.x"] = 0
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def get_lstsq(x, y):
+    """
+    Returns the measures of the simple regression y = mu + a * x by a least
+    squares fit of the rows with finite values.
+    """
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+    n = len(x)
+    design = np.column_stack([np.ones(n), x])
+    (mu, a), rss = np.linalg.lstsq(design, y, rcond=None)[:2]
+    tss = ((y - y.mean()) ** 2).sum()
+    return {"n": n, "mu": mu, "a": a, "r_squared": 1 - rss[0] / tss,
+            "r_adjusted": 1 - rss[0] / tss * (n - 1) / (n - 2),
+            "a_se": np.sqrt(rss[0] / (n - 2) / ((x - x.mean()) ** 2).sum())}
+
+
+class RegressionTest(unittest.TestCase):
+
+    def test_coefficients(self):
+        container = get_container()
+        coefficients = regression.get_coefficients(container)
+        self.assertEqual(len(coefficients), 4 * len(regression.models))
+        x, ys = regression.get_model_variables(container)
+        for _, row in coefficients.iterrows():
+            rows = (container["ticker"] == row["symbol"]).values
+            expected = get_lstsq(x[rows], ys[row["model"]][rows])
+            for measure in ["mu", "a", "r_squared", "r_adjusted", "a_se"]:
+                self.assertAlmostEqual(row[measure], expected[measure],
+                                       places=10)
+
+    def test_windows(self):
+        container = get_container()
+        windows = regression.get_rolling_windows(container, 1)
+        self.assertEqual(windows[0], ("01-JAN-2018", "31-JAN-2018"))
+        coefficients = regression.get_coefficients(container, windows)
+        w_star = container["W"].mean()
+
+        # the window of a ticker equals the regression of its rows only
+        for first, last in windows:
+            days = pd.to_datetime(container["date"], format="%d-%b-%Y")
+            selection = container.loc[
+                (days >= pd.to_datetime(first, format="%d-%b-%Y")) &
+                (days <= pd.to_datetime(last, format="%d-%b-%Y"))]
+            expected = regression.get_coefficients(selection,
+                                                   w_star=w_star)
+            actual = coefficients.loc[coefficients["first_date"] == first]
+            np.testing.assert_allclose(actual["a"].values,
+                                       expected["a"].values)
+            np.testing.assert_allclose(actual["mu"].values,
+                                       expected["mu"].values)
+
+    def test_p_values(self):
+        t = np.array([0.1, 0.7, 1.5, 3.0, 12.0])
+        # closed forms of the t distribution with one and two degrees of
+        # freedom
+        np.testing.assert_allclose(regression.get_t_p_values(t, 1),
+                                   1 - 2 / np.pi * np.arctan(t))
+        np.testing.assert_allclose(regression.get_t_p_values(t, 2),
+                                   1 - t / np.sqrt(2 + t * t))
+        np.testing.assert_allclose(regression.get_f_p_values(t * t, 1, 7),
+                                   regression.get_t_p_values(t, 7))
+        self.assertTrue(np.isnan(regression.get_t_p_values(np.nan, 5)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tests of the streaming aggregation of the preprocessor class: the days of
+the raw files are spread over many small chunks and the aggregations of
+trades (including the measures of the order flow) and quotes, the
+distributions and the intraday bars must equal those of a full run that
+aggregates whole days at once.
+
+The tests are run with the synthetic raw files of the synthetic module
+(python -m pytest from the Python folder).
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+import pandas as pd
+import Common.preprocessing as preprocessing
+import Util.pandashelper as pandashelper
+import Util.synthetic as synthetic
+
+
+def get_preprocessor(input_folder):
+    """
+    Returns a preprocessor class of the synthetic venue without output.
+    """
+    pp = preprocessing.PreProcessor(input_folder)
+    pp.verbose = False
+    return pp
+
+
+def get_rows(df):
+    """
+    Returns the rows of an aggregation with a new index.
+    """
+    return df.reset_index(drop=True)
+
+
+class StreamingTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter("ignore")
+        self.cwd = os.getcwd()
+        self.folder = tempfile.mkdtemp()
+        self.input_folder = os.path.join(self.folder, "DAX Xetra")
+        synthetic.write_sources(self.input_folder, tickers=2, days=3,
+                                trades=300, quotes=3000)
+        self.settings = (pandashelper.rows_limit_per_iter,
+                         pandashelper.bar_resolutions)
+        os.chdir(self.folder)
+
+    def tearDown(self):
+        pandashelper.rows_limit_per_iter, pandashelper.bar_resolutions = \
+            self.settings
+        os.chdir(self.cwd)
+        shutil.rmtree(self.folder)
+
+    def test_streaming(self):
+        pandashelper.bar_resolutions = [60, 300]
+        full = get_preprocessor(self.input_folder)
+        full.init_rows_per_date()
+        full.init_aggregations()
+
+        # chunks of 500 rows spread each day over several chunks
+        pandashelper.rows_limit_per_iter = 500
+        streaming = get_preprocessor(self.input_folder)
+        streaming.init_aggregations_streaming()
+
+        trades = get_rows(streaming.aggregations_trades)
+        self.assertFalse(trades["eff_spread"].isnull().any())
+        self.assertFalse(trades["order_imbalance"].isnull().any())
+        pd.testing.assert_frame_equal(
+            trades, get_rows(full.aggregations_trades), check_exact=False,
+            check_dtype=False)
+        pd.testing.assert_frame_equal(
+            get_rows(streaming.aggregations_quotes),
+            get_rows(full.aggregations_quotes), check_exact=False,
+            check_dtype=False)
+        # the histograms may be padded with zeros differently, only the
+        # observed numbers of events are compared
+        pd.testing.assert_frame_equal(streaming.get_distributions(),
+                                      full.get_distributions())
+        for kind in ["bars_trades", "bars_quotes"]:
+            for seconds in pandashelper.bar_resolutions:
+                pd.testing.assert_frame_equal(
+                    get_rows(getattr(streaming, kind)[seconds]),
+                    get_rows(getattr(full, kind)[seconds]),
+                    check_exact=False, check_dtype=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
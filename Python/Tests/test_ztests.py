@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tests of the vectorized z-tests of the ztests module: the pairwise tests are
+compared with the double loop per pair of z tests.R and the corrections for
+multiple testing with a direct transcription of p.adjust() of R.
+
+The tests are run with random coefficients (python -m pytest from the
+Python folder).
+"""
+
+import math
+import unittest
+import numpy as np
+import pandas as pd
+import Util.ztests as ztests
+
+
+def get_coefficients(seed=0):
+    """
+    Returns a random table of coefficients with several venues, models and
+    stocks (the venues have different counts of stocks).
+    """
+    rng = np.random.RandomState(seed)
+    frames = []
+    for venue, stocks in [("Xetra", 5), ("BATS", 3), ("Chi-X", 1),
+                          ("Turquoise", 4)]:
+        for model in ["trade_freq", "quote_freq"]:
+            frames.append(pd.DataFrame({
+                "symbol": ["S%d" % k for k in range(stocks)],
+                "venue": venue, "model": model,
+                "a": rng.normal(0.6, 0.1, stocks),
+                "a_se": rng.uniform(0.01, 0.1, stocks)}))
+    return pd.concat(frames, ignore_index=True).sample(
+        frac=1, random_state=seed).reset_index(drop=True)
+
+
+def get_p_adjust(p, method):
+    """
+    Returns the adjusted p-values like p.adjust() of R (null values are kept
+    and not counted).
+    """
+    p = np.asarray(p, dtype=np.float64)
+    result = np.full(len(p), np.nan)
+    rows = np.flatnonzero(~np.isnan(p))
+    values = p[rows]
+    n = len(values)
+    if method == "bonferroni":
+        result[rows] = np.minimum(1, n * values)
+    elif method == "holm":
+        o = np.argsort(values, kind="stable")
+        i = np.arange(1, n + 1)
+        result[rows[o]] = np.minimum(1, np.maximum.accumulate(
+            (n - i + 1) * values[o]))
+    elif method == "bh":
+        o = np.argsort(-values, kind="stable")
+        i = np.arange(n, 0, -1)
+        result[rows[o]] = np.minimum(1, np.minimum.accumulate(
+            n / i * values[o]))
+    return result
+
+
+class ZTestsTest(unittest.TestCase):
+
+    def test_pairwise_tests(self):
+        coefficients = get_coefficients()
+        tests = ztests.get_stock_tests(coefficients, method="none")
+
+        # double loop per venue and model like z tests.R
+        expected = []
+        for (venue, model), group in coefficients.groupby(["venue",
+                                                           "model"]):
+            for i in range(len(group)):
+                for j in range(i + 1, len(group)):
+                    first, second = group.iloc[i], group.iloc[j]
+                    z = (first["a"] - second["a"]) / math.sqrt(
+                        first["a_se"] ** 2 + second["a_se"] ** 2)
+                    expected.append((venue, model, first["symbol"],
+                                     second["symbol"], z,
+                                     math.erfc(abs(z) / math.sqrt(2))))
+        expected = pd.DataFrame(expected, columns=[
+            "venue", "model", "symbol1", "symbol2", "z", "p"])
+        self.assertEqual(len(tests), 2 * (10 + 3 + 0 + 6))
+        pd.testing.assert_frame_equal(tests.drop(columns="p_adjusted"),
+                                      expected)
+        np.testing.assert_array_equal(tests["p_adjusted"], tests["p"])
+
+    def test_adjusted_p_values(self):
+        p = [0.01, 0.02, 0.03, 0.04, 0.05]
+        # results of p.adjust() of R
+        np.testing.assert_allclose(ztests.get_adjusted_p_values(
+            p, method="bonferroni"), [0.05, 0.1, 0.15, 0.2, 0.25])
+        np.testing.assert_allclose(ztests.get_adjusted_p_values(
+            p, method="holm"), [0.05, 0.08, 0.09, 0.09, 0.09])
+        np.testing.assert_allclose(ztests.get_adjusted_p_values(
+            p, method="bh"), [0.05, 0.05, 0.05, 0.05, 0.05])
+
+        # random p-values with ties and null values in several families
+        rng = np.random.RandomState(1)
+        p = np.round(rng.uniform(0, 0.3, 200), 2)
+        p[rng.choice(200, 20, replace=False)] = np.nan
+        families = rng.randint(0, 7, 200)
+        for method in ["bonferroni", "holm", "bh"]:
+            expected = np.full(200, np.nan)
+            for family in range(7):
+                rows = families == family
+                expected[rows] = get_p_adjust(p[rows], method)
+            np.testing.assert_allclose(ztests.get_adjusted_p_values(
+                p, families, method), expected)
+
+    def test_matrices(self):
+        coefficients = get_coefficients()
+        group = coefficients.loc[(coefficients["venue"] == "Xetra") & (
+            coefficients["model"] == "trade_freq")]
+        z, p = ztests.get_condensed(group["a"].values, group["a_se"].values)
+        matrix = ztests.get_square_matrix(z, len(group), antisymmetric=True)
+        for i in range(len(group)):
+            for j in range(len(group)):
+                if i == j:
+                    self.assertTrue(np.isnan(matrix[i, j]))
+                    continue
+                self.assertAlmostEqual(matrix[i, j], ztests.get_z_scores(
+                    group["a"].values[i], group["a_se"].values[i],
+                    group["a"].values[j], group["a_se"].values[j]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,525 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The accumulators module provides a streaming aggregation of trades and quotes
+with mergeable accumulators per day. Each accumulator keeps counts, sums,
+Welford moments (count, mean and sum of squared deviations), first, last,
+high and low values and time-weighted sums of the days that are still open.
+A day may be spread over any number of chunks, so that no index of rows per
+day is required to cut the raw data. The memory that is needed is bounded by
+one chunk plus the state of one open day. The aggregation of a day is emitted
+as soon as the first row of the next day arrives. The distributions and the
+intraday bars need all rows of a day at once, so the rows of the open day are
+kept by a buffer for them (the quotes only if bars are calculated).
+
+The results correspond to the aggregation functions in the pandashelper
+module as if the whole source file were aggregated at once. The standard
+deviations are computed from Welford moments and may therefore differ in the
+last digits from the two-pass algorithm of pandas.
+
+The pandas and numpy packages must be installed to use this module.
+"""
+
+import numpy as np
+import pandas as pd
+import Util.orderflow as orderflow
+import Util.segments as segments
+import Util.volatility as volatility
+
+NS_PER_MS = 1000000
+
+
+def get_moments(values):
+    """
+    Function returns the Welford moments (count, mean and sum of squared
+    deviations from the mean) of all values that are not null.
+    """
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return (0, 0.0, 0.0)
+    mean = values.mean()
+    return (len(values), mean, ((values - mean) ** 2).sum())
+
+
+def merge_moments(a, b):
+    """
+    Function merges two Welford moments into the moments of the union of
+    both underlying sets of values.
+    """
+    if a[0] == 0:
+        return b
+    if b[0] == 0:
+        return a
+    n = a[0] + b[0]
+    delta = b[1] - a[1]
+    return (n, a[1] + delta * b[0] / n, a[2] + b[2] + delta ** 2 * a[0] *
+            b[0] / n)
+
+
+def get_std(moments, ddof=1):
+    """
+    Function returns the standard deviation of the given Welford moments.
+    """
+    if moments[0] - ddof <= 0:
+        return np.nan
+    return np.sqrt(moments[2] / (moments[0] - ddof))
+
+
+def get_nanoseconds(times):
+    """
+    Function returns the timestamps of a time column as integer nanoseconds.
+    """
+    return np.asarray(times, dtype="datetime64[ns]").view(np.int64)
+
+
+class DayAccumulator:
+    """
+    The DayAccumulator class is the base class of the streaming aggregations.
+    It splits each chunk into the segments of its days, passes every segment
+    to the update() method of the subclass and emits the result of each day
+    that is closed.
+    """
+    def __init__(self):
+        self.state = None
+        self.results = []
+
+    def add(self, df):
+        """
+        Add a chunk of rows that are sorted by date and time. The return value
+        is a dataframe with the aggregations of all days that are closed by
+        this chunk (i.e. all days in front of the last day of the chunk).
+        """
+        if df.empty:
+            return self.get_results()
+        dates = df["Date[G]"].values
+        starts, ends = segments.get_segments(dates)
+        for k in range(len(starts)):
+            date = str(dates[starts[k]])
+            if self.state is not None and self.state["date"] != date:
+                self.emit()
+            if self.state is None:
+                self.state = self.get_empty_state(date)
+            self.update(df.iloc[starts[k]:ends[k]])
+        return self.get_results()
+
+    def close(self):
+        """
+        Close the last open day. The return value is a dataframe with the
+        aggregation of this day.
+        """
+        if self.state is not None:
+            self.emit()
+        return self.get_results()
+
+    def emit(self):
+        """
+        Finalize the open day and keep its aggregation until it's returned.
+        """
+        result = self.finalize()
+        if result is not None:
+            self.results.append(result)
+        self.state = None
+
+    def get_results(self):
+        """
+        Returns all aggregations that are finalized since the last call as a
+        dataframe.
+        """
+        results = pd.DataFrame(self.results, columns=self.columns)
+        self.results = []
+        return results
+
+
+class TradeAccumulator(DayAccumulator):
+    """
+    The TradeAccumulator class aggregates trades per day with the same
+    columns as the get_empty_aggregation_trades() function returns.
+    """
+    columns = ['ticker', 'date', 'V', 'sigma_r', 'sigma_p', 'P', 'N', 'X',
+               'Open', 'Close', 'High', 'Low']
+
+    def get_empty_state(self, date):
+        """
+        Returns the state of a new day without any trades.
+        """
+        return {"date": date, "ticker": None, "n": 0, "v": 0.0, "x": 0,
+                "open": np.nan, "close": np.nan, "high": -np.inf,
+                "low": np.inf, "p_sum": 0.0, "t_sum": 0.0,
+                "returns": (0, 0.0, 0.0), "prices": (0, 0.0, 0.0),
+                "last_time": None, "last_price": np.nan}
+
+    def update(self, df):
+        """
+        Add all trades of one segment of the open day to its state.
+        """
+        s = self.state
+        price = df["Price"].values.astype(np.float64)
+        volume = df["Volume"].values
+        times = get_nanoseconds(df["Time[G]"].values)
+        s["ticker"] = df["#RIC"].values[-1]
+        s["n"] += len(df)
+        s["v"] += (price * volume).sum()
+        s["x"] += volume.sum()
+        if s["last_time"] is None:
+            s["open"] = price[0]
+        s["close"] = price[-1]
+        s["high"] = max(s["high"], price.max())
+        s["low"] = min(s["low"], price.min())
+
+        # returns and time deltas refer to the previous trade of the same day
+        # that may be part of the previous chunk
+        previous = np.concatenate(([s["last_price"]], price[:-1]))
+        s["returns"] = merge_moments(s["returns"], get_moments(
+            price / previous))
+        s["prices"] = merge_moments(s["prices"], get_moments(price))
+        if s["last_time"] is None:
+            delta = np.diff(times) / NS_PER_MS
+            weighted = price[:-1]
+        else:
+            delta = np.diff(np.concatenate(([s["last_time"]], times))) / \
+                NS_PER_MS
+            weighted = previous
+        s["p_sum"] += (delta * weighted).sum()
+        s["t_sum"] += delta.sum()
+        s["last_time"] = times[-1]
+        s["last_price"] = price[-1]
+
+    def finalize(self):
+        """
+        Returns the aggregation of the open day as list of values.
+        """
+        s = self.state
+        if s["n"] == 0:
+            return None
+        return [s["ticker"], s["date"], s["v"], get_std(s["returns"]),
+                get_std(s["prices"]), s["p_sum"] / s["t_sum"] if s["t_sum"]
+                else np.nan, s["n"], s["x"], s["open"], s["close"],
+                s["high"], s["low"]]
+
+
+class QuoteAccumulator(DayAccumulator):
+    """
+    The QuoteAccumulator class aggregates quotes per day with the same
+    columns as the get_empty_aggregation_quotes() function returns. Missing
+    prices and sizes are filled up with the last value before, even if this
+    value belongs to the previous chunk.
+    """
+    columns = ['ticker', 'date', 'N', 'sigma_s', 'sigma_m', 'sigma_m_log',
+               'bid_price', 'bid_size', 'ask_price', 'ask_size',
+               'rel_spread']
+    fill_columns = ["Bid Price", "Bid Size", "Ask Price", "Ask Size"]
+
+    def __init__(self, seconds=10):
+        DayAccumulator.__init__(self)
+        volatility.check_frequency(seconds)
+        self.seconds = seconds
+        self.fill = {col: np.nan for col in self.fill_columns}
+
+    def get_empty_state(self, date):
+        """
+        Returns the state of a new day without any quotes.
+        """
+        return {"date": date, "ticker": None, "n": 0,
+                "spreads": (0, 0.0, 0.0), "mids": (0, 0.0, 0.0),
+                "divisor": 0.0, "sums": np.zeros(5), "last_time": None,
+                "last_weights": None, "last_valid": False,
+                "grid_first": None, "grid_next": 0,
+                "points": np.zeros(0, dtype=np.int64), "logs": np.zeros(0),
+                "last_sample": np.nan, "samples": (0, 0.0, 0.0)}
+
+    def get_filled_values(self, df):
+        """
+        Returns the prices and sizes of the given quotes as dictionary of
+        arrays in which missing values are filled up with the last value
+        before.
+        """
+        filled = {}
+        for col in self.fill_columns:
+            values = pd.Series(np.concatenate((
+                [self.fill[col]], df[col].values.astype(np.float64))))
+            values = values.fillna(method="ffill").values
+            self.fill[col] = values[-1]
+            filled[col] = values[1:]
+        return filled
+
+    def update(self, df):
+        """
+        Add all quotes of one segment of the open day to its state.
+        """
+        s = self.state
+        filled = self.get_filled_values(df)
+        times = get_nanoseconds(df["Time[G]"].values)
+        bid, ask = filled["Bid Price"], filled["Ask Price"]
+        valid = (bid > 0) & (filled["Bid Size"] > 0) & (ask > 0) & (
+            filled["Ask Size"] > 0)
+        spread = ask - bid
+        mid = (ask + bid) / 2
+        weights = np.column_stack((spread / mid * 10000, bid,
+                                   filled["Bid Size"], ask,
+                                   filled["Ask Size"]))
+
+        # the time delta of each quote refers to the next quote of the same
+        # day, the last quote of the segment is kept for the next segment
+        if s["last_time"] is not None:
+            times_all = np.concatenate(([s["last_time"]], times))
+            weights = np.concatenate((s["last_weights"], weights))
+            valid_all = np.concatenate(([s["last_valid"]], valid))
+        else:
+            times_all, valid_all = times, valid
+        delta = np.diff(times_all) / NS_PER_MS
+        weighted = valid_all[:-1]
+        s["divisor"] += delta[weighted].sum()
+        s["sums"] += (delta[weighted, None] * weights[:-1][weighted]).sum(
+            axis=0)
+        s["last_time"] = times[-1]
+        s["last_weights"] = weights[-1:]
+        s["last_valid"] = valid[-1]
+
+        if not valid.any():
+            return
+        s["ticker"] = df["#RIC"].values[valid][-1]
+        s["n"] += valid.sum()
+        s["spreads"] = merge_moments(s["spreads"], get_moments(spread[valid]))
+        s["mids"] = merge_moments(s["mids"], get_moments(mid[valid]))
+        self.update_realized(times[valid], (np.log(bid[valid]) + np.log(
+            ask[valid])) / 2, False)
+
+    def update_realized(self, times, logs, final):
+        """
+        Add the log midpoints of valid quotes to the realized standard error
+        of the open day. All grid points up to the last but one distinct
+        timestamp are sampled, because the value of the last timestamp may
+        still be replaced by a later quote of the same millisecond. If the day
+        is closed (final is True) all remaining grid points are sampled.
+        """
+        s = self.state
+        step = self.seconds * volatility.NS_PER_SECOND
+        if s["grid_first"] is None and len(times):
+            s["grid_first"] = int(volatility.get_first_grid_point(
+                np.array([times[0]]), self.seconds)[0])
+        points = np.concatenate((s["points"], times))
+        logs = np.concatenate((s["logs"], logs))
+        if len(points) == 0:
+            return
+
+        # keep the last occurance of each timestamp
+        last = np.concatenate((points[1:] != points[:-1], [True]))
+        points, logs = points[last], logs[last]
+        bound = points[-1] if final else (
+            points[-2] if len(points) > 1 else None)
+        if bound is not None and bound >= s["grid_first"]:
+            grid = s["grid_first"] + np.arange(
+                s["grid_next"], (bound - s["grid_first"]) // step + 1) * step
+            s["grid_next"] += len(grid)
+            sampled = np.interp(grid, points, logs, left=np.nan,
+                                right=np.nan)
+            sampled = sampled[~np.isnan(sampled)]
+            keep = sampled != np.concatenate(([s["last_sample"]],
+                                              sampled[:-1]))
+            sampled = sampled[keep]
+            if len(sampled):
+                s["last_sample"] = sampled[-1]
+                s["samples"] = merge_moments(s["samples"], get_moments(
+                    sampled))
+        s["points"], s["logs"] = points[-2:], logs[-2:]
+
+    def finalize(self):
+        """
+        Returns the aggregation of the open day as list of values.
+        """
+        s = self.state
+        if s["n"] == 0:
+            return None
+        self.update_realized(np.zeros(0, dtype=np.int64), np.zeros(0), True)
+        averages = s["sums"] / s["divisor"] if s["divisor"] else \
+            np.full(5, np.nan)
+        return [s["ticker"], s["date"], s["n"], get_std(s["spreads"]),
+                get_std(s["mids"]), get_std(s["samples"], 0), averages[1],
+                averages[2], averages[3], averages[4], averages[0]]
+
+
+class OrderflowAccumulator(DayAccumulator):
+    """
+    The OrderflowAccumulator class calculates the measures of the order flow
+    per day with the same columns as the get_new_aggregation_orderflow()
+    function of the pandashelper module returns. Since the trades of a day
+    may be spread over several chunks, the quotes of the open day that may
+    still prevail for later trades are carried over to the next chunk as
+    well as the last price and the last sign of the tick test. The rows of
+    the raw data must be sorted by time within each day, so that no later
+    trade of a day is older than the last trade or quote of a chunk.
+    """
+    columns = ['date', 'eff_spread', 'signed_volume', 'order_imbalance']
+    quote_columns = {"bid_price": "Bid Price", "bid_size": "Bid Size",
+                     "ask_price": "Ask Price", "ask_size": "Ask Size"}
+
+    def __init__(self):
+        DayAccumulator.__init__(self)
+        self.quotes = None
+        self.last = {"date": None, "time": None, "price": np.nan, "sign": 0}
+
+    def get_empty_state(self, date):
+        """
+        Returns the state of a new day without any trades.
+        """
+        return {"date": date, "spreads": 0.0, "matched": 0,
+                "signed_volume": 0.0, "signed": 0.0}
+
+    def get_quotes(self, df):
+        """
+        Returns the dates, the times (integer nanoseconds) and the columns of
+        the given quotes as arrays with the quotes that are carried over from
+        the chunk before in front of them.
+        """
+        dates = df["Date[G]"].values
+        times = get_nanoseconds(df["Time[G]"].values)
+        columns = {name: df[col].values.astype(np.float64) for name, col in
+                   self.quote_columns.items()}
+        if self.quotes is None:
+            return dates, times, columns
+        carried_dates, carried_times, carried = self.quotes
+        return (np.concatenate((carried_dates, dates)),
+                np.concatenate((carried_times, times)),
+                {name: np.concatenate((carried[name], columns[name]))
+                 for name in columns})
+
+    def add(self, df_trades, df_quotes):
+        """
+        Add the trades and quotes of a chunk that are sorted by date and
+        time. The return value is a dataframe with the measures of all days
+        that are closed by this chunk (i.e. all days in front of the last day
+        of the trades).
+        """
+        quote_dates, quote_times, quotes = self.get_quotes(df_quotes)
+        trade_dates = df_trades["Date[G]"].values
+        trade_times = get_nanoseconds(df_trades["Time[G]"].values)
+        prices = df_trades["Price"].values.astype(np.float64)
+        volumes = df_trades["Volume"].values.astype(np.float64)
+        days, trade_codes, quote_codes = orderflow.get_day_codes(
+            trade_dates, quote_dates)
+
+        quotes = orderflow.get_filled_columns(quote_codes, quotes)
+        valid = orderflow.get_valid_quotes(quotes)
+        prevailing = orderflow.get_prevailing_quotes(
+            trade_codes, trade_times, quote_codes[valid], quote_times[valid])
+        mids = orderflow.get_midpoints(quotes, valid, prevailing)
+        # the tick test of the open day goes on with the last trade of the
+        # chunk before
+        if len(prices) and str(trade_dates[0]) == self.last["date"]:
+            tick_signs = orderflow.get_tick_signs(
+                trade_codes, prices, self.last["price"], self.last["sign"])
+        else:
+            tick_signs = orderflow.get_tick_signs(trade_codes, prices)
+        signs = orderflow.get_signs(prices, mids, tick_signs)
+        starts, sums = orderflow.get_daily_sums(trade_codes, prices,
+                                                volumes, mids, signs)
+        for k in range(len(starts)):
+            date = str(trade_dates[starts[k]])
+            if self.state is not None and self.state["date"] != date:
+                self.emit()
+            if self.state is None:
+                self.state = self.get_empty_state(date)
+            for name in sums:
+                self.state[name] += sums[name][k]
+        if len(prices):
+            self.last = {"date": str(trade_dates[-1]),
+                         "time": trade_times[-1], "price": prices[-1],
+                         "sign": tick_signs[-1]}
+        self.carry_quotes(quote_dates, quote_times, quotes, valid)
+        return self.get_results()
+
+    def carry_quotes(self, dates, times, quotes, valid):
+        """
+        Keep the quotes of the last day that may prevail for the trades of
+        the next chunks: all valid quotes that are younger than quote_lag
+        milliseconds before the last trade or quote, the last valid quote
+        before and the last quote of the day to fill up missing values.
+        """
+        if len(dates) == 0:
+            self.quotes = None
+            return
+        date = dates[-1]
+        latest = times[-1]
+        if self.last["date"] == str(date):
+            latest = max(latest, self.last["time"])
+        lag = max(int(orderflow.quote_lag * NS_PER_MS), 1)
+        candidates = valid & (dates == date)
+        older = np.flatnonzero(candidates & (times <= latest - lag))
+        rows = np.unique(np.concatenate((
+            older[-1:], np.flatnonzero(candidates & (times > latest - lag)),
+            [len(dates) - 1]))).astype(np.int64)
+        self.quotes = (dates[rows], times[rows],
+                       {name: values[rows] for name, values in
+                        quotes.items()})
+
+    def finalize(self):
+        """
+        Returns the measures of the order flow of the open day as list of
+        values.
+        """
+        s = self.state
+        measures = orderflow.get_measures({name: np.array([s[name]]) for name
+                                           in ["spreads", "matched",
+                                               "signed_volume", "signed"]})
+        return [s["date"], measures["eff_spread"][0],
+                measures["signed_volume"][0], measures["order_imbalance"][0]]
+
+
+class DayBuffer:
+    """
+    The DayBuffer class keeps the rows of the open day of a stream of chunks
+    for the aggregations that need all rows of a day at once, i.e. the
+    distributions and the intraday bars. Only the rows of one day are kept,
+    the rows of all other days are returned as soon as they are closed.
+    Missing values of the given fill columns are filled up with the last
+    value before, even if this value belongs to a day returned before.
+    """
+    def __init__(self, fill_columns=None):
+        self.frames = []
+        self.empty = pd.DataFrame()
+        self.fill_columns = fill_columns or []
+        self.fill = None
+
+    def add(self, df):
+        """
+        Add a chunk of rows that are sorted by date and time. The return value
+        is a dataframe with the rows of all days that are closed by this
+        chunk.
+        """
+        self.empty = df.iloc[:0]
+        if df.empty:
+            return self.empty
+        dates = df["Date[G]"].values
+        last = segments.get_segments(dates)[0][-1]
+        closed = []
+        if self.frames and str(self.frames[-1]["Date[G]"].values[-1]) != \
+                str(dates[0]):
+            closed, self.frames = self.frames, []
+        if last > 0:
+            closed += self.frames + [df.iloc[:last]]
+            self.frames = []
+        self.frames.append(df.iloc[last:])
+        return self.get_rows(closed)
+
+    def close(self):
+        """
+        Close the open day. The return value is a dataframe with its rows.
+        """
+        closed, self.frames = self.frames, []
+        return self.get_rows(closed)
+
+    def get_rows(self, frames):
+        """
+        Returns the given frames of closed days as one dataframe in which
+        the missing values of the fill columns are filled up.
+        """
+        if not frames:
+            return self.empty
+        df = pd.concat(frames)
+        if self.fill_columns:
+            filled = pd.concat([self.fill, df[self.fill_columns]]).fillna(
+                method="ffill").iloc[-len(df):]
+            df = df.copy()
+            df[self.fill_columns] = filled.values
+            self.fill = filled.iloc[-1:]
+        return df
@@ -0,0 +1,163 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The bars module provides a vectorized engine for intraday bars of trades and
+quotes. The bars of several resolutions are aligned with the beginning of the
+trading hours and computed from the same arrays that are used for the daily
+aggregation, so that the raw data have to be read only once. All days of the
+given arrays are processed at once with segmented reductions.
+
+The numpy package must be installed to use this module. Required package is
+the segments module that is also included in this project.
+"""
+
+import numpy as np
+import Util.segments as segments
+
+NS_PER_SECOND = 1000000000
+
+
+def get_count_of_bars(bod, eod, seconds):
+    """
+    Returns the number of bars with the given length in seconds within the
+    trading hours. The bod and eod are given as integer nanoseconds.
+    """
+    step = seconds * NS_PER_SECOND
+    return max(-(-(eod - bod) // step), 1)
+
+
+def get_bar_numbers(times, bod, eod, seconds):
+    """
+    Function returns the number of the bar of each timestamp (integer
+    nanoseconds) counted from the beginning of the trading hours. Timestamps
+    at the very end of the trading hours belong to the last bar.
+    """
+    bars = (times - bod) // (seconds * NS_PER_SECOND)
+    return np.clip(bars, 0, get_count_of_bars(bod, eod, seconds) - 1)
+
+
+def get_sorted_codes(dates):
+    """
+    Function factorizes the dates like segments.factorize_dates() and
+    returns the distinct dates, the codes per row and the order of the rows
+    that sorts them by date (or None if they are sorted already).
+    """
+    days, codes = segments.factorize_dates(dates)
+    if len(codes) and np.any(codes[1:] < codes[:-1]):
+        return days, codes, np.argsort(codes, kind="mergesort")
+    return days, codes, None
+
+
+def get_trade_bars(dates, times, prices, volumes, bod, eod, resolutions):
+    """
+    Calculate the bars of trades for one or more resolutions in seconds. The
+    times must be given as datetime64[ns] or integer nanoseconds and sorted
+    within each day. Only bars with at least one trade are returned.
+
+    The return value is a tuple of the sorted distinct dates and a
+    dictionary with one dictionary of arrays per resolution. The arrays are
+    the day (index of the distinct dates), the bar number, the row of the
+    last trade of the bar, the count of trades N, the traded value V, the
+    volume X and the prices Open, High, Low and Close.
+    """
+    times = np.asarray(times).view(np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    volumes = np.asarray(volumes)
+    days, codes, order = get_sorted_codes(dates)
+    rows = np.arange(len(codes))
+    if order is not None:
+        codes, rows = codes[order], order
+        times, prices, volumes = times[order], prices[order], volumes[order]
+    result = {}
+    for seconds in resolutions:
+        bars = get_bar_numbers(times, bod, eod, seconds)
+        keys = codes * get_count_of_bars(bod, eod, seconds) + bars
+        starts, ends = segments.get_segments(keys)
+        high, low = segments.get_extrema(prices, starts)
+        result[seconds] = {
+            "day": codes[starts], "bar": bars[starts],
+            "last": rows[ends - 1], "N": ends - starts,
+            "V": segments.get_sums(prices * volumes, starts),
+            "X": segments.get_sums(volumes, starts),
+            "Open": prices[starts], "High": high, "Low": low,
+            "Close": prices[ends - 1]}
+    return days, result
+
+
+def get_pieces(codes, times, bod, eod, seconds):
+    """
+    Function splits the period of each quote (from its timestamp to the
+    timestamp of the next quote of the same day) at the borders of the bars.
+    The last quote of each day has a period of zero. The return value is a
+    tuple of the quote, the bar and the duration in nanoseconds of each
+    piece. The pieces are sorted by day and bar.
+    """
+    step = seconds * NS_PER_SECOND
+    last = np.append(codes[1:] != codes[:-1], True)[:len(codes)]
+    following = np.append(times[1:], 0)[:len(times)]
+    following[last] = times[last]
+    first_bar = get_bar_numbers(times, bod, eod, seconds)
+    last_bar = np.maximum(get_bar_numbers(
+        following - 1, bod, eod, seconds), first_bar)
+    counts = last_bar - first_bar + 1
+    quotes = np.repeat(np.arange(len(times)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(
+        counts) - counts, counts)
+    bars = first_bar[quotes] + offsets
+    begin = np.maximum(times[quotes], bod + bars * step)
+    end = np.minimum(following[quotes], bod + (bars + 1) * step)
+    return quotes, bars, np.maximum(end - begin, 0)
+
+
+def get_quote_bars(dates, times, columns, bod, eod, resolutions):
+    """
+    Calculate the bars of quotes for one or more resolutions in seconds. The
+    given columns (a dictionary of arrays, e.g. bid and ask prices and sizes
+    of valid quotes) are weighted with the time in which each quote is valid
+    within the bar, i.e. a quote is valid until the next quote of the same
+    day and may span several bars. Bars without any new quote but with a
+    valid quote from a bar before are included.
+
+    The return value is a tuple of the sorted distinct dates and a
+    dictionary with one dictionary of arrays per resolution. The arrays are
+    the day, the bar number, the row of the last quote that is valid in the
+    bar, the count of new quotes N and the time-weighted average of each
+    given column (null if the quotes of the bar have no duration).
+    """
+    times = np.asarray(times).view(np.int64)
+    columns = {name: np.asarray(values, dtype=np.float64)
+               for name, values in columns.items()}
+    days, codes, order = get_sorted_codes(dates)
+    rows = np.arange(len(codes))
+    if order is not None:
+        codes, rows, times = codes[order], order, times[order]
+        columns = {name: values[order] for name, values in columns.items()}
+    result = {}
+    for seconds in resolutions:
+        quotes, bars, durations = get_pieces(codes, times, bod, eod,
+                                             seconds)
+        keys = codes[quotes] * get_count_of_bars(bod, eod, seconds) + bars
+        starts, ends = segments.get_segments(keys)
+        durations = durations.astype(np.float64)
+        divisor = segments.get_sums(durations, starts)
+        new = np.append(True, quotes[1:] != quotes[:-1])
+        bar_result = {
+            "day": codes[quotes[starts]], "bar": bars[starts],
+            "last": rows[quotes[ends - 1]],
+            "N": segments.get_sums(new, starts)}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for name, values in columns.items():
+                bar_result[name] = segments.get_sums(
+                    durations * values[quotes], starts) / divisor
+        result[seconds] = bar_result
+    return days, result
+
+
+def get_bar_times(bars, bod, seconds):
+    """
+    Returns the beginning of each bar as string in the format HH:MM:SS. The
+    bod is given as integer nanoseconds (the date is ignored).
+    """
+    begin = (bod + bars * seconds * NS_PER_SECOND) // NS_PER_SECOND % 86400
+    return ["%02d:%02d:%02d" % (s // 3600, s // 60 % 60, s % 60)
+            for s in begin.tolist()]
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The columnstore module provides a simple typed columnar store on disk. Each
+partition is a folder that contains one binary numpy file per column and a
+small json file with meta data. The partitions of the raw data are organized
+as <folder>/<ticker>/<date>/<kind> with the kinds trades and quotes, so that
+single tickers and days can be loaded directly. All columns are loaded as
+memory-mapped arrays, i.e. only the accessed data are read from disk.
+
+The numpy package must be installed to use this module.
+"""
+
+import os
+import json
+import numpy as np
+
+meta_file = "meta.json"
+
+
+def get_partition_folder(folder, ticker, date, kind):
+    """
+    Returns the path of the partition of the given ticker, date and kind.
+    """
+    return os.path.join(folder, ticker, date, kind)
+
+
+def write_partition(path, columns, meta):
+    """
+    Write a partition with the given columns (a dictionary of numpy arrays)
+    and the given meta data (a dictionary that can be converted to json).
+    Existing columns of the same name are overwritten.
+    """
+    os.makedirs(path, exist_ok=True)
+    for name, values in columns.items():
+        np.save(os.path.join(path, name + ".npy"), values)
+    f = open(os.path.join(path, meta_file), "w")
+    f.write(json.dumps(meta))
+    f.close()
+
+
+def read_meta(path):
+    """
+    Load the meta data of a partition.
+    """
+    f = open(os.path.join(path, meta_file))
+    meta = json.load(f)
+    f.close()
+    return meta
+
+
+def read_partition(path):
+    """
+    Load all columns of a partition as memory-mapped arrays. The return value
+    is a dictionary with the column names as keys.
+    """
+    columns = {}
+    for file in os.listdir(path):
+        if file.endswith(".npy"):
+            columns[file[:-4]] = np.load(os.path.join(path, file),
+                                         mmap_mode="r")
+    return columns
+
+
+def get_tickers(folder):
+    """
+    Returns all tickers that are included in the store.
+    """
+    if not os.path.isdir(folder):
+        return []
+    return sorted(ticker for ticker in os.listdir(folder)
+                  if os.path.isdir(os.path.join(folder, ticker)))
+
+
+def get_dates(folder, ticker, kind="trades"):
+    """
+    Returns all dates of a ticker for which a partition of the given kind
+    exists. The dates are sorted by their position in the source file.
+    """
+    path = os.path.join(folder, ticker)
+    dates = []
+    for date in os.listdir(path):
+        partition = get_partition_folder(folder, ticker, date, kind)
+        if os.path.isfile(os.path.join(partition, meta_file)):
+            dates.append((read_meta(partition).get("position", 0), date))
+    return [date for position, date in sorted(dates)]
+
+
+def encode_strings(values):
+    """
+    Function encodes an array of strings into integer codes and an array
+    of the distinct strings (dictionary encoding).
+    """
+    categories, codes = np.unique(np.asarray(values, dtype=str),
+                                  return_inverse=True)
+    return codes.astype(np.int32), categories
@@ -0,0 +1,215 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The csvreader module provides an alternative backend to read TRTH source
+files with the multi-threaded csv reader of Apache Arrow instead of the c
+engine of pandas. The rows are parsed directly into typed columns: the
+ticker, the type and the qualifiers as categories, prices as floats, sizes as
+integers and the Time[G] column as integer milliseconds since midnight. This
+way the conversion of strings into numbers and datetimes of every chunk is no
+longer required. The backend is selected by the csv_backend setting of the
+pandashelper module.
+
+The pandas and numpy packages must be installed to use this module. The
+backend requires the optional pyarrow package.
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as csv
+    import pyarrow.compute as compute
+except ImportError:
+    pa = None
+
+# define global settings for the arrow csv reader
+threads = None # number of threads that parse the rows, None for all cores
+block_size = 64 * 2 ** 20 # bytes of the source file per parsed block
+
+names = ['#RIC', 'Date[G]', 'Time[G]', 'GMT Offset', 'Type',
+         'Ex/Cntrb.ID', 'Price', 'Volume', 'Bid Price',
+         'Bid Size', 'Ask Price', 'Ask Size', 'Qualifiers']
+categories = ['#RIC', 'Type', 'Qualifiers']
+floats = ['GMT Offset', 'Price', 'Bid Price', 'Ask Price']
+integers = ['Volume', 'Bid Size', 'Ask Size']
+
+
+def check_backend():
+    """
+    Raises an ImportError if the pyarrow package is not installed.
+    """
+    if pa is None:
+        raise ImportError("The pyarrow package is required for the arrow " +
+                          "csv backend.")
+    if threads:
+        pa.set_cpu_count(threads)
+
+
+def get_column_types():
+    """
+    Returns the arrow data types of the columns of the TRTH schema. All
+    columns that are not listed here are read as strings.
+    """
+    types = {"Time[G]": pa.time64("ns")}
+    for col in categories:
+        types[col] = pa.dictionary(pa.int32(), pa.string())
+    for col in floats:
+        types[col] = pa.float64()
+    for col in integers:
+        types[col] = pa.int64()
+    for col in names:
+        types.setdefault(col, pa.string())
+    return types
+
+
+def get_options(skip_rows, header=True, columns=None):
+    """
+    Returns the read and convert options of the arrow csv reader that skip
+    the header (if there is one) and the given number of rows. If a list of
+    columns is given, all other columns are skipped while parsing. Empty
+    strings are kept as empty strings like the na_filter setting of pandas
+    does, only empty numbers are read as Null.
+    """
+    read_options = csv.ReadOptions(column_names=names, skip_rows=int(header),
+                                   skip_rows_after_names=skip_rows,
+                                   use_threads=True, block_size=block_size)
+    convert_options = csv.ConvertOptions(column_types=get_column_types(),
+                                         include_columns=columns or [],
+                                         strings_can_be_null=False,
+                                         quoted_strings_can_be_null=False)
+    return read_options, convert_options
+
+
+def get_dataframe_by_table(table, index=0):
+    """
+    Function converts an arrow table with (a part of) the TRTH schema into a
+    dataframe. The times are converted into integer milliseconds since
+    midnight and the GMT offsets into integers. The index is either the
+    number of the first row or an array with the row numbers of all rows.
+    """
+    if "Time[G]" in table.column_names:
+        times = table.column("Time[G]").cast(pa.int64())
+        table = table.set_column(
+            table.column_names.index("Time[G]"), "Time[G]",
+            compute.divide(times, 1000000).cast(pa.int32()))
+    if "GMT Offset" in table.column_names:
+        table = table.set_column(
+            table.column_names.index("GMT Offset"), "GMT Offset",
+            table.column("GMT Offset").cast(pa.int8()))
+    df = table.to_pandas(split_blocks=True)
+    if np.isscalar(index):
+        df.index = pd.RangeIndex(index, index + len(df))
+    else:
+        df.index = pd.Index(index)
+    return df
+
+
+def read_source(source, first_row=0):
+    """
+    Function reads all rows of a source file beginning with the given row
+    number (the first data row after the header has the row number 0) with
+    all threads at once and returns them as a dataframe.
+    """
+    check_backend()
+    read_options, convert_options = get_options(first_row)
+    return get_dataframe_by_table(csv.read_csv(
+        source, read_options=read_options, convert_options=convert_options))
+
+
+def read_bytes(data):
+    """
+    Function parses raw rows (without header) that are given as bytes and
+    returns them as a dataframe.
+    """
+    check_backend()
+    read_options, convert_options = get_options(0, False)
+    return get_dataframe_by_table(csv.read_csv(
+        pa.BufferReader(data), read_options=read_options,
+        convert_options=convert_options))
+
+
+def get_tables(source, chunksize, first_row=0, columns=None):
+    """
+    Generator that reads a source file block by block beginning with the
+    given row number and yields arrow tables of exactly chunksize rows
+    (except the last one) together with the number of their first row. If a
+    list of columns is given, only these columns are parsed.
+    """
+    check_backend()
+    read_options, convert_options = get_options(first_row, True, columns)
+    reader = csv.open_csv(source, read_options=read_options,
+                          convert_options=convert_options)
+    batches = []
+    rows = 0
+    for batch in reader:
+        batches.append(batch)
+        rows += batch.num_rows
+        while rows >= chunksize:
+            table = pa.Table.from_batches(batches)
+            yield table.slice(0, chunksize), first_row
+            first_row += chunksize
+            table = table.slice(chunksize)
+            batches = table.to_batches()
+            rows = table.num_rows
+    if rows:
+        yield pa.Table.from_batches(batches), first_row
+
+
+def get_chunks(source, chunksize, first_row=0, first_index=0):
+    """
+    Generator that reads a source file beginning with the given row number
+    and yields dataframes of exactly chunksize rows (except the last one).
+    The index of the dataframes is continued across chunks beginning with
+    the given first index like the chunk iterator of pandas.
+    """
+    for table, row in get_tables(source, chunksize, first_row):
+        yield get_dataframe_by_table(table, first_index + row - first_row)
+
+
+def get_chunks_by_type(source, chunksize, streams):
+    """
+    Generator that reads a source file in chunks of chunksize rows and
+    routes the rows of each chunk by their type into separate dataframes.
+    The streams are given as a list of tuples of the type (e.g. Trade) and
+    the columns of this type. Only these columns are parsed and all rows of
+    other types are dropped before they are converted into pandas objects.
+    A tuple with one dataframe per stream is yielded for each chunk. The
+    index of the dataframes contains the row numbers in the source file.
+    """
+    columns = ["Type"]
+    for type_name, type_columns in streams:
+        columns += [col for col in type_columns if col not in columns]
+    for table, first_row in get_tables(source, chunksize, 0, columns):
+        types = table.column("Type")
+        result = []
+        for type_name, type_columns in streams:
+            rows = compute.indices_nonzero(compute.equal(types, type_name))
+            result.append(get_dataframe_by_table(
+                table.select(type_columns).take(rows),
+                rows.to_numpy().astype(np.int64) + first_row))
+        yield tuple(result)
+
+
+def read_rows(source, first_row, nrows=None):
+    """
+    Function returns nrows rows of the given source file beginning with the
+    row number first_row as a dataframe. If nrows is None all rows up to the
+    end of the file are returned.
+    """
+    if nrows is None:
+        return read_source(source, first_row)
+    for df in get_chunks(source, nrows, first_row):
+        return df
+    types = get_column_types()
+    return get_dataframe_by_table(pa.schema(
+        [(col, types[col]) for col in names]).empty_table())
+
+
+def is_typed(df):
+    """
+    Returns True if the given dataframe is read by this backend, i.e. the
+    Time[G] column contains integer milliseconds instead of strings.
+    """
+    return np.issubdtype(df["Time[G]"].dtype, np.integer)
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The distribution module provides a vectorized engine for the distribution of
+events (typically trades) per time interval. The event times of all days are
+binned into intervals of one or more window lengths at once and the number of
+intervals without any event is derived arithmetically from the first and the
+last interval of each day. The histograms can be calculated per day and
+accumulated across chunks as long as a day is not spread over several chunks.
+
+The numpy package must be installed to use this module.
+"""
+
+import numpy as np
+import Util.segments as segments
+
+MS_PER_DAY = 86400000
+
+
+def get_milliseconds_of_day(times):
+    """
+    Function returns the milliseconds since midnight of the given times that
+    are either datetimes or integer milliseconds already.
+    """
+    times = np.asarray(times)
+    if times.dtype.kind == "M":
+        return times.astype("datetime64[ms]").view(np.int64) % MS_PER_DAY
+    return times.astype(np.int64)
+
+
+def get_histograms(dates, times, windows=(60,)):
+    """
+    Function calculates the distribution of events per interval for each of
+    the given window lengths in seconds. The events must be sorted by date
+    and time. The intervals are aligned to multiples of the window length
+    since midnight. The first and the last interval of each day are partial
+    and therefore dropped, all full intervals in between are counted
+    including those without any event. The return value is a dictionary with
+    one array per window length in which the index corresponds to the number
+    of events per interval and the value to the number of intervals with
+    exactly this number of events.
+    """
+    days, histograms = get_daily_histograms(dates, times, windows)
+    return {seconds: histogram.sum(axis=0)
+            for seconds, histogram in histograms.items()}
+
+
+def get_daily_histograms(dates, times, windows=(60,)):
+    """
+    Function calculates the same distributions as get_histograms() but for
+    each day separately, so that the histograms of single days can be
+    replaced later. The return value is a tuple of the dates and a dictionary
+    with one 2-dimensional array per window length with one histogram per
+    date as row.
+    """
+    dates = np.asarray(dates)
+    times = get_milliseconds_of_day(times)
+    starts, ends = segments.get_segments(dates)
+    day = np.repeat(np.arange(len(starts)), ends - starts)
+    histograms = {}
+    for seconds in windows:
+        if len(starts) == 0:
+            histograms[seconds] = np.zeros((0, 1), dtype=np.int64)
+            continue
+        bins = times // (seconds * 1000)
+        first = np.minimum.reduceat(bins, starts)
+        last = np.maximum.reduceat(bins, starts)
+        inner = (bins > first[day]) & (bins < last[day])
+        keys = day[inner] * (MS_PER_DAY // 1000 + 1) + bins[inner]
+        if np.any(keys[1:] < keys[:-1]):
+            keys = np.sort(keys, kind="mergesort")
+        key_starts, key_ends = segments.get_segments(keys)
+        counts = key_ends - key_starts
+        key_days = keys[key_starts] // (MS_PER_DAY // 1000 + 1)
+        # one row per day, the intervals without any event are derived from
+        # the first and the last interval of the day
+        width = counts.max() + 1 if len(counts) else 1
+        histogram = np.bincount(key_days * width + counts, minlength=len(
+            starts) * width).astype(np.int64).reshape(len(starts), width)
+        histogram[:, 0] = np.maximum(last - first - 1, 0) - np.bincount(
+            key_days, minlength=len(starts))
+        histograms[seconds] = histogram
+    return dates[starts], histograms
+
+
+def add_histograms(a, b):
+    """
+    Function adds two histograms of possibly different lengths.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    result = a.copy()
+    result[:len(b)] += b
+    return result
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The gzipindex module provides random access to rows of gzip compressed source
+files. A zran-style checkpoint index stores the state of the inflate window
+every few megabytes of uncompressed data, so that decompression can start at
+the nearest checkpoint instead of the beginning of the file. Additionally the
+uncompressed byte offset of every n-th row (and of all given rows, typically
+the first row of each date) is stored, so that a range of rows can be read
+without decompressing and tokenizing all rows in front of it.
+
+The numpy package must be installed to use this module. The checkpoints
+require the optional indexed_gzip package. If it is not installed, no
+checkpoint index can be built and the callers fall back to sequential reads.
+"""
+
+import os
+import numpy as np
+
+try:
+    import indexed_gzip
+except ImportError:
+    indexed_gzip = None
+
+# define global settings for the checkpoint index
+window_spacing = 16 # megabytes of uncompressed data between two checkpoints
+row_spacing = 100000 # rows between two stored row offsets
+read_size = 16 * 2 ** 20 # bytes per read while scanning for line breaks
+
+
+def get_checkpoint_file(source):
+    """
+    Returns the name of the file with the inflate checkpoints of a source.
+    """
+    return source + ".zran"
+
+
+def get_offsets_file(source):
+    """
+    Returns the name of the file with the row offsets of a source.
+    """
+    return source + ".rows.npy"
+
+
+def has_index(source):
+    """
+    Returns True if a checkpoint index exists for the given source file and
+    can be used, i.e. the indexed_gzip package is installed.
+    """
+    return indexed_gzip is not None and os.path.isfile(
+        get_checkpoint_file(source)) and os.path.isfile(
+        get_offsets_file(source))
+
+
+def build_index(source, rows=()):
+    """
+    Function decompresses the given source file once and saves both the
+    inflate checkpoints and the byte offsets of every n-th row (as defined by
+    the row_spacing setting) and of all given row numbers. The first data row
+    after the header has the row number 0. The return value is an array with
+    one pair of row number and byte offset per stored row.
+    """
+    if indexed_gzip is None:
+        raise ImportError("The indexed_gzip package is required to build " +
+                          "a checkpoint index.")
+    f = indexed_gzip.IndexedGzipFile(
+        source, spacing=window_spacing * 2 ** 20)
+    try:
+        offset = len(f.readline())
+        row = 0
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        marks = [np.array([[0, offset]], dtype=np.int64)]
+        while True:
+            data = f.read(read_size)
+            if not data:
+                break
+            breaks = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)
+            # every line break starts a new row with the following number
+            numbers = row + 1 + np.arange(len(breaks), dtype=np.int64)
+            selected = (numbers % row_spacing == 0) | np.isin(numbers, rows)
+            marks.append(np.column_stack(
+                (numbers[selected], offset + breaks[selected] + 1)))
+            row += len(breaks)
+            offset += len(data)
+        f.export_index(get_checkpoint_file(source))
+    finally:
+        f.close()
+    marks = np.concatenate(marks)
+    # drop the position behind the last line break (end of file)
+    marks = marks[marks[:, 1] < offset]
+    np.save(get_offsets_file(source), marks)
+    return marks
+
+
+def read_rows(source, first_row, nrows=None):
+    """
+    Function returns the raw bytes of nrows rows of the given source file
+    beginning with the row number first_row (the first data row after the
+    header has the row number 0). If nrows is None all rows up to the end of
+    the file are returned. Decompression starts at the nearest checkpoint in
+    front of the first row.
+    """
+    if nrows == 0:
+        return b""
+    marks = np.load(get_offsets_file(source), mmap_mode="r")
+    k = np.searchsorted(marks[:, 0], first_row, side="right") - 1
+    skip = first_row - int(marks[k, 0])
+    f = indexed_gzip.IndexedGzipFile(
+        source, index_file=get_checkpoint_file(source))
+    try:
+        f.seek(int(marks[k, 1]))
+        if nrows is None and skip == 0:
+            return f.read()
+        parts = []
+        count = 0
+        start = None
+        while True:
+            data = f.read(read_size)
+            if not data:
+                break
+            breaks = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)
+            if start is None:
+                if count + len(breaks) < skip:
+                    count += len(breaks)
+                    continue
+                start = 0 if skip == 0 else breaks[skip - count - 1] + 1
+                breaks = breaks[breaks >= start]
+                data = data[start:]
+                breaks = breaks - start
+                count = 0
+            if nrows is not None and count + len(breaks) >= nrows:
+                parts.append(data[:breaks[nrows - count - 1] + 1])
+                break
+            parts.append(data)
+            count += len(breaks)
+    finally:
+        f.close()
+    return b"".join(parts)
@@ -0,0 +1,302 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The instrumentation module provides timers for the stages of the
+preprocessing (e.g. decompression, parsing, conversion, aggregation) that
+record the time, the rows in and out, the bytes read and the peak resident
+memory of the process per ticker and chunk. Each record is appended as one
+line of json to a log file (if set) and all records of a run are summed up
+per stage in a summary table. Additionally a simple sampling profiler can be
+turned on for a single ticker to see which functions take the time.
+
+Only packages of the python standard library are required. The peak
+resident memory is available on unix systems only.
+"""
+
+import sys
+import gzip
+import json
+import time
+import threading
+import contextlib
+import collections
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# define global settings for the instrumentation
+enabled = True
+log_file = None # file to which all records are appended as json lines
+profile_ticker = None # ticker for which the sampling profiler is turned on
+profile_interval = 0.005 # seconds between two samples of the profiler
+profile_lines = 25 # number of functions in the profile report
+
+context = {}
+records = []
+
+
+def get_peak_rss():
+    """
+    Returns the peak resident memory of the process in bytes or None if it
+    isn't available on this system.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def set_context(**fields):
+    """
+    Set fields (e.g. venue, ticker and chunk) that are added to all following
+    records. Fields with the value None are removed.
+    """
+    for name, value in fields.items():
+        if value is None:
+            context.pop(name, None)
+        else:
+            context[name] = value
+
+
+def start_run():
+    """
+    Drop the records of the former run and clear the context.
+    """
+    context.clear()
+    del records[:]
+
+
+def add_record(record):
+    """
+    Keep a record for the summary and append it to the log file.
+    """
+    records.append(record)
+    if log_file:
+        f = open(log_file, "a")
+        f.write(json.dumps(record) + "\n")
+        f.close()
+
+
+def add_stage(name, seconds, **fields):
+    """
+    Add a record of a stage with the given time (and further fields like
+    rows or bytes) and the current context.
+    """
+    if not enabled:
+        return
+    record = dict(context)
+    record["stage"] = name
+    record.update(fields)
+    record["seconds"] = seconds
+    record["peak_rss"] = get_peak_rss()
+    add_record(record)
+
+
+@contextlib.contextmanager
+def stage(name, rows_in=None):
+    """
+    Context manager that measures the time of a stage and adds a record
+    with the current context. A dictionary is yielded, so that the rows out
+    and the bytes read can be added within the block.
+    """
+    fields = {"rows_in": rows_in}
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        add_stage(name, time.perf_counter() - start, **fields)
+
+
+class CountingReader:
+    """
+    The CountingReader class wraps a binary file object and counts the bytes
+    and the time of all reads. It's used to separate the time of the
+    decompression of the source files from the time of parsing the rows.
+    """
+    def __init__(self, f):
+        self.f = f
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self.f.read(size)
+        self.seconds += time.perf_counter() - start
+        self.bytes += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        self.f.close()
+
+    @property
+    def closed(self):
+        return self.f.closed
+
+    def __iter__(self):
+        return iter(self.f)
+
+
+def open_source(source):
+    """
+    Returns a counting reader of the decompressed rows of a gzip compressed
+    source file.
+    """
+    return CountingReader(gzip.open(source, "rb"))
+
+
+def get_instrumented_chunks(chunks, reader, **fields):
+    """
+    Generator that yields all chunks of the given chunk iterator and adds a
+    record for the decompression (the time and bytes of the counting reader)
+    and one for the parsing (the remaining time) of each chunk. A chunk is
+    either a dataframe or a tuple of dataframes. The given fields (e.g. the
+    ticker) and the number of the chunk are added to the records instead of
+    the context, because the chunks may be read ahead in another thread.
+    """
+    chunks = iter(chunks)
+    j = 0
+    while True:
+        seconds, size = reader.seconds, reader.bytes
+        start = time.perf_counter()
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            break
+        elapsed = time.perf_counter() - start
+        rows = sum(len(df) for df in chunk) if isinstance(chunk, tuple) \
+            else len(chunk)
+        add_stage("gzip", reader.seconds - seconds, chunk=j,
+                  bytes=reader.bytes - size, **fields)
+        add_stage("parse", elapsed - reader.seconds + seconds, chunk=j,
+                  rows_out=rows, **fields)
+        j += 1
+        yield chunk
+
+
+def get_summary():
+    """
+    Returns the records of the run summed up per stage as list of
+    dictionaries in the order of the first occurance of each stage.
+    """
+    summary = collections.OrderedDict()
+    for record in records:
+        total = summary.setdefault(record["stage"], {
+            "stage": record["stage"], "calls": 0, "seconds": 0.0,
+            "rows_in": 0, "rows_out": 0, "bytes": 0, "peak_rss": 0})
+        total["calls"] += 1
+        total["seconds"] += record["seconds"]
+        for name in ["rows_in", "rows_out", "bytes"]:
+            total[name] += record.get(name) or 0
+        total["peak_rss"] = max(total["peak_rss"], record["peak_rss"] or 0)
+    return list(summary.values())
+
+
+def print_summary():
+    """
+    Print a table with the time, the share of the total time, the rows in
+    and out, the bytes read and the peak resident memory per stage. Stages
+    with a dot in the name are parts of another stage (e.g. filter.*), so
+    they are not added to the total time.
+    """
+    summary = get_summary()
+    if not summary:
+        return
+    total = sum(row["seconds"] for row in summary
+                if "." not in row["stage"]) or 1.0
+    print("%-32s %7s %10s %6s %12s %12s %10s %9s" % (
+        "stage", "calls", "seconds", "share", "rows in", "rows out", "MB read",
+        "peak MB"))
+    for row in summary:
+        print("%-32s %7d %10.2f %5.1f%% %12d %12d %10.1f %9.1f" % (
+            row["stage"], row["calls"], row["seconds"],
+            row["seconds"] / total * 100, row["rows_in"], row["rows_out"],
+            row["bytes"] / 2 ** 20, row["peak_rss"] / 2 ** 20))
+
+
+class Sampler(threading.Thread):
+    """
+    The Sampler class is a simple sampling profiler. A background thread
+    looks at the stack of the profiled thread in a fixed interval and counts
+    how often each function is executed (self) or on the stack (total).
+    """
+    def __init__(self, thread_id, interval):
+        threading.Thread.__init__(self, daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self.own = collections.Counter()
+        self.total = collections.Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.own[self.get_name(frame)] += 1
+            names = set()
+            while frame is not None:
+                names.add(self.get_name(frame))
+                frame = frame.f_back
+            self.total.update(names)
+
+    def get_name(self, frame):
+        """
+        Returns the name of the function of a frame with file and line.
+        """
+        code = frame.f_code
+        return "%s (%s:%d)" % (code.co_name, code.co_filename,
+                               code.co_firstlineno)
+
+    def get_report(self):
+        """
+        Returns the functions with the most samples as text.
+        """
+        lines = ["%d samples every %.3f seconds" % (
+            self.samples, self.interval),
+            "%7s %7s  %s" % ("self", "total", "function")]
+        for name, count in self.total.most_common(profile_lines):
+            lines.append("%6.1f%% %6.1f%%  %s" % (
+                self.own[name] / max(self.samples, 1) * 100,
+                count / max(self.samples, 1) * 100, name))
+        return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def profile(ticker, target=None):
+    """
+    Context manager that runs the sampling profiler within the block if the
+    given ticker is the ticker of the profile_ticker setting. The report is
+    printed and written to the target file (if given).
+    """
+    if ticker != profile_ticker:
+        yield
+        return
+    sampler = Sampler(threading.get_ident(), profile_interval)
+    sampler.start()
+    try:
+        yield
+    finally:
+        sampler.stopped.set()
+        sampler.join()
+        report = sampler.get_report()
+        print("Profile of ticker " + ticker + ":\n" + report)
+        if target:
+            f = open(target, "w")
+            f.write(report + "\n")
+            f.close()
@@ -0,0 +1,245 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The orderflow module provides an as-of join of trades and quotes that
+attaches the prevailing quote (the last valid quote of the same day in
+front of the trade) to each trade. The join is a merge of two sorted key
+arrays, so the costs are linear in the number of rows and no product of
+trades and quotes is ever built. Based on the prevailing quotes the trades
+are signed with the Lee-Ready algorithm (quote rule with tick test at the
+midpoint) and the effective spread, the signed volume and the order
+imbalance are aggregated per day. The steps are separate functions, so that
+the accumulators module can compute the same measures of days that are
+spread over several chunks.
+
+The numpy package must be installed to use this module. Required package is
+the segments module that is also included in this project.
+"""
+
+import numpy as np
+import Util.segments as segments
+
+# define global settings for the as-of join
+quote_lag = 0 # milliseconds that a quote must precede a trade at least
+              # (a quote must always be older than the trade, so quotes
+              # with the timestamp of the trade never prevail)
+
+NS_PER_MS = 1000000
+
+
+def get_codes(dates, days):
+    """
+    Function maps every date of the given array to the position of the date
+    in the sorted array of distinct days. Since the dates are contiguous only
+    the first date of each run is looked up.
+    """
+    dates = np.asarray(dates)
+    starts, ends = segments.get_segments(dates)
+    return np.repeat(np.searchsorted(days, dates[starts]), ends - starts)
+
+
+def get_day_codes(trade_dates, quote_dates):
+    """
+    Returns the sorted array of the distinct days of trades and quotes and
+    the day codes of the trades and of the quotes (see get_codes()).
+    """
+    days = np.unique(np.concatenate((
+        trade_dates[segments.get_segments(trade_dates)[0]],
+        quote_dates[segments.get_segments(quote_dates)[0]])))
+    return days, get_codes(trade_dates, days), get_codes(quote_dates, days)
+
+
+def get_filled_columns(codes, columns):
+    """
+    Function fills up the null values of each column with the last value
+    before within the same day. Values at the beginning of a day that have
+    no value before stay null. The return value is a dictionary with the
+    filled columns.
+    """
+    starts, ends = segments.get_segments(codes)
+    first = np.repeat(starts, ends - starts)
+    rows = np.arange(len(codes))
+    filled = {}
+    for name, values in columns.items():
+        values = np.asarray(values, dtype=np.float64)
+        last = np.maximum.accumulate(np.where(np.isnan(values), -1, rows)) \
+            if len(values) else rows
+        filled[name] = np.where(last >= first, values[np.maximum(last, 0)],
+                                np.nan)
+    return filled
+
+
+def get_keys(codes, times, base, span):
+    """
+    Returns a key of the day code and the time (integer nanoseconds) of each
+    row that sorts the rows by day and time.
+    """
+    return codes * span + (times - base)
+
+
+def get_prevailing_quotes(trade_codes, trade_times, quote_codes,
+                          quote_times):
+    """
+    Function returns the position of the prevailing quote of each trade, i.e.
+    the last quote of the same day that is at least quote_lag milliseconds
+    older than the trade, or -1 if there isn't any. A quote with the same
+    timestamp as the trade never prevails, even if quote_lag is 0. Both
+    arrays must be sorted by time within each day. The merge is done by a
+    stable sort of the concatenated keys, which is linear in the number of
+    rows if both arrays are sorted runs of keys already.
+    """
+    if len(trade_times) == 0 or len(quote_times) == 0:
+        return np.full(len(trade_times), -1, dtype=np.int64)
+    # the key of each quote is shifted by the lag, a quote with the same
+    # key as a trade prevails (at least one nanosecond, so that a quote is
+    # always older than the trade)
+    lag = max(int(quote_lag * NS_PER_MS), 1)
+    base = min(trade_times.min(), quote_times.min())
+    span = max(trade_times.max(), quote_times.max()) - base + lag + 1
+    keys = np.concatenate((
+        get_keys(quote_codes, quote_times, base, span) + lag,
+        get_keys(trade_codes, trade_times, base, span)))
+    order = np.argsort(keys, kind="stable")
+    # quotes are in front of the trades in the concatenation, so a quote
+    # with the same key as a trade is sorted in front of it
+    is_quote = order < len(quote_times)
+    last = np.maximum.accumulate(np.where(
+        is_quote, np.arange(len(order)), -1))
+    prevailing = np.empty(len(trade_times), dtype=np.int64)
+    prevailing[order[~is_quote] - len(quote_times)] = np.where(
+        last[~is_quote] >= 0, order[np.maximum(last[~is_quote], 0)], -1)
+    same_day = prevailing >= 0
+    same_day[same_day] = quote_codes[prevailing[same_day]] == \
+        trade_codes[same_day]
+    return np.where(same_day, prevailing, -1)
+
+
+def get_tick_signs(codes, prices, last_price=np.nan, last_sign=0):
+    """
+    Function returns the sign of the last price change in front of each
+    trade within the same day (tick test): 1 for an uptick, -1 for a
+    downtick and 0 if the price didn't change since the beginning of the day.
+    If the day of the first trade began in a chunk before, the last price
+    and the last sign of the tick test of this day can be given.
+    """
+    signs = np.zeros(len(prices))
+    if len(prices) > 1:
+        signs[1:] = np.sign(prices[1:] - prices[:-1])
+        signs[1:][codes[1:] != codes[:-1]] = 0
+    if len(prices) and not np.isnan(last_price):
+        signs[0] = np.sign(prices[0] - last_price)
+    rows = np.where(signs != 0, np.arange(len(prices)), -1)
+    last = np.maximum.accumulate(rows) if len(rows) else rows
+    starts, ends = segments.get_segments(codes)
+    first = np.repeat(starts, ends - starts)
+    # trades of the first day without a price change in front of them keep
+    # the sign of the chunk before
+    initial = np.zeros(len(prices))
+    initial[:ends[0] if len(ends) else 0] = last_sign
+    return np.where(last >= first, signs[np.maximum(last, 0)], initial)
+
+
+def get_valid_quotes(quotes):
+    """
+    Returns a mask of the quotes (filled up within each day) with positive
+    prices and sizes on both sides, i.e. the quotes that can prevail.
+    """
+    return (quotes["bid_price"] > 0) & (quotes["bid_size"] > 0) & \
+        (quotes["ask_price"] > 0) & (quotes["ask_size"] > 0)
+
+
+def get_midpoints(quotes, valid, prevailing):
+    """
+    Returns the midpoint of the prevailing quote of each trade (null for
+    trades without prevailing quote). The prevailing quotes are positions
+    within the valid quotes (see get_prevailing_quotes()).
+    """
+    matched = prevailing >= 0
+    mids = np.full(len(prevailing), np.nan)
+    mids[matched] = ((quotes["bid_price"][valid] + quotes["ask_price"][
+        valid]) / 2)[prevailing[matched]]
+    return mids
+
+
+def get_signs(prices, mids, tick_signs):
+    """
+    Function signs the trades with the quote rule and with the tick test for
+    trades at the midpoint (Lee-Ready). Trades without prevailing quote (a
+    null midpoint) are not signed.
+    """
+    matched = ~np.isnan(mids)
+    signs = np.sign(prices - np.where(matched, mids, prices))
+    at_mid = matched & (signs == 0)
+    signs[at_mid] = tick_signs[at_mid]
+    signs[~matched | np.isnan(signs)] = 0
+    return signs
+
+
+def get_daily_sums(codes, prices, volumes, mids, signs):
+    """
+    Function returns the start of the trades of each day and the sums of
+    each day that the measures of the order flow are derived from: the sum
+    of the relative effective spreads, the count of trades with prevailing
+    quote, the signed volume and the volume of all signed trades. The sums
+    of the parts of a day can be added up.
+    """
+    starts, ends = segments.get_segments(codes)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spreads = 2 * np.abs(prices - mids) / mids * 10000
+    matched = ~np.isnan(mids)
+    return starts, {
+        "spreads": segments.get_sums(spreads, starts),
+        "matched": segments.get_sums(matched, starts),
+        "signed_volume": segments.get_sums(signs * volumes, starts),
+        "signed": segments.get_sums(np.where(signs != 0, volumes, 0),
+                                    starts)}
+
+
+def get_measures(sums):
+    """
+    Returns the measures of the order flow per day (the mean relative
+    effective spread, the signed volume and the order imbalance) from the
+    sums of the days (see get_daily_sums()).
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {"eff_spread": np.asarray(sums["spreads"], dtype=np.float64)
+                / sums["matched"],
+                "signed_volume": np.asarray(sums["signed_volume"],
+                                            dtype=np.float64),
+                "order_imbalance": np.asarray(sums["signed_volume"],
+                                              dtype=np.float64) /
+                sums["signed"]}
+
+
+def get_orderflow(trade_dates, trade_times, prices, volumes, quote_dates,
+                  quote_times, quotes):
+    """
+    Calculate the daily measures of the order flow. The quotes are given as
+    dictionary of the columns bid_price, bid_size, ask_price and ask_size.
+    They are filled up within each day and only quotes with positive prices
+    and sizes can prevail. Trades and quotes must be sorted by time within
+    each day and the dates must be contiguous.
+
+    The return value is a tuple of the dates of the trades (in the order of
+    the rows) and a dictionary of arrays with one value per date: the mean
+    relative effective spread (2 * |price - midpoint| / midpoint in basis
+    points) of all trades with a prevailing quote, the signed volume (buys
+    minus sells) and the order imbalance (signed volume divided by the volume
+    of all signed trades).
+    """
+    trade_dates = np.asarray(trade_dates)
+    quote_dates = np.asarray(quote_dates)
+    trade_times = np.asarray(trade_times).view(np.int64)
+    quote_times = np.asarray(quote_times).view(np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    volumes = np.asarray(volumes, dtype=np.float64)
+    days, trade_codes, quote_codes = get_day_codes(trade_dates, quote_dates)
+
+    quotes = get_filled_columns(quote_codes, quotes)
+    valid = get_valid_quotes(quotes)
+    prevailing = get_prevailing_quotes(
+        trade_codes, trade_times, quote_codes[valid], quote_times[valid])
+    mids = get_midpoints(quotes, valid, prevailing)
+    signs = get_signs(prices, mids, get_tick_signs(trade_codes, prices))
+    starts, sums = get_daily_sums(trade_codes, prices, volumes, mids, signs)
+    return days[trade_codes[starts]], get_measures(sums)
@@ -9,7 +9,17 @@ The pandas and numpy packages must be installed to use this module.
 
 import pandas as pd
 import numpy as np
+import io
 import math
+import Util.gzipindex as gzipindex
+import Util.instrumentation as instrumentation
+import Util.orderflow as orderflow
+import Util.columnstore as columnstore
+import Util.bars as bars
+import Util.csvreader as csvreader
+import Util.distribution as distribution
+import Util.segments as segments
+import Util.volatility as volatility
 
 # define global settings for csv reader
 names = ['#RIC', 'Date[G]', 'Time[G]', 'GMT Offset', 'Type',
@@ -24,6 +34,45 @@ na_filter = False
 low_memory = True
 engine = "c"
 converters = None
+csv_backend = "pandas" # "pandas" (c engine, all columns as strings) or
+                       # "arrow" (multi-threaded, typed columns, requires the
+                       # optional pyarrow package)
+# columns of the separate streams of trades and quotes
+stream_columns = [("Trade", ['#RIC', 'Date[G]', 'Time[G]', 'GMT Offset',
+                             'Price', 'Volume', 'Qualifiers']),
+                  ("Quote", ['#RIC', 'Date[G]', 'Time[G]', 'GMT Offset',
+                             'Bid Price', 'Bid Size', 'Ask Price',
+                             'Ask Size'])]
+# names of the typed columns of trades and quotes in the columnar cache
+cache_columns = {"trades": {"Time[G]": "time",
+                            "GMT Offset": "gmt_offset",
+                            "Ex/Cntrb.ID": "exchange",
+                            "Price": "price",
+                            "Volume": "volume",
+                            "Qualifiers": "qualifiers"},
+                 "quotes": {"Time[G]": "time",
+                            "GMT Offset": "gmt_offset",
+                            "Ex/Cntrb.ID": "exchange",
+                            "Bid Price": "bid_price",
+                            "Bid Size": "bid_size",
+                            "Ask Price": "ask_price",
+                            "Ask Size": "ask_size"}}
+sampling_frequency = 10 # seconds between the interpolated log midpoints
+                        # for the realised standard error
+distribution_windows = [1, 10, 60, 300] # seconds per interval for the
+                                        # distribution of trades
+output_format = "csv" # "csv" (one file per venue and kind) or "parquet"
+                      # (partitioned by venue, ticker and month, requires
+                      # the optional pyarrow package)
+parquet_folder = "Aggregationen/" # folder of the parquet files (the csv
+                                  # files are written to the working
+                                  # directory)
+prefetch_depth = 0 # chunks that are read ahead in a background thread while
+                   # the current chunk is aggregated (0 to read in sequence)
+bar_resolutions = [] # seconds per intraday bar of trades and quotes, e.g.
+                     # [60, 300, 1800] (no bars are calculated if empty)
+aggregation_version = 3 # increase whenever the results of the aggregation
+                        # functions change, so that all manifests are reset
 
 
 def f(x):
@@ -96,6 +145,32 @@ def round_time(x):
                         second=round_seconds_down(x.second))
 
 
+def get_milliseconds(times):
+    """
+    Function converts an array of time strings in the format of the Time[G]
+    column (HH:MM:SS.fff with optional further digits) into integer
+    milliseconds since midnight. The digits are read directly from the bytes
+    of the strings, which is much faster than parsing datetimes.
+    """
+    digits = np.asarray(times, dtype="S12").view(np.uint8).reshape(
+        -1, 12).astype(np.int64) - 48
+    digits = np.maximum(digits, 0)
+    return ((digits[:, 0] * 10 + digits[:, 1]) * 3600000 +
+            (digits[:, 3] * 10 + digits[:, 4]) * 60000 +
+            (digits[:, 6] * 10 + digits[:, 7]) * 1000 +
+            digits[:, 9] * 100 + digits[:, 10] * 10 + digits[:, 11])
+
+
+def get_datetimes(milliseconds):
+    """
+    Function converts integer milliseconds since midnight into timestamps on
+    01.01.1900, i.e. the same values that are returned by to_datetime() for
+    the time strings of the Time[G] column.
+    """
+    return pd.Series(np.datetime64("1900-01-01", "ns") + np.asarray(
+        milliseconds, dtype=np.int64).astype("timedelta64[ms]"))
+
+
 def get_dates_with_first_row(source):
     """
     For a given source file the function returns all row numbers of the
@@ -121,10 +196,17 @@ def get_dates_with_first_row(source):
 def get_dataframe_by_rows(source, first_row, last_row):
     """
     Function queries a specific range of a given source file and returns the
-    range as a dataframe.
+    range as a dataframe. If a checkpoint index exists for the source file,
+    only the bytes of the range (starting at the nearest checkpoint) are
+    decompressed.
     """
     skiprows = first_row + 1
     nrows = (last_row - first_row + 1) if last_row > 0 else None
+    if gzipindex.has_index(source):
+        return get_dataframe_by_bytes(
+            gzipindex.read_rows(source, first_row, nrows))
+    if csv_backend == "arrow":
+        return csvreader.read_rows(source, first_row, nrows)
     return pd.read_csv(source, engine="c", header=None, compression="gzip",
                        na_filter=False, nrows=nrows, skiprows=skiprows,
                        names=names, converters=converters,
@@ -139,17 +221,37 @@ def get_dataframe_by_iter(source, iteration):
     """
     skiprows = iteration * rows_limit_per_iter + 1
     nrows = rows_limit_per_iter
+    if gzipindex.has_index(source):
+        return get_dataframe_by_bytes(
+            gzipindex.read_rows(source, skiprows - 1, nrows))
+    if csv_backend == "arrow":
+        return csvreader.read_rows(source, skiprows - 1, nrows)
     return pd.read_csv(source, engine="c", header=None, compression="gzip",
                        na_filter=False, nrows=nrows, skiprows=skiprows,
                        names=names, converters=converters,
                        low_memory=False)
 
 
+def get_dataframe_by_bytes(data):
+    """
+    Function parses raw rows (without header) that are given as bytes, e.g.
+    the rows that are read via a checkpoint index, and returns them as a
+    dataframe.
+    """
+    if csv_backend == "arrow":
+        return csvreader.read_bytes(data)
+    return pd.read_csv(io.BytesIO(data), engine="c", header=None,
+                       na_filter=False, names=names, converters=converters,
+                       low_memory=False)
+
+
 def get_dataframe_by_chunks(source):
     """
     Function reads the whole source file with the build-in chunk iterator.
     The source file is returned as a dataframe.
     """
+    if csv_backend == "arrow":
+        return csvreader.get_chunks(source, rows_limit_per_iter)
     return pd.read_csv(source, engine="c", iterator=True,
                        chunksize=rows_limit_per_iter, header=None,
                        skiprows=1, compression="gzip", na_filter=False,
@@ -157,6 +259,138 @@ def get_dataframe_by_chunks(source):
                        low_memory=False)
 
 
+def get_dataframes_by_type(df):
+    """
+    Function splits a dataframe with raw data into two separate dataframes,
+    each one for trades and quotes, that contain only the columns of the
+    respective stream. All rows of other types are dropped.
+    """
+    types = df["Type"].values
+    return tuple(df.loc[types == type_name, columns]
+                 for type_name, columns in stream_columns)
+
+
+def get_dataframes_by_chunks(source):
+    """
+    Function reads the whole source file in chunks like the
+    get_dataframe_by_chunks() function, but returns a tuple of two separate
+    dataframes for trades and quotes per chunk. Columns that are not required
+    by any stream are not parsed at all. The index of the dataframes contains
+    the row numbers in the source file. The source may also be a binary file
+    object of the decompressed rows.
+    """
+    if csv_backend == "arrow":
+        yield from csvreader.get_chunks_by_type(
+            source, rows_limit_per_iter, stream_columns)
+        return
+    usecols = ["Type"]
+    for type_name, columns in stream_columns:
+        usecols += [col for col in columns if col not in usecols]
+    for df in pd.read_csv(source, engine="c", iterator=True,
+                          chunksize=rows_limit_per_iter, header=None,
+                          skiprows=1, na_filter=False, compression="gzip"
+                          if isinstance(source, str) else None,
+                          names=names, usecols=usecols, converters=converters,
+                          low_memory=False):
+        yield get_dataframes_by_type(df)
+
+
+def get_typed_columns(df, kind):
+    """
+    Function converts all rows of one kind (trades or quotes) and one day of
+    raw data into a dictionary of typed numpy arrays as they are stored in the
+    columnar cache. Times are converted into integer milliseconds, strings
+    into dictionary encoded integer codes and all other columns into numbers.
+    Sizes are kept as integers if there are no empty values.
+    """
+    columns = {}
+    for col, name in cache_columns[kind].items():
+        if col == "Time[G]" and csvreader.is_typed(df):
+            columns[name] = df[col].values.astype(np.int32)
+        elif col == "Time[G]":
+            columns[name] = get_milliseconds(df[col].values).astype(np.int32)
+        elif col == "GMT Offset":
+            columns[name] = pd.to_numeric(df[col]).values.astype(np.int8)
+        elif col in ["Ex/Cntrb.ID", "Qualifiers"]:
+            columns[name], columns[name + ".categories"] = \
+                columnstore.encode_strings(df[col].values)
+        else:
+            values = pd.to_numeric(df[col], errors="coerce").values
+            if col in ["Volume", "Bid Size", "Ask Size"] and not np.isnan(
+                    values.astype(np.float64)).any():
+                values = values.astype(np.int64)
+            columns[name] = values.astype(np.float64) \
+                if values.dtype.kind != "i" else values
+    return columns
+
+
+def save_day_to_cache(df, folder, ticker, position):
+    """
+    Function saves all trades and quotes of one day of raw data as two typed
+    partitions in the columnar cache. The position is the row number of the
+    first row of the day in the source file.
+    """
+    date = str(df["Date[G]"].iloc[0])
+    for kind, type_name in [("trades", "Trade"), ("quotes", "Quote")]:
+        df_kind = df[df["Type"] == type_name]
+        columnstore.write_partition(
+            columnstore.get_partition_folder(folder, ticker, date, kind),
+            get_typed_columns(df_kind, kind),
+            {"ric": str(df["#RIC"].iloc[0]), "date": date,
+             "position": position, "rows": len(df_kind)})
+
+
+def convert_source_to_cache(source, folder, ticker):
+    """
+    Function reads the whole source file once and saves the trades and quotes
+    of every day in the columnar cache. The rows of a day that is split
+    between two chunks are kept until the day is complete.
+    """
+    df_tail = pd.DataFrame()
+    position = 0
+    for df in get_dataframe_by_chunks(source):
+        df = concat_dfs(df_tail, df)
+        dates = df["Date[G]"].values
+        changes = np.flatnonzero(dates[1:] != dates[:-1]) + 1
+        starts = np.concatenate(([0], changes))
+        ends = np.concatenate((changes, [len(df)]))
+        for k in range(len(starts) - 1):
+            save_day_to_cache(df.iloc[starts[k]:ends[k]], folder, ticker,
+                              position)
+            position += int(ends[k] - starts[k])
+        df_tail = df.iloc[starts[-1]:]
+    if not df_tail.empty:
+        save_day_to_cache(df_tail, folder, ticker, position)
+
+
+def get_dataframe_by_partitions(folder, ticker, dates, kind):
+    """
+    Function loads the memory-mapped partitions of a ticker for the given
+    dates and one kind (trades or quotes) from the columnar cache. The result
+    is a dataframe with the same column names as the raw data, but with typed
+    values. The Time[G] column contains integer milliseconds.
+    """
+    parts = []
+    for date in dates:
+        path = columnstore.get_partition_folder(folder, ticker, date, kind)
+        meta = columnstore.read_meta(path)
+        columns = columnstore.read_partition(path)
+        part = {"#RIC": np.repeat(meta["ric"], meta["rows"]).astype(object),
+                "Date[G]": np.repeat(date, meta["rows"]).astype(object)}
+        for col, name in cache_columns[kind].items():
+            if name + ".categories" in columns:
+                part[col] = pd.Categorical.from_codes(
+                    np.asarray(columns[name]),
+                    np.asarray(columns[name + ".categories"]))
+            else:
+                part[col] = np.asarray(columns[name])
+        parts.append(pd.DataFrame(part))
+    if not parts:
+        return pd.DataFrame(columns=["#RIC", "Date[G]"] + list(
+            cache_columns[kind]))
+    return pd.concat(parts, ignore_index=True)
+
+
 def get_empty_aggregation_trades():
     """
     Returns an empty dataframe with predefined columns that are required for
@@ -174,7 +408,10 @@ def get_empty_aggregation_trades():
         'Open': [],
         'Close': [],
         'High': [],
-        'Low': []
+        'Low': [],
+        'eff_spread': [],
+        'signed_volume': [],
+        'order_imbalance': []
     })
 
 
@@ -198,26 +435,142 @@ def get_empty_aggregation_quotes():
     })
 
 
-def get_dataframe_with_shifted_column(df, col_to_shift, new_col_name,
-                                      forward=True, drop_bod_eod_value=True):
+def get_empty_bars_trades():
     """
-    Function manipulates a given dataframe while it adds a new column that
-    corresponds to an existing column with a given name. All values of this
-    column will be shifted up or down by one row. The name of the new column
-    must be given as well. If drop_bod_eod_value is set to True all values
-    that are shifted from a record with different date will be set dropped
-    (set to Null). This functionality prevents jumps within the values between
-    two days.
+    Returns an empty dataframe with predefined columns for the intraday bars
+    of trades.
     """
-    df[new_col_name] = df[col_to_shift].shift(-1 if forward else 1)
-    if drop_bod_eod_value:
-        if forward:
-            bod_eod = df.groupby("Date[G]").tail(1).index.tolist()
-        else:
-            bod_eod = df.groupby("Date[G]").head(1).index.tolist()
-        for row in bod_eod:
-            df.at[row, new_col_name] = np.NaN
-    return df
+    return pd.DataFrame({
+        'ticker': [],
+        'date': [],
+        'time': [],
+        'N': [],
+        'V': [],
+        'X': [],
+        'Open': [],
+        'High': [],
+        'Low': [],
+        'Close': []
+    })
+
+
+def get_empty_bars_quotes():
+    """
+    Returns an empty dataframe with predefined columns for the intraday bars
+    of quotes.
+    """
+    return pd.DataFrame({
+        'ticker': [],
+        'date': [],
+        'time': [],
+        'N': [],
+        'bid_price': [],
+        'bid_size': [],
+        'ask_price': [],
+        'ask_size': [],
+        'rel_spread': []
+    })
+
+
+def get_new_bars_trades(df, bod, eod):
+    """
+    Calculate the intraday bars of trades for all resolutions of the
+    bar_resolutions setting at once. The bars are aligned with the given
+    beginning of the trading hours (bod) and the last bar ends with the eod.
+    The return value is a dictionary with one dataframe per resolution that
+    has the same structure as the get_empty_bars_trades() function returns.
+    """
+    days, result = bars.get_trade_bars(
+        df["Date[G]"].values, df["Time[G]"].values, df["Price"].values,
+        df["Volume"].values, bod.value, eod.value, bar_resolutions)
+    frames = {}
+    for seconds, columns in result.items():
+        frames[seconds] = pd.DataFrame({
+            'ticker': df["#RIC"].iloc[columns["last"]].tolist(),
+            'date': days[columns["day"]].tolist(),
+            'time': bars.get_bar_times(columns["bar"], bod.value, seconds),
+            'N': columns["N"].tolist(),
+            'V': columns["V"].tolist(),
+            'X': columns["X"].tolist(),
+            'Open': columns["Open"].tolist(),
+            'High': columns["High"].tolist(),
+            'Low': columns["Low"].tolist(),
+            'Close': columns["Close"].tolist()
+        })
+    return frames
+
+
+def get_new_bars_quotes(df, bod, eod):
+    """
+    Calculate the intraday bars of quotes for all resolutions of the
+    bar_resolutions setting at once. Like in the aggregation of quotes all
+    prices and sizes are filled up with the last value before and only
+    quotes with positive prices and sizes are taken into account. The prices,
+    sizes and relative spreads are weighted with the time in which a quote
+    is valid within the bar. The return value is a dictionary with one
+    dataframe per resolution that has the same structure as the
+    get_empty_bars_quotes() function returns. The given dataframe is not
+    changed.
+    """
+    cols = ["Bid Price", "Bid Size", "Ask Price", "Ask Size"]
+    filled = df[cols].fillna(method="ffill")
+    valid = ((filled > 0).all(axis=1)).values
+    bid, ask = filled["Bid Price"].values, filled["Ask Price"].values
+    days, result = bars.get_quote_bars(
+        df["Date[G]"].values[valid], df["Time[G]"].values[valid], {
+            "bid_price": bid[valid],
+            "bid_size": filled["Bid Size"].values[valid],
+            "ask_price": ask[valid],
+            "ask_size": filled["Ask Size"].values[valid],
+            "rel_spread": ((ask - bid) / ((ask + bid) / 2) * 10000)[valid]},
+        bod.value, eod.value, bar_resolutions)
+    tickers = df["#RIC"].values[valid]
+    frames = {}
+    for seconds, columns in result.items():
+        frames[seconds] = pd.DataFrame({
+            'ticker': tickers[columns["last"]].tolist(),
+            'date': days[columns["day"]].tolist(),
+            'time': bars.get_bar_times(columns["bar"], bod.value, seconds),
+            'N': columns["N"].tolist(),
+            'bid_price': columns["bid_price"].tolist(),
+            'bid_size': columns["bid_size"].tolist(),
+            'ask_price': columns["ask_price"].tolist(),
+            'ask_size': columns["ask_size"].tolist(),
+            'rel_spread': columns["rel_spread"].tolist()
+        })
+    return frames
+
+
+def get_shifted_columns(df, shifts, differences=False):
+    """
+    Function shifts several columns of a dataframe by several numbers of rows
+    at once. The shifts are given as a list of tuples of the column name and
+    the number of rows (positive numbers refer to the rows before, negative
+    numbers to the rows after). All values that would be shifted from a record
+    with different date are set to Null. This functionality prevents jumps
+    within the values between two days. If differences is set to True the
+    differences to the shifted values are returned instead. The return value
+    is a dictionary with the tuples as keys and numpy arrays as values, the
+    dataframe itself is not changed.
+    """
+    starts, ends = segments.get_segments(df["Date[G]"].values)
+    positions, lengths = segments.get_positions(starts, ends)
+    if differences:
+        function = segments.get_differences
+    else:
+        function = segments.get_shifted
+    return {(column, periods): function(df[column].values, positions,
+                                        lengths, periods)
+            for column, periods in shifts}
+
+
+def get_time_delta(df):
+    """
+    Returns the time delta of each row to the next row of the same day in
+    milliseconds. The time delta of the last row of each day is Null.
+    """
+    return -get_shifted_columns(df, [("Time[G]", -1)], True)[
+        ("Time[G]", -1)] / 1000000
 
 
 def get_new_aggregation_quotes(df):
@@ -227,10 +580,8 @@ def get_new_aggregation_quotes(df):
     function returns. The number of rows correlates to the number of distinct
     dates that are included in the input dataframe.
     """
-    # get shifted time column to calculate the time delta 
-    df = get_dataframe_with_shifted_column(df, "Time[G]", "Time[G]+1")
-    df["Time delta"] = (df["Time[G]+1"] - df["Time[G]"]).astype(
-        'timedelta64[ms]')
+    # get the time delta to the next quote of the same day
+    df["Time delta"] = get_time_delta(df)
 
     # fillup all prices and sizes with the last value before
     df["Bid Price"] = df["Bid Price"].fillna(method="ffill")
@@ -261,79 +612,15 @@ def get_new_aggregation_quotes(df):
     df["Log midpoint"] = (df["Log Bid"] + df["Log Ask"]) / 2
 
     grouped = df.groupby("Date[G]")
-    days = list(grouped.groups.keys())
-
-    opening = grouped["Time[G]"].agg(lambda x: x.iloc[0])
-    closing = grouped["Time[G]"].agg(lambda x: x.iloc[-1])
 
-    time_even = pd.DataFrame(
-        {"Date[G]": [],
-         "Time[G]": [],
-         "Log midpoint": []})
-
-    # calculate a dataframe that contains a timestamp every "even" 10 seconds
+    # calculate the realised standard error of the log midpoints that are
+    # interpolated for every "even" sampling interval (10 seconds by default)
     # within the period of trading hours for each day
-    for day in days:
-        day_open = pd.Timestamp(
-            year=1900,
-            month=1,
-            day=1,
-            hour=opening[day].hour,
-            minute=opening[day].minute,
-            second=round_seconds_up(
-                opening[day].second,
-                in_range=True))
-        day_close = pd.Timestamp(
-            year=1900,
-            month=1,
-            day=1,
-            hour=closing[day].hour,
-            minute=closing[day].minute,
-            second=round_seconds_down(
-                closing[day].second))
-        ten_sec_series = pd.date_range(day_open, day_close, freq="10S").values
-        time_even_day = pd.DataFrame(
-            {"Date[G]": day,
-             "Time[G]": ten_sec_series,
-             "Log midpoint": np.nan})
-        time_even = time_even.append(time_even_day, ignore_index=True)
-
-    time_all = pd.concat(
-        [df[["Date[G]", "Time[G]", "Log midpoint"]], time_even],
-        ignore_index=True)
-    time_all = time_all.sort_values(["Date[G]", "Time[G]"])
-    realised_stderr = []
-
-    # calculate the interpolated log midpoint for all timestamps in time_all
-    # to get the standard error for every day finally and append it to a list
-    for day in days:
-        # save all midpoints of one day in a new series inclusive all even
-        # timestamps with null values
-        logs = pd.Series(
-            time_all.loc[time_all['Date[G]'] == day]["Log midpoint"].values,
-            index=time_all.loc[time_all['Date[G]'] == day]["Time[G]"])
-        # drop all duplicates for same millisecond
-        # (keep last occurance of each millisecond)
-        logs = logs.groupby(logs.index).last()
-        # intepolate all midpoints for even timestamps
-        logs.interpolate(method="time", limit_area="inside", inplace=True)
-        # prepare a new dataframe with same columns for merging with time_even
-        time_even_day = pd.DataFrame(
-            {"Date[G]": day,
-             "Time[G]": logs.index.values,
-             "Log midpoint": logs.values})
-        # extract only the midpoints for even timestamps and drop all the
-        # others
-        time_even_day = pd.merge(
-            time_even, time_even_day, on=[
-                "Date[G]", "Time[G]"])
-        # keep only the the log midpoint column
-        time_even_day = time_even_day['Log midpoint_y']
-        # drop consecutive duplicates (with variance of zero)
-        time_even_day = time_even_day.loc[time_even_day.shift(
-        ) != time_even_day]
-        # compute realised standard error and append result to list
-        realised_stderr.append(np.std(time_even_day))
+    with instrumentation.stage("aggregate_quotes.realized_stderr", len(df)):
+        realised_stderr = volatility.get_realized_stderr(
+            df["Date[G]"].values, df["Time[G]"].values,
+            df["Log midpoint"].values,
+            [sampling_frequency])[1][sampling_frequency].tolist()
 
     ticker = grouped["#RIC"].agg(lambda x: x.iloc[-1])
     sigma_s = grouped["Absolute spread"].agg([np.std])["std"]
@@ -373,49 +660,175 @@ def get_new_aggregation_trades(df):
     dataframe has the same structure as the get_empty_aggregation_trades()
     function returns. The number of rows correlates to the number of distinct
     dates that are included in the input dataframe.
-    """
-    df = get_dataframe_with_shifted_column(df, "Price", "Price-1",
-                                           forward=False)
-    df = get_dataframe_with_shifted_column(df, "Time[G]", "Time[G]+1")
 
-    df["V"] = df["Price"] * df["Volume"]
-    df["Return"] = df["Price"] / df["Price-1"]
-    df["Time delta"] = (df["Time[G]+1"] - df["Time[G]"]).astype(
-        'timedelta64[ms]')
-    df["Time delta * P"] = df["Time delta"] * df["Price"]
-
-    grouped = df.groupby("Date[G]")
-
-    ticker = grouped["#RIC"].agg(lambda y: y.iloc[-1])
-    v = grouped["V"].agg([np.sum])["sum"]
-    sigma_r = grouped["Return"].agg([np.std])["std"]
-    sigma_p = grouped["Price"].agg([np.std])["std"]
-    x = grouped["Volume"].agg([np.sum])["sum"]
-    p = grouped["Time delta * P"].agg([np.sum])["sum"] \
-        / grouped["Time delta"].agg([np.sum])["sum"]
-    p_open = grouped["Price"].agg(lambda y: y.iloc[0])
-    p_close = grouped["Price"].agg(lambda y: y.iloc[-1])
-    p_high = grouped["Price"].agg([np.amax])["amax"]
-    p_low = grouped["Price"].agg([np.amin])["amin"]
-    date = grouped["Date[G]"].agg(lambda y: y.iloc[-1])
-    n_trades = grouped["#RIC"].agg(lambda y: len(y))
+    Since the rows of each date are contiguous, all columns are computed by
+    segmented reductions on the start offsets of the dates instead of
+    grouping the dataframe. The dates are in sorted order like the groups of
+    a pandas groupby.
+    """
+    days, codes = segments.factorize_dates(df["Date[G]"].values)
+    if len(codes) and np.any(codes[1:] < codes[:-1]):
+        df = df.iloc[np.argsort(codes, kind="mergesort")]
+        codes = np.sort(codes, kind="mergesort")
+    starts, ends = segments.get_segments(codes)
+    last = ends - 1
+
+    price = df["Price"].values.astype(np.float64)
+    volume = df["Volume"].values
+    times = df["Time[G]"].values.view(np.int64)
+
+    # returns and time deltas refer to the previous or next trade of the same
+    # day, the first return and the last time delta of each day are Null
+    returns = np.full(len(price), np.nan)
+    delta = np.zeros(len(price))
+    if len(price):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns[1:] = price[1:] / price[:-1]
+        delta[:-1] = np.diff(times) / 1000000
+    returns[starts] = np.nan
+    delta[last] = 0
+
+    p_high, p_low = segments.get_extrema(price, starts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = segments.get_sums(delta * price, starts) / segments.get_sums(
+            delta, starts)
 
     return pd.DataFrame({
-        'ticker': ticker.tolist(),
-        'date': date.tolist(),
-        'V': v.tolist(),
-        'sigma_r': sigma_r.tolist(),
-        'sigma_p': sigma_p.tolist(),
+        'ticker': df["#RIC"].iloc[last].tolist(),
+        'date': df["Date[G]"].iloc[last].tolist(),
+        'V': segments.get_sums(price * volume, starts).tolist(),
+        'sigma_r': segments.get_stds(returns, starts, ends).tolist(),
+        'sigma_p': segments.get_stds(price, starts, ends).tolist(),
         'P': p.tolist(),
-        'N': n_trades.tolist(),
-        'X': x.tolist(),
-        'Open': p_open.tolist(),
-        'Close': p_close.tolist(),
+        'N': (ends - starts).tolist(),
+        'X': segments.get_sums(volume, starts).tolist(),
+        'Open': price[starts].tolist(),
+        'Close': price[last].tolist(),
         'High': p_high.tolist(),
         'Low': p_low.tolist()
     })
 
 
+def get_new_aggregation_orderflow(df_trades, df_quotes):
+    """
+    Calculate the measures of the order flow per day that require the
+    prevailing quote of each trade (as-of join of trades and quotes of the
+    same day), i.e. the effective spread, the signed volume and the order
+    imbalance. The return value is a dataframe with the date and these
+    columns, sorted by date. The given dataframes are not changed.
+    """
+    dates, columns = orderflow.get_orderflow(
+        df_trades["Date[G]"].values, df_trades["Time[G]"].values,
+        df_trades["Price"].values, df_trades["Volume"].values,
+        df_quotes["Date[G]"].values, df_quotes["Time[G]"].values, {
+            "bid_price": df_quotes["Bid Price"].values,
+            "bid_size": df_quotes["Bid Size"].values,
+            "ask_price": df_quotes["Ask Price"].values,
+            "ask_size": df_quotes["Ask Size"].values})
+    return pd.DataFrame({
+        'date': dates.tolist(),
+        'eff_spread': columns["eff_spread"].tolist(),
+        'signed_volume': columns["signed_volume"].tolist(),
+        'order_imbalance': columns["order_imbalance"].tolist()
+    }).sort_values("date", kind="mergesort")
+
+
+def add_aggregation_orderflow(aggregation_trades, aggregation_orderflow):
+    """
+    Returns the aggregation of trades with the columns of the order flow of
+    the same dates. Dates without order flow get Null values.
+    """
+    return aggregation_trades.merge(aggregation_orderflow, on="date",
+                                    how="left")
+
+
+def get_selected_rows(df, tickers=None, first_date=None, last_date=None):
+    """
+    Returns the rows of an aggregation of the given tickers within the given
+    range of dates (both inclusive). Dates are given in the format of the
+    aggregations, e.g. "01-JAN-2018".
+    """
+    mask = np.ones(len(df), dtype=bool)
+    if tickers is not None:
+        mask &= df["ticker"].isin(list(tickers)).values
+    if first_date is not None or last_date is not None:
+        dates = pd.to_datetime(df["date"], format="%d-%b-%Y").values
+        for date, limit in [(first_date, np.greater_equal),
+                            (last_date, np.less_equal)]:
+            if date is not None:
+                mask &= limit(dates, np.datetime64(pd.to_datetime(
+                    date, format="%d-%b-%Y")))
+    return df.loc[mask]
+
+
+def get_sorted_rows(df, tickers):
+    """
+    Returns the rows of an aggregation sorted by the given order of the
+    tickers (other tickers at the end) and by date. The sort is stable, so
+    the rows of one ticker and day (e.g. intraday bars) keep their order.
+    """
+    ranks = pd.Series(np.arange(len(tickers)), index=list(tickers))
+    keys = pd.DataFrame({
+        "ticker": df["ticker"].map(ranks).fillna(len(tickers)).values,
+        "date": pd.to_datetime(df["date"], format="%d-%b-%Y").values})
+    order = np.lexsort((keys["date"].values, keys["ticker"].values))
+    return df.iloc[order].reset_index(drop=True)
+
+
+def get_merged_container(trades, quotes, excluded_tickers,
+                         drop_crossed=True):
+    """
+    Function merges the aggregations of trades and quotes (of one or more
+    trading venues with the venue in the column marketplace) on ticker and
+    date into one panel. Columns that exist in both aggregations get the
+    suffix .x (trades) or .y (quotes) like with merge() in R, e.g. N.x and
+    N.y. The excluded tickers are dropped before the merge and, if desired,
+    all days with a negative spread in average.
+    """
+    keys = ["ticker", "date", "marketplace"]
+    trades = trades.loc[~trades["ticker"].isin(excluded_tickers).values]
+    quotes = quotes.loc[~quotes["ticker"].isin(excluded_tickers).values]
+    container = pd.merge(trades, quotes, how="inner", on=keys,
+                         suffixes=(".x", ".y"), sort=False)
+    if drop_crossed:
+        container = container.loc[(container["bid_price"] <
+                                   container["ask_price"]).values]
+    return container[keys + [col for col in container.columns
+                              if col not in keys]].reset_index(drop=True)
+
+
+def add_invariance_variables(container):
+    """
+    Function adds the trading activity W (traded value V times the
+    volatility sigma_m_log) and the labels of each row to a merged panel:
+    the month (YYYY-MM), the stock and the venue as parts of the ticker (the
+    venues AS and BR belong to PA), the market ("Primary" for the regulated
+    markets DE and PA or else "MTF") and the index as first word of the
+    marketplace (e.g. "DAX"). The labels are derived from the distinct
+    tickers, dates and marketplaces only.
+    """
+    container["W"] = container["sigma_m_log"].values * \
+        container["V"].values
+    codes, dates = pd.factorize(container["date"])
+    container["month"] = pd.to_datetime(
+        pd.Series(dates), format="%d-%b-%Y").dt.strftime("%Y-%m").values[
+            codes]
+    codes, tickers = pd.factorize(container["ticker"])
+    parts = [str(ticker).split(".", 1) + [""] for ticker in tickers]
+    stocks = np.array([part[0] for part in parts], dtype=object)
+    venues = np.array([{"AS": "PA", "BR": "PA"}.get(part[1], part[1])
+                       for part in parts], dtype=object)
+    container["stock"] = stocks[codes]
+    container["venue"] = venues[codes]
+    container["market"] = np.where(np.isin(venues, ["DE", "PA"]),
+                                   "Primary", "MTF").astype(object)[codes]
+    codes, marketplaces = pd.factorize(container["marketplace"])
+    container["index"] = np.array([str(marketplace).split(" ", 1)[0]
+                                   for marketplace in marketplaces],
+                                  dtype=object)[codes]
+    return container
+
+
 def concat_dfs(df1, df2):
     """
     Concatenate two given dataframes to one.
@@ -425,98 +838,55 @@ def concat_dfs(df1, df2):
 
 def get_distribution(df, seconds):
     """
-    Function iterates through all days included in the given dataframe and
-    calls the function that calculates the distribution for a specific day.
-    The return value is a pandas series in which the index correlates with the
-    number of events in the interval of the given number of seconds. The value
-    corresponds to the occurances of intervals with exact this number of
-    events. The series contains all aggregated distributions of all days wihtin
-    the given dataframe.
+    Function calculates the distribution of events for all days included in
+    the given dataframe. The return value is a pandas series in which the
+    index correlates with the number of events in the interval of the given
+    number of seconds. The value corresponds to the occurances of intervals
+    with exact this number of events. The series contains all aggregated
+    distributions of all days wihtin the given dataframe.
     """
-    grouped = df.groupby("Date[G]")
-    days = list(grouped.groups.keys())
-    distributions = pd.Series([])
-    for day in days:
-        # the pandas.Series.add() function with fill_value of 0 sums up the
-        # value of the added series with the value of the same index of the
-        # existing series (if this index exists already)
-        distributions = distributions.add(
-            get_distribution_per_day(df, seconds, day), fill_value=0)
-    return distributions
-
-
-def get_distribution_per_day(df, seconds, date):
-    """
-    Function calculates the distribution of events within the given dataframe
-    and on a given day. The length of the interval in which the events are
-    counted can be set with the seconds parameter. The returning value is a
-    pandas series in which the index correlates with the number of events in
-    the interval of the given number of seconds. The value corresponds to the
-    occurances of intervals with exact this number of events.
-    """
-    df = df[df["Date[G]"] == date]
-    # first add day difference between 01.01.1900 (date of field Time[G]) and
-    # 01.01.1970 (default origin of to_timedelta function) to the time field
-    # field to get the time difference in time only (without difference in
-    # days)
-    df["Time[G]_today"] = df["Time[G]"] + pd.Timedelta("25567 days")
-    df["groupby_intervall"] = pd.to_timedelta(df["Time[G]_today"])
-    df["groupby_intervall"] = (
-        df["groupby_intervall"].dt.total_seconds().astype(int))
-    df["groupby_intervall"] = (
-        df["groupby_intervall"] / seconds).apply(np.floor)
-    
-    opening = df["Time[G]"].iloc[0]
-    closing = df["Time[G]"].iloc[-1]
-    day_open = pd.Timestamp(
-        year=1900,
-        month=1,
-        day=1,
-        hour=opening.hour,
-        minute=opening.minute + int(
-            np.floor(
-                round_seconds_up(
-                    opening.second,
-                    seconds) / 60)),
-        second=round_seconds_up(
-            opening.second,
-            seconds) if seconds < 60 else 0)
-    day_close = pd.Timestamp(
-        year=1900,
-        month=1,
-        day=1,
-        hour=closing.hour,
-        minute=closing.minute,
-        second=round_seconds_down(
-            closing.second,
-            seconds))
-    df.loc[df["groupby_intervall"] ==
-           df["groupby_intervall"].iloc[0], "groupby_intervall"] = np.nan
-    df.loc[df["groupby_intervall"] ==
-           df["groupby_intervall"].iloc[-1], "groupby_intervall"] = np.nan
-    df = df[~np.isnan(df["groupby_intervall"])]
-    grouped = df.groupby("groupby_intervall")
-    counter = grouped.size().value_counts()
-
-    interval_series = pd.date_range(
-        day_open, day_close, freq=(
-            str(seconds) + "S")).values
-    time_even_day = pd.DataFrame(
-        {"Date[G]": date,
-         "Time[G]": interval_series,
-         "groupby_intervall": np.nan})
-    time_all = pd.concat(
-        [df[["Date[G]", "Time[G]", "groupby_intervall"]], time_even_day],
-        ignore_index=True)
-    time_all = time_all.sort_values(["Date[G]", "Time[G]"])
-    counter_zero_intervals = 0
-    for j in range(len(time_all) - 1):
-        if np.isnan(time_all["groupby_intervall"].iloc[j]) and np.isnan(
-                time_all["groupby_intervall"].iloc[j + 1]):
-            counter_zero_intervals += 1
-    counter[0] = counter_zero_intervals
-
-    return counter
+    histogram = distribution.get_histograms(
+        df["Date[G]"].values, df["Time[G]"].values, [seconds])[seconds]
+    return get_distribution_by_histogram(histogram)
+
+
+def get_distribution_by_histogram(histogram):
+    """
+    Returns a pandas series of a histogram array that contains only the
+    observed numbers of events (and the intervals without any event).
+    """
+    observed = (histogram > 0) | (np.arange(len(histogram)) == 0)
+    return pd.Series(histogram[observed], index=np.flatnonzero(observed))
+
+
+def get_histograms_by_distributions(df):
+    """
+    Function converts the distributions in long format (see
+    get_empty_distributions()) into a dictionary with one histogram array
+    per ticker, date and window length.
+    """
+    histograms = {}
+    for (ticker, date, seconds), group in df.groupby(
+            ["ticker", "date", "window"], sort=False):
+        events = group["events"].values.astype(np.int64)
+        histogram = np.zeros(events.max() + 1, dtype=np.int64)
+        histogram[events] = group["frequency"].values
+        histograms[(str(ticker), str(date), int(seconds))] = histogram
+    return histograms
+
+
+def get_empty_distributions():
+    """
+    Returns an empty dataframe with predefined columns for the distributions
+    of events per ticker, date and window length in long format.
+    """
+    return pd.DataFrame({
+        'ticker': [],
+        'date': [],
+        'window': [],
+        'events': [],
+        'frequency': []
+        })
 
 
 def convert_column_to_numeric(df, col_name):
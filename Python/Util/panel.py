@@ -0,0 +1,209 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The panel module provides a batched estimator of the fixed effects panel
+regressions (the within model of plm) that are done in panel regression.R.
+The regressor and the dependent variables of all six models are demeaned by
+entity (the ticker) and optionally by time (the date) with grouped sums that
+are computed once per sample for all models, so that the within regressions
+of all models are solved at once. The samples (e.g. the combinations of
+venue and index) can be estimated in parallel by a pool of worker processes.
+
+Besides the classical standard errors cluster-robust standard errors (by
+entity or by time) are available, which need only one more grouped sum of
+the scores per model.
+
+The numpy and pandas packages must be installed to use this module. Required
+package is the regression module that is also included in this project.
+"""
+
+import concurrent.futures
+import numpy as np
+import pandas as pd
+import Util.regression as regression
+
+# define global settings for the panel regressions
+effect = "individual" # "individual" (fixed effects of the entities like the
+                      # within model of plm) or "twoways" (entities and time)
+cluster = None # None for classical standard errors, "entity" or "time" for
+               # cluster-robust standard errors (like vcovHC() of plm with
+               # the arellano method and type HC0)
+demean_iterations = 100 # maximum alternating projections of twoways effects
+demean_tolerance = 1e-12
+
+
+def get_group_sums(codes, count, values):
+    """
+    Function returns the sums of each column of a 2-dimensional array per
+    group, where codes (integers from 0 to count - 1) are the groups of the
+    rows. The return value has one row per group.
+    """
+    return np.column_stack([np.bincount(codes, weights=values[:, j],
+                                        minlength=count)
+                            for j in range(values.shape[1])])
+
+
+def get_demeaned(values, valid, codes, count):
+    """
+    Function subtracts the mean of each group from the valid values of each
+    column (values that are not valid are zero and stay zero). The grouped
+    sums are calculated for all columns at once.
+    """
+    sums = get_group_sums(codes, count, values)
+    counts = get_group_sums(codes, count, valid.astype(np.float64))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = np.where(counts > 0, sums / counts, 0)
+    return np.where(valid, values - means[codes], 0)
+
+
+def get_within_values(values, valid, entities, times):
+    """
+    Function applies the within transformation to each column: the values
+    are demeaned by entity or, if the times are given, by entity and time.
+    For unbalanced panels the two-way transformation is done with
+    alternating projections until the values don't change anymore.
+    """
+    count_entities = entities.max() + 1 if len(entities) else 0
+    values = get_demeaned(values, valid, entities, count_entities)
+    if times is None:
+        return values
+    count_times = times.max() + 1 if len(times) else 0
+    scale = max(np.abs(values).max() if values.size else 0, 1)
+    for i in range(demean_iterations):
+        demeaned = get_demeaned(get_demeaned(
+            values, valid, times, count_times), valid, entities,
+            count_entities)
+        change = np.abs(demeaned - values).max() if values.size else 0
+        values = demeaned
+        if change <= demean_tolerance * scale:
+            break
+    return values
+
+
+def get_counts_of_groups(codes, valid):
+    """
+    Returns the number of groups with at least one valid row per column.
+    """
+    count = codes.max() + 1 if len(codes) else 0
+    return (get_group_sums(codes, count, valid.astype(np.float64)) >
+            0).sum(axis=0)
+
+
+def get_within_regressions(entities, times, x, ys, clusters=None):
+    """
+    Function solves the within regressions y = a * x + fixed effects of
+    several dependent variables (the columns of ys) at once. The entities
+    and times are integer codes of the rows (times may be None for fixed
+    effects of the entities only). Rows with a value that is not finite are
+    left out per model. If clusters (integer codes of the rows) are given,
+    the standard errors are cluster-robust.
+
+    The return value is a dictionary with one array per measure and model:
+    the count of rows n, the average intercept mu, the slope a, its p-value
+    p, r_squared and r_adjusted of the demeaned values (like plm), the
+    standard error a_se and the p-value f_test_p of the F test.
+    """
+    valid = np.isfinite(x)[:, None] & np.isfinite(ys)
+    xs = np.where(valid, x[:, None], 0)
+    ys = np.where(valid, ys, 0)
+    demeaned = get_within_values(np.hstack((xs, ys)), np.hstack((
+        valid, valid)), entities, times)
+    dx, dy = demeaned[:, :ys.shape[1]], demeaned[:, ys.shape[1]:]
+    n = valid.sum(axis=0).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sxx = (dx * dx).sum(axis=0)
+        a = np.where(sxx > 0, (dx * dy).sum(axis=0) / sxx, np.nan)
+        residuals = np.where(valid, dy - a * dx, 0)
+        rss = (residuals * residuals).sum(axis=0)
+        tss = (dy * dy).sum(axis=0)
+        df = n - get_counts_of_groups(entities, valid) - 1
+        if times is not None:
+            df -= get_counts_of_groups(times, valid) - 1
+        r_squared = np.where(tss > 0, 1 - rss / tss, np.nan)
+        # the within model has no intercept, so the adjustment of plm
+        # divides by the count of rows instead of the count minus one
+        r_adjusted = np.where(df > 0, 1 - (1 - r_squared) * n / df, np.nan)
+        if clusters is None:
+            a_se = np.where(df > 0, np.sqrt(rss / df / sxx), np.nan)
+        else:
+            scores = get_group_sums(clusters, clusters.max() + 1 if len(
+                clusters) else 0, dx * residuals)
+            a_se = np.sqrt((scores * scores).sum(axis=0)) / sxx
+        mu = (ys.sum(axis=0) - a * xs.sum(axis=0)) / n
+        t = a / a_se
+    return {"n": n, "mu": mu, "a": a, "p": regression.get_t_p_values(t, df),
+            "r_squared": r_squared, "r_adjusted": r_adjusted, "a_se": a_se,
+            "f_test_p": regression.get_f_p_values(t * t, 1, df)}
+
+
+def get_sample_arrays(sample):
+    """
+    Returns the arrays of one sample of the container that are required for
+    the within regressions: the codes of the entities (tickers) and times
+    (dates), the regressor log(W) and the dependent variables of all models
+    as columns.
+    """
+    x, ys = regression.get_model_variables(sample, 1)
+    return (pd.factorize(sample["ticker"])[0], pd.factorize(
+        sample["date"])[0], x, np.column_stack([ys[model] for model in
+                                                regression.models]))
+
+
+def get_sample_coefficients(arrays, sample_effect, sample_cluster):
+    """
+    Worker function that estimates the within regressions of all models for
+    one sample given by its arrays (see get_sample_arrays()).
+    """
+    entities, times, x, ys = arrays
+    clusters = {None: None, "entity": entities, "time": times}[
+        sample_cluster]
+    return get_within_regressions(
+        entities, times if sample_effect == "twoways" else None, x, ys,
+        clusters)
+
+
+def get_panel_coefficients(container, group_columns=["index", "venue"],
+                           workers=0):
+    """
+    Estimate the fixed effects panel regressions of all six models for each
+    sample of the container (the panel of the container module) that is
+    defined by the given columns, e.g. each combination of index and venue
+    like in panel regression.R. If workers are given the samples are
+    estimated by a pool of worker processes. The effects and the standard
+    errors follow the effect and cluster settings of this module.
+
+    The return value is a dataframe with the columns of the coefficients of
+    panel regression.R: model, mu, a, p, r_squared, r_adjusted, a_se,
+    f_test_p, the group columns and panel (the name of the model of plm). In
+    contrast to the R script, which saved the slope in the column mu, the
+    slope is a and mu is the average of the fixed effects.
+    """
+    labels, samples = [], []
+    for label, sample in container.groupby(group_columns, sort=True):
+        labels.append(label if isinstance(label, tuple) else (label,))
+        samples.append(get_sample_arrays(sample))
+    if workers and len(samples) > 1:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers) as executor:
+            results = list(executor.map(
+                get_sample_coefficients, samples,
+                [effect] * len(samples), [cluster] * len(samples)))
+    else:
+        results = [get_sample_coefficients(arrays, effect, cluster)
+                   for arrays in samples]
+    coefficients = []
+    for label, result in zip(labels, results):
+        df = pd.DataFrame({"model": regression.models})
+        for measure in ["mu", "a", "p", "r_squared", "r_adjusted", "a_se",
+                        "f_test_p"]:
+            df[measure] = result[measure]
+        for col, value in zip(group_columns, label):
+            df[col] = value
+        df["panel"] = "within" if effect == "individual" else "twoways"
+        coefficients.append(df)
+    if not coefficients:
+        return pd.DataFrame(columns=["model", "mu", "a", "p", "r_squared",
+                                     "r_adjusted", "a_se", "f_test_p"] +
+                            group_columns + ["panel"])
+    return pd.concat(coefficients, ignore_index=True).sort_values(
+        ["panel"] + group_columns + ["model"]).reset_index(drop=True)
@@ -0,0 +1,184 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The parquetstore module provides an alternative output format for the daily
+aggregations. Instead of one csv file per trading venue and kind (trades or
+quotes) the aggregations are written as typed columnar parquet files that
+are partitioned by venue, ticker and month in the hive layout, e.g.
+
+    <folder>/Trades/venue=DAX Xetra/ticker=SAP.DE/month=2018-01/part.parquet
+
+A fingerprint of each partition is kept, so that only new or changed
+partitions are written when the aggregations are saved again. The
+partitions can be loaded with pruning by ticker and date range. In R the
+whole panel of a kind is loaded with the arrow package, e.g. via
+open_dataset("./Aggregationen/Trades"), without any csv parsing.
+
+The pandas package must be installed to use this module. The parquet files
+require the optional pyarrow package.
+"""
+
+import os
+import json
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as dataset
+    import pyarrow.parquet as parquet
+except ImportError:
+    pa = None
+
+# define global settings for the parquet files
+compression = "snappy"
+date_format = "%d-%b-%Y" # format of the date column of the aggregations
+partition_columns = ["venue", "ticker", "month"]
+fingerprint_file = "_fingerprints.json" # files beginning with _ or . are
+                                       # ignored by the readers of arrow
+
+
+def check_backend():
+    """
+    Raises an ImportError if the pyarrow package is not installed.
+    """
+    if pa is None:
+        raise ImportError("The pyarrow package is required for the parquet " +
+                          "output format.")
+
+
+def get_months(dates):
+    """
+    Returns the month (YYYY-MM) of each date string of the aggregations.
+    """
+    return pd.to_datetime(pd.Series(dates), format=date_format).dt.strftime(
+        "%Y-%m").values
+
+
+def get_venue_folder(folder, kind, venue):
+    """
+    Returns the folder of all partitions of one kind (Trades or Quotes) and
+    trading venue.
+    """
+    return os.path.join(folder, kind, "venue=" + venue)
+
+
+def get_partition_file(folder, kind, venue, ticker, month):
+    """
+    Returns the path of the parquet file of one partition.
+    """
+    return os.path.join(get_venue_folder(folder, kind, venue),
+                        "ticker=" + ticker, "month=" + month, "part.parquet")
+
+
+def get_fingerprint(df):
+    """
+    Returns a fingerprint of the content of a dataframe (independent of the
+    index) that changes with any value or column.
+    """
+    return str(int(pd.util.hash_pandas_object(df, index=False).sum())) + \
+        "/" + ",".join(df.columns)
+
+
+def load_fingerprints(folder, kind, venue):
+    """
+    Load the fingerprints of all written partitions of one kind and venue.
+    An empty dictionary is returned if there aren't any partitions yet.
+    """
+    target = os.path.join(get_venue_folder(folder, kind, venue),
+                          fingerprint_file)
+    if not os.path.isfile(target):
+        return {}
+    f = open(target)
+    fingerprints = json.load(f)
+    f.close()
+    return fingerprints
+
+
+def save_fingerprints(fingerprints, folder, kind, venue):
+    """
+    Save the fingerprints of all written partitions of one kind and venue.
+    """
+    target = os.path.join(get_venue_folder(folder, kind, venue),
+                          fingerprint_file)
+    f = open(target + ".tmp", "w")
+    f.write(json.dumps(fingerprints, indent=1, sort_keys=True))
+    f.close()
+    os.replace(target + ".tmp", target)
+
+
+def write_partitions(df, folder, kind, venue):
+    """
+    Write the aggregations of one kind and venue into partitions by ticker
+    and month. Only partitions whose content changed since they have been
+    written last time are written again, all other partitions (including
+    those that are not part of the given dataframe) are kept as they are.
+    The partition columns are not stored within the files. The return value
+    is the number of written partitions.
+    """
+    check_backend()
+    if df.empty:
+        return 0
+    os.makedirs(get_venue_folder(folder, kind, venue), exist_ok=True)
+    fingerprints = load_fingerprints(folder, kind, venue)
+    written = 0
+    df = df.reset_index(drop=True)
+    months = get_months(df["date"].values)
+    for (ticker, month), rows in df.groupby(
+            [df["ticker"].astype(str).values, months], sort=False).indices.\
+            items():
+        partition = df.iloc[rows].drop(columns="ticker")
+        key = ticker + "/" + month
+        fingerprint = get_fingerprint(partition)
+        if fingerprints.get(key) == fingerprint:
+            continue
+        target = get_partition_file(folder, kind, venue, ticker, month)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temporary = os.path.join(os.path.dirname(target), ".part.tmp")
+        parquet.write_table(pa.Table.from_pandas(
+            partition, preserve_index=False), temporary,
+            compression=compression)
+        os.replace(temporary, target)
+        fingerprints[key] = fingerprint
+        written += 1
+    save_fingerprints(fingerprints, folder, kind, venue)
+    return written
+
+
+def has_partitions(folder, kind, venue):
+    """
+    Returns True if there are partitions of the given kind and venue.
+    """
+    return bool(load_fingerprints(folder, kind, venue))
+
+
+def read_partitions(folder, kind, venue, tickers=None, first_date=None,
+                    last_date=None):
+    """
+    Load the aggregations of one kind and venue. Only the partitions of the
+    given tickers and of the months within the given date range (strings in
+    the date format of the aggregations, both inclusive) are read, i.e. the
+    first and the last month may contain rows outside of the range. The
+    columns are in the same order as they have been written with the ticker
+    in front. If the venue is None the partitions of all venues are read
+    and the venue is kept as second column.
+    """
+    check_backend()
+    partitioning = dataset.partitioning(pa.schema([
+        (name, pa.string()) for name in partition_columns]), flavor="hive")
+    data = dataset.dataset(os.path.join(folder, kind), format="parquet",
+                           partitioning=partitioning)
+    condition = dataset.field("venue").is_valid() if venue is None else \
+        dataset.field("venue") == venue
+    if tickers is not None:
+        condition = condition & dataset.field("ticker").isin(list(tickers))
+    if first_date is not None:
+        condition = condition & (dataset.field("month") >= get_months(
+            [first_date])[0])
+    if last_date is not None:
+        condition = condition & (dataset.field("month") <= get_months(
+            [last_date])[0])
+    df = data.to_table(filter=condition).to_pandas()
+    columns = [col for col in df.columns if col not in partition_columns]
+    if venue is None:
+        columns = ["venue"] + columns
+    return df[["ticker"] + columns].reset_index(drop=True)
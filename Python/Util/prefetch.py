@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The prefetch module provides a pipelined reader. A background thread reads
+the chunks of the raw files ahead (the decompression of gzip and the
+parsing of both csv backends release the global interpreter lock for the
+most part) while the main thread filters and aggregates the current chunk.
+The chunks are passed through a bounded queue, so the reader waits as soon
+as the given number of chunks is read ahead and the memory is limited to
+these chunks plus the one the reader is working on. The chunks of several
+files can be read in one pipeline, so that the next file is already read
+while the last chunks of the current file are aggregated.
+
+Only packages of the python standard library are required.
+"""
+
+import queue
+import threading
+
+ITEM = 0
+END = 1
+ERROR = 2
+GROUP_END = object()
+
+
+class Prefetcher(threading.Thread):
+    """
+    The Prefetcher class is the background thread that iterates over the
+    given items and puts them into a queue with the given maximum size. An
+    exception of the iterator is passed through the queue as well, so that
+    it's raised in the main thread.
+    """
+    def __init__(self, items, depth):
+        threading.Thread.__init__(self, daemon=True)
+        self.items = items
+        self.queue = queue.Queue(maxsize=depth)
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            for item in self.items:
+                if not self.put(ITEM, item):
+                    return
+            self.put(END)
+        except BaseException as e:
+            self.put(ERROR, e)
+        finally:
+            # close a generator in the thread in which it's executed, e.g.
+            # to close the files it has opened
+            if hasattr(self.items, "close"):
+                self.items.close()
+
+    def put(self, kind, value=None):
+        """
+        Put an entry into the queue and wait while the queue is full unless
+        the thread is stopped. Returns False if the thread is stopped.
+        """
+        while not self.stopped.is_set():
+            try:
+                self.queue.put((kind, value), timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def stop(self):
+        """
+        Stop the thread and drop all entries that are read ahead.
+        """
+        self.stopped.set()
+        while self.is_alive():
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        self.join()
+
+
+def get_prefetched(items, depth):
+    """
+    Generator that yields all items of the given iterator in the same order,
+    while at most depth items are read ahead in a background thread. If the
+    depth is 0 the items are read in sequence without any thread.
+    """
+    if not depth:
+        yield from items
+        return
+    prefetcher = Prefetcher(items, depth)
+    prefetcher.start()
+    try:
+        while True:
+            kind, value = prefetcher.queue.get()
+            if kind == END:
+                return
+            if kind == ERROR:
+                raise value
+            yield value
+    finally:
+        prefetcher.stop()
+
+
+def get_group_entries(groups):
+    """
+    Generator that flattens the items of all groups (tuples of a key and an
+    iterator of items) into tuples of the key and an item. The end of each
+    group is marked with an additional tuple of the key and GROUP_END.
+    """
+    for key, items in groups:
+        for item in items:
+            yield key, item
+        yield key, GROUP_END
+
+
+def get_group_items(entry, entries):
+    """
+    Generator that yields the items of one group from the flattened entries
+    beginning with the given first entry of the group.
+    """
+    while entry[1] is not GROUP_END:
+        yield entry[1]
+        entry = next(entries)
+
+
+def get_prefetched_groups(groups, depth):
+    """
+    Generator that yields a tuple of the key and an iterator of the items of
+    each of the given groups (tuples of a key and an iterator of items, e.g.
+    the ticker and the chunks of its source file). The items of all groups
+    are read ahead in one pipeline with the given depth, so the reading of
+    the next group begins while the items of the current group are still
+    processed. The iterator of each group must be exhausted before the next
+    group is requested.
+    """
+    entries = get_prefetched(get_group_entries(groups), depth)
+    try:
+        for entry in entries:
+            yield entry[0], get_group_items(entry, entries)
+    finally:
+        entries.close()
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The qualifiers module provides the screening of trades by their trade
+conditions (the Qualifiers column of the raw data). Instead of scanning the
+strings of every row, the distinct strings of a chunk are parsed once into a
+dictionary encoded code table: each row is mapped to an integer code and
+each code to a bitmask of flags (e.g. ACT_FLAG1, auction or cancel). The
+screening rules are given as flags that are required or excluded, so that a
+filter is an integer lookup of the bitmasks of all rows.
+
+The flags are defined below by a tuple of the kind of the test and a text.
+A flag of the kind "prefix" is set if the qualifiers begin with the text, a
+flag of the kind "token" if any of the qualifiers separated by semicolons
+equals the text (without surrounding blanks) and a flag of the kind "empty"
+if there is no qualifier at all. The rules can be configured per trading
+venue and are used by the preprocessor class unless it has a rule of its
+own.
+
+The numpy and pandas packages must be installed to use this module.
+"""
+
+import numpy as np
+import pandas as pd
+
+# define global settings for the screening of trades (at most 32 flags)
+flags = {"act_flag1": ("prefix", " [ACT_FLAG1]"), # first qualifier is
+                                                  # ACT_FLAG1
+         "auction": ("token", "[AUC]"),
+         "trade_type": ("token", "[ACT_TP_1]"),
+         "off_book": ("token", "[OFF_BOOK]"),
+         "cancel": ("token", "[CANCEL]"),
+         "correction": ("token", "[CORRECTION]"),
+         "empty": ("empty", "")}
+default_rule = {"require": ["act_flag1"], # flags that must be set
+                "exclude": []} # flags that must not be set
+rules = {} # rules per trading venue (name of the folder), e.g.
+           # {"CAC Paris": {"require": ["act_flag1"], "exclude": ["auction"]}}
+
+
+def get_rule(marketplace):
+    """
+    Returns the screening rule of the given trading venue.
+    """
+    return rules.get(marketplace, default_rule)
+
+
+def get_bit(flag):
+    """
+    Returns the bit of a flag in the order of the flags setting.
+    """
+    if flag not in flags:
+        raise ValueError("Unknown qualifier flag: " + str(flag))
+    return 1 << list(flags).index(flag)
+
+
+def get_masks(rule):
+    """
+    Function returns the bitmasks of the required and the excluded flags of
+    a screening rule.
+    """
+    required, excluded = 0, 0
+    for flag in rule.get("require", []):
+        required |= get_bit(flag)
+    for flag in rule.get("exclude", []):
+        excluded |= get_bit(flag)
+    return required, excluded
+
+
+def get_flags(qualifiers):
+    """
+    Returns the bitmask of the flags of one string of qualifiers.
+    """
+    tokens = [token.strip() for token in qualifiers.split(";")]
+    bits = 0
+    for i, (kind, text) in enumerate(flags.values()):
+        if (kind == "prefix" and qualifiers.startswith(text)) or \
+                (kind == "token" and text in tokens) or \
+                (kind == "empty" and not any(tokens)):
+            bits |= 1 << i
+    return bits
+
+
+def get_code_table(values):
+    """
+    Function encodes the qualifiers of all rows (strings or categories) into
+    integer codes and parses each distinct string once. The return value is
+    a tuple of the codes of the rows, the distinct strings and the bitmask
+    of the flags of each distinct string.
+    """
+    if isinstance(values, pd.Series):
+        values = values.values
+    if isinstance(values, pd.Categorical):
+        codes = values.codes
+        uniques = np.asarray(values.categories, dtype=object)
+    else:
+        codes, uniques = pd.factorize(values)
+        uniques = np.asarray(uniques, dtype=object)
+    # missing values have the code -1, i.e. the empty string that is
+    # appended as last distinct string
+    uniques = np.append(uniques, "")
+    bitmasks = np.fromiter((get_flags(str(value)) for value in uniques),
+                           np.int64, len(uniques))
+    return codes, uniques, bitmasks
+
+
+def get_bitmasks(values):
+    """
+    Returns the bitmask of the flags of each row of the given qualifiers.
+    """
+    codes, uniques, bitmasks = get_code_table(values)
+    return bitmasks[codes]
+
+
+def get_screening_mask(values, rule):
+    """
+    Returns a mask of all rows of the given qualifiers that satisfy the
+    screening rule. The rule is evaluated once per distinct string, so the
+    rows are only looked up by their codes.
+    """
+    required, excluded = get_masks(rule)
+    codes, uniques, bitmasks = get_code_table(values)
+    selected = ((bitmasks & required) == required) & \
+        ((bitmasks & excluded) == 0)
+    return selected[codes]
@@ -0,0 +1,280 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The regression module provides a batched engine for the log-log models of
+the invariance hypothesis that are estimated per ticker in regression.R. All
+groups (tickers and optionally windows of dates) and all six models are
+fitted at once: the rows are sorted by group, so that the sums of each
+simple regression are segmented reductions, and the coefficients, standard
+errors, coefficients of determination and p-values of all groups follow in
+closed form. The results equal those of lm() in R.
+
+The p-values of the t and F statistics are calculated with the regularized
+incomplete beta function, so no package for statistics is required.
+
+The numpy and pandas packages must be installed to use this module. Required
+package is the segments module that is also included in this project.
+"""
+
+import math
+import numpy as np
+import pandas as pd
+import Util.segments as segments
+
+# define global settings for the regressions
+models = ["trade_freq", "quote_freq", "trade_vol", "quote_vol",
+          "abs_spread", "rel_spread"]
+date_format = "%d-%b-%Y" # format of the date column of the aggregations
+beta_iterations = 200 # maximum terms of the continued fraction of the
+                      # incomplete beta function
+beta_epsilon = 1e-15
+
+
+def get_regularized_beta(x, a, b):
+    """
+    Function returns the regularized incomplete beta function I_x(a, b) of
+    arrays with the continued fraction of Lentz (evaluated for all elements
+    at once until the last one converged).
+    """
+    x, a, b = np.broadcast_arrays(*[np.asarray(v, dtype=np.float64)
+                                    for v in (x, a, b)])
+    # use the symmetry relation where the continued fraction converges
+    # slowly
+    swap = x > (a + 1) / (a + b + 2)
+    x, a, b = np.where(swap, 1 - x, x), np.where(swap, b, a), \
+        np.where(swap, a, b)
+    lgamma = np.vectorize(math.lgamma, otypes=[np.float64])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        front = np.exp(lgamma(a + b) - lgamma(a) - lgamma(b) +
+                       a * np.log(x) + b * np.log1p(-x)) / a
+        tiny = 1e-300
+        f = np.ones(x.shape)
+        c = np.ones(x.shape)
+        d = np.zeros(x.shape)
+        active = np.ones(x.shape, dtype=bool)
+        for i in range(2 * beta_iterations + 1):
+            m = i // 2
+            if i == 0:
+                numerator = np.ones(x.shape)
+            elif i % 2 == 0:
+                numerator = m * (b - m) * x / ((a + 2 * m - 1) *
+                                               (a + 2 * m))
+            else:
+                numerator = -(a + m) * (a + b + m) * x / ((a + 2 * m) *
+                                                          (a + 2 * m + 1))
+            d = 1 + numerator * d
+            d = 1 / np.where(np.abs(d) < tiny, tiny, d)
+            c = 1 + numerator / np.where(np.abs(c) < tiny, tiny, c)
+            step = c * d
+            f = np.where(active, f * step, f)
+            active &= ~(np.abs(1 - step) < beta_epsilon)
+            if not active.any():
+                break
+        result = front * (f - 1)
+    result = np.where(x <= 0, 0, np.where(x >= 1, 1, result))
+    return np.where(swap, 1 - result, result)
+
+
+def get_t_p_values(t, df):
+    """
+    Returns the two-sided p-values of t statistics with the given degrees of
+    freedom (null where the statistic or the degrees of freedom are null or
+    not positive).
+    """
+    t = np.asarray(t, dtype=np.float64)
+    df = np.asarray(df, dtype=np.float64)
+    valid = ~np.isnan(t) & (df > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = np.where(valid, df / (df + t * t), 0.5)
+    p = get_regularized_beta(x, np.where(valid, df, 1) / 2, 0.5)
+    return np.where(valid, p, np.nan)
+
+
+def get_f_p_values(f, df1, df2):
+    """
+    Returns the p-values (upper tail) of F statistics with the given degrees
+    of freedom like pf(f, df1, df2, lower=FALSE) in R.
+    """
+    f = np.asarray(f, dtype=np.float64)
+    df1 = np.asarray(df1, dtype=np.float64)
+    df2 = np.asarray(df2, dtype=np.float64)
+    valid = ~np.isnan(f) & (df1 > 0) & (df2 > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = np.where(valid, df2 / (df2 + df1 * f), 0.5)
+    p = get_regularized_beta(x, np.where(valid, df2, 1) / 2,
+                             np.where(valid, df1, 1) / 2)
+    return np.where(valid, p, np.nan)
+
+
+def get_model_variables(container, w_star=None):
+    """
+    Function returns the regressor log(W/W*) and a dictionary with the
+    dependent variable of each model (all as logarithms like in
+    regression.R). W* is the mean of the trading activity W of the whole
+    container unless it's given.
+    """
+    w = container["W"].values.astype(np.float64)
+    if w_star is None:
+        w_star = np.mean(w)
+    values = {col: container[col].values.astype(np.float64) for col in [
+        "N.x", "N.y", "X", "V", "P", "bid_size", "ask_size", "bid_price",
+        "ask_price", "rel_spread"]}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = np.log(w / w_star)
+        ys = {"trade_freq": np.log(values["N.x"]),
+              "quote_freq": np.log(values["N.y"]),
+              "trade_vol": np.log(values["X"] / (values["V"] /
+                                                 values["P"])),
+              "quote_vol": np.log(values["bid_size"] + values["ask_size"]),
+              "abs_spread": np.log(values["ask_price"] -
+                                   values["bid_price"]),
+              "rel_spread": np.log(values["rel_spread"])}
+    return x, {model: ys[model] for model in models}
+
+
+def get_ols(starts, x, y):
+    """
+    Function fits the simple regression y = mu + a * x of each segment of
+    rows (sorted by group and given by their start offsets). Rows with a
+    value of x or y that is not finite are left out like the missing values
+    in lm(). The sums are taken of the centered values (two passes), so the
+    results are accurate for large levels of x and y as well.
+
+    The return value is a dictionary with one array per measure and group:
+    the count of rows n, mu, a, the p-value of a, r_squared, r_adjusted,
+    the standard error a_se and the p-value f_test_p of the F test.
+    """
+    valid = np.isfinite(x) & np.isfinite(y)
+    lengths = np.diff(np.append(starts, len(x)))
+    n = segments.get_sums(valid, starts).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = segments.get_sums(np.where(valid, x, 0), starts) / n
+        y_mean = segments.get_sums(np.where(valid, y, 0), starts) / n
+        dx = np.where(valid, x - np.repeat(x_mean, lengths), 0)
+        dy = np.where(valid, y - np.repeat(y_mean, lengths), 0)
+        sxx = segments.get_sums(dx * dx, starts)
+        sxy = segments.get_sums(dx * dy, starts)
+        syy = segments.get_sums(dy * dy, starts)
+        a = np.where(sxx > 0, sxy / sxx, np.nan)
+        mu = y_mean - a * x_mean
+        rss = np.maximum(syy - a * sxy, 0)
+        df = n - 2
+        r_squared = np.where(syy > 0, 1 - rss / syy, np.nan)
+        r_adjusted = np.where(df > 0, 1 - (1 - r_squared) * (n - 1) / df,
+                              np.nan)
+        a_se = np.where(df > 0, np.sqrt(rss / df / sxx), np.nan)
+        t = a / a_se
+    return {"n": n, "mu": mu, "a": a, "p": get_t_p_values(t, df),
+            "r_squared": r_squared, "r_adjusted": r_adjusted,
+            "a_se": a_se, "f_test_p": get_f_p_values(t * t, 1, df)}
+
+
+def get_rolling_windows(container, months, step=1):
+    """
+    Returns windows of the given number of calendar months that begin every
+    step months, beginning with the first month of the container. Each
+    window is a tuple of the first and the last date (in the date format of
+    the aggregations) and only complete windows are returned.
+    """
+    first = pd.to_datetime(container["date"], format=date_format).min()
+    last = pd.to_datetime(container["date"], format=date_format).max()
+    begin = pd.Timestamp(first.year, first.month, 1)
+    windows = []
+    while True:
+        end = begin + pd.DateOffset(months=months) - pd.Timedelta(days=1)
+        if end > last + pd.offsets.MonthEnd(0):
+            return windows
+        windows.append((begin.strftime(date_format).upper(),
+                        end.strftime(date_format).upper()))
+        begin = begin + pd.DateOffset(months=step)
+
+
+def get_window_rows(container, windows):
+    """
+    Function assigns the rows of the container to the given windows (tuples
+    of the first and the last date, both inclusive), which may overlap. The
+    return value is a tuple of the rows and the window of each assignment.
+    """
+    if windows is None:
+        return np.arange(len(container)), np.zeros(len(container),
+                                                   dtype=np.int64)
+    codes, dates = pd.factorize(container["date"])
+    days = pd.to_datetime(pd.Series(dates), format=date_format).values[
+        codes]
+    rows = []
+    for first, last in windows:
+        rows.append(np.flatnonzero(
+            (days >= np.datetime64(pd.to_datetime(first,
+                                                  format=date_format))) &
+            (days <= np.datetime64(pd.to_datetime(last,
+                                                  format=date_format)))))
+    return np.concatenate(rows + [np.zeros(0, dtype=np.int64)]), \
+        np.repeat(np.arange(len(windows)), [len(r) for r in rows])
+
+
+def get_coefficients(container, windows=None, w_star=None,
+                     symbols_rm=None):
+    """
+    Estimate all six models for each ticker of the container (the panel of
+    the container module) and, if windows are given (tuples of the first
+    and the last date like the result of get_rolling_windows()), for each
+    ticker and window. The regressor is log(W/W*) with W* of the whole
+    container unless it's given. The primary ticker of each ticker can be
+    given as dictionary (see load_symbols_rm()).
+
+    The return value is a dataframe with the columns of coefficient.csv of
+    regression.R (symbol, model, mu, a, p, r_squared, r_adjusted, a_se,
+    f_test_p, symbol_rm, index, venue, market) sorted by ticker and model.
+    With windows the first and the last date of the window and the count of
+    rows n are added after the model.
+    """
+    x, ys = get_model_variables(container, w_star)
+    rows, window_codes = get_window_rows(container, windows)
+    ticker_codes = pd.factorize(container["ticker"], sort=True)[0]
+    keys = ticker_codes[rows] * max(len(windows or []), 1) + window_codes
+    order = np.argsort(keys, kind="stable")
+    rows, keys = rows[order], keys[order]
+    starts, ends = segments.get_segments(keys)
+    first_rows = rows[starts]
+
+    results = [get_ols(starts, x[rows], ys[model][rows])
+               for model in models]
+    count = len(starts)
+    coefficients = pd.DataFrame({
+        "symbol": np.repeat(container["ticker"].values[first_rows],
+                            len(models)),
+        "model": np.tile(models, count)})
+    if windows is not None:
+        window_codes = keys[starts] % len(windows)
+        coefficients["first_date"] = np.repeat(
+            np.array([w[0] for w in windows])[window_codes], len(models))
+        coefficients["last_date"] = np.repeat(
+            np.array([w[1] for w in windows])[window_codes], len(models))
+        coefficients["n"] = np.column_stack(
+            [result["n"] for result in results]).ravel().astype(np.int64)
+    for measure in ["mu", "a", "p", "r_squared", "r_adjusted", "a_se",
+                    "f_test_p"]:
+        coefficients[measure] = np.column_stack(
+            [result[measure] for result in results]).ravel()
+    coefficients["symbol_rm"] = coefficients["symbol"].map(
+        symbols_rm or {}).values
+    for col in ["index", "venue", "market"]:
+        coefficients[col] = np.repeat(container[col].values[first_rows],
+                                      len(models))
+    return coefficients
+
+
+def load_symbols_rm(source):
+    """
+    Load the primary ticker (on the regulated market) of each ticker from
+    the file with the market caps that is used in regression.R. The first
+    four columns contain the tickers on the regulated market, BATS, Chi-X
+    and Turquoise. The return value is a dictionary with the primary ticker
+    of each ticker.
+    """
+    market_cap = pd.read_csv(source, sep=";")
+    symbols_rm = {}
+    for col in market_cap.columns[:4]:
+        symbols_rm.update(zip(market_cap[col].astype(str),
+                              market_cap[market_cap.columns[0]].astype(str)))
+    return symbols_rm
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The rowindex module provides a single-pass indexer for TRTH source files. It
+finds the first row of every date with vectorized comparisons over large
+blocks of rows and collects further statistics per day in the same scan. The
+resulting index is a numpy record array that is saved as a compact binary
+file which can be memory-mapped when it is loaded again.
+
+The pandas and numpy packages must be installed to use this module.
+"""
+
+import numpy as np
+import Util.pandashelper as pandashelper
+import Util.segments as segments
+
+# define global settings for the indexer
+block_size = 1000000
+index_dtype = np.dtype([("ticker", "S16"),
+                        ("date", "S16"),
+                        ("first_row", np.int64),
+                        ("rows", np.int64),
+                        ("trades", np.int64),
+                        ("quotes", np.int64),
+                        ("min_time", np.int32),
+                        ("max_time", np.int32)])
+
+
+def get_block_index(block, offset):
+    """
+    Function returns the index records of all dates within one block of rows.
+    The offset is the row number of the first row of the block in the source
+    file. The times are given in milliseconds since midnight (GMT).
+    """
+    dates = block["Date[G]"].values.astype("S16")
+    times = pandashelper.get_milliseconds(block["Time[G]"].values)
+    types = block["Type"].values
+    starts, ends = segments.get_segments(dates)
+    index = np.zeros(len(starts), dtype=index_dtype)
+    index["date"] = dates[starts]
+    index["first_row"] = starts + offset
+    index["rows"] = ends - starts
+    index["trades"] = np.add.reduceat(types == "Trade", starts)
+    index["quotes"] = np.add.reduceat(types == "Quote", starts)
+    index["min_time"] = np.minimum.reduceat(times, starts)
+    index["max_time"] = np.maximum.reduceat(times, starts)
+    return index
+
+
+def merge_index(index):
+    """
+    Function merges consecutive records of the same date into one record.
+    This is required for dates that are spread over two or more blocks.
+    """
+    starts, ends = segments.get_segments(index["date"])
+    merged = index[starts]
+    for col in ["rows", "trades", "quotes"]:
+        merged[col] = np.add.reduceat(index[col], starts)
+    merged["min_time"] = np.minimum.reduceat(index["min_time"], starts)
+    merged["max_time"] = np.maximum.reduceat(index["max_time"], starts)
+    return merged
+
+
+def get_date_index(source, ticker=""):
+    """
+    For a given source file the function returns one index record per date
+    with the first row number (the first data row has number 0), the count of
+    rows, trades and quotes and the minimum and maximum time of the date. All
+    blocks of the file are read only once and only the required columns are
+    parsed.
+    """
+    reader = pandashelper.pd.read_csv(
+        source, iterator=True, engine="c", low_memory=False,
+        chunksize=block_size, header=0, compression="gzip", na_filter=False,
+        usecols=["Date[G]", "Time[G]", "Type"])
+    parts = []
+    offset = 0
+    for block in reader:
+        parts.append(get_block_index(block, offset))
+        offset += len(block)
+    if not parts:
+        return np.zeros(0, dtype=index_dtype)
+    index = merge_index(np.concatenate(parts))
+    index["ticker"] = ticker
+    return index
+
+
+def get_rows_from_index(index):
+    """
+    Function converts an index into the dictionary that is used by the
+    preprocessor class. The dictionary has one value per ticker that again
+    represents a dictionary with one row number per date.
+    """
+    rows = {}
+    for record in index:
+        ticker = record["ticker"].decode()
+        if ticker not in rows:
+            rows[ticker] = {}
+        rows[ticker][record["date"].decode()] = int(record["first_row"])
+    return rows
+
+
+def save_index(index, target):
+    """
+    Save the index as binary file in the numpy format.
+    """
+    np.save(target, index)
+
+
+def load_index(target):
+    """
+    Load an index from a binary file. The file is memory-mapped so that only
+    the accessed records are read from disk.
+    """
+    return np.load(target, mmap_mode="r")
@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The segments module provides numpy primitives for arrays that are sorted by
+a group key (typically the date) so that all rows of a group form one
+contiguous segment. These primitives are shared by the vectorized engines of
+this project.
+
+The numpy package must be installed to use this module.
+"""
+
+import numpy as np
+
+
+def get_segments(keys):
+    """
+    Function returns the start and end offsets of all runs of equal
+    consecutive values in the given array. The end offsets are exclusive.
+    """
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    changes = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    starts = np.concatenate(([0], changes)).astype(np.int64)
+    ends = np.concatenate((changes, [len(keys)])).astype(np.int64)
+    return starts, ends
+
+
+def factorize_dates(dates):
+    """
+    Function maps every date of the given array to an integer code. The codes
+    are numbered in the sorted order of the distinct dates, i.e. in the same
+    order as the groups of a pandas groupby on the dates. The return value is
+    a tuple of the distinct dates and the codes per row. Since the dates of a
+    source file are contiguous only the first date of each run is compared.
+    """
+    dates = np.asarray(dates)
+    starts, ends = get_segments(dates)
+    days, segment_codes = np.unique(dates[starts], return_inverse=True)
+    codes = np.repeat(segment_codes, ends - starts)
+    return days, codes
+
+
+def get_positions(starts, ends):
+    """
+    Function returns the position of every row within its segment and the
+    length of the segment it belongs to, both as arrays with one value per
+    row.
+    """
+    lengths = ends - starts
+    positions = np.arange(lengths.sum(), dtype=np.int64) - np.repeat(
+        starts, lengths)
+    return positions, np.repeat(lengths, lengths)
+
+
+def get_shift_mask(positions, lengths, periods):
+    """
+    Returns a boolean mask of all rows that have a row with the given offset
+    within the same segment. A positive number of periods refers to a row in
+    front of the row (lag), a negative number to a row behind it (lead).
+    """
+    if periods >= 0:
+        return positions >= periods
+    return positions < lengths + periods
+
+
+def get_shifted(values, positions, lengths, periods=1):
+    """
+    Function shifts the given array by a number of rows within each segment
+    like the shift() method of pandas. Values that would be shifted across
+    the border of a segment are set to NaN (or NaT for datetimes). Integer
+    and boolean arrays are converted to floats for this reason.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in "mM":
+        fill = np.array("NaT", dtype=values.dtype)
+        shifted = np.empty(len(values), dtype=values.dtype)
+    else:
+        fill = np.nan
+        shifted = np.empty(len(values), dtype=np.result_type(
+            values.dtype, np.float64))
+    if periods > 0:
+        shifted[periods:] = values[:-periods]
+    elif periods < 0:
+        shifted[:periods] = values[-periods:]
+    else:
+        shifted[:] = values
+    shifted[~get_shift_mask(positions, lengths, periods)] = fill
+    return shifted
+
+
+def get_differences(values, positions, lengths, periods=1):
+    """
+    Function returns the difference between each value and the value with
+    the given offset of rows within the same segment like the diff() method
+    of pandas. The differences of datetimes are computed on integer
+    nanoseconds before they are converted to floats, so that no precision is
+    lost. Differences across the border of a segment are set to NaN.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in "mM":
+        values = values.view(np.int64)
+    differences = np.full(len(values), np.nan)
+    if periods > 0:
+        differences[periods:] = values[periods:] - values[:-periods]
+    elif periods < 0:
+        differences[:periods] = values[:periods] - values[-periods:]
+    else:
+        differences[:] = 0
+    differences[~get_shift_mask(positions, lengths, periods)] = np.nan
+    return differences
+
+
+def get_sums(values, starts):
+    """
+    Function returns the sum of each segment of the given values while null
+    values are skipped like the sum() aggregation of pandas. The segments are
+    given by their start offsets and must not be empty.
+    """
+    values = np.asarray(values)
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.result_type(values.dtype, np.int64))
+    if values.dtype.kind == "f":
+        values = np.where(np.isnan(values), 0, values)
+    return np.add.reduceat(values, starts)
+
+
+def get_extrema(values, starts):
+    """
+    Function returns a tuple of the maximum and the minimum of each segment
+    while null values are skipped. Segments with null values only yield null.
+    """
+    values = np.asarray(values)
+    if len(starts) == 0:
+        return values[:0], values[:0]
+    return np.fmax.reduceat(values, starts), np.fmin.reduceat(values, starts)
+
+
+def get_stds(values, starts, ends, ddof=1):
+    """
+    Function returns the standard deviation of each segment with the given
+    delta degrees of freedom while null values are skipped. The two-pass
+    algorithm (mean first, then the squared deviations) is applied on all
+    segments at once. Segments with too few values yield null.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(starts) == 0:
+        return np.zeros(0)
+    mask = np.isnan(values)
+    counts = get_sums(~mask, starts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = get_sums(values, starts) / counts
+        squares = (values - np.repeat(means, ends - starts)) ** 2
+        squares[mask] = 0
+        variances = np.add.reduceat(squares, starts) / (counts - ddof)
+    variances[counts - ddof <= 0] = np.nan
+    return np.sqrt(variances)
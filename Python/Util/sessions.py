@@ -0,0 +1,186 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The sessions module provides the calendar of the trading sessions of the
+venues: the trading hours in local time of the venue, the offset of the
+local time to GMT of each date (including the daylight saving time), the
+holidays and the half-days with an earlier end of trading. The calendar is
+applied as a vectorized mask on the integer milliseconds of each row, so
+that all rows outside of the session are dropped before any further
+conversion. Since the offset is looked up per date, a chunk of raw data may
+span a change of the daylight saving time.
+
+The calendars are selected by the first word of the name of the trading
+venue (the index, e.g. "DAX" for "DAX Xetra" and "DAX MTF bats"), so the
+MTFs that are located in London use the hours and the local time of the
+regulated market of the same stocks.
+
+The numpy and pandas packages must be installed to use this module. Required
+package is the segments module that is also included in this project.
+"""
+
+import numpy as np
+import pandas as pd
+import Util.segments as segments
+
+# define global settings for the calendars of the trading venues
+# (holidays and half-days are given as names of the rules in the function
+# get_rule_dates() or as dates in the format of the raw data, the times of
+# the half-days are the end of trading in local time)
+calendars = {"DAX": {"gmt_offset": 1, # hours of the standard time
+                     "dst": True, # daylight saving time of the EU
+                     "open": "09:00:00",
+                     "close": "16:30:00",
+                     "holidays": ["new_year", "good_friday",
+                                  "easter_monday", "labour_day",
+                                  "christmas_eve", "christmas",
+                                  "boxing_day", "new_years_eve"],
+                     "half_days": {}},
+             "CAC": {"gmt_offset": 1,
+                     "dst": True,
+                     "open": "09:00:00",
+                     "close": "16:30:00",
+                     "holidays": ["new_year", "good_friday",
+                                  "easter_monday", "labour_day",
+                                  "christmas", "boxing_day"],
+                     "half_days": {"christmas_eve": "14:05:00",
+                                   "new_years_eve": "14:05:00"}}}
+default_calendar = "DAX" # calendar of venues without a calendar of their own
+date_format = "%d-%b-%Y" # format of the Date[G] column of the raw data
+
+MS_PER_HOUR = 3600000
+
+
+def get_calendar(marketplace):
+    """
+    Returns the calendar of the given trading venue.
+    """
+    return calendars.get(marketplace.split(" ")[0],
+                         calendars[default_calendar])
+
+
+def get_milliseconds_of_time(time):
+    """
+    Returns the milliseconds since midnight of a time string (HH:MM:SS).
+    """
+    hours, minutes, seconds = time.split(":")
+    return int((int(hours) * 3600 + int(minutes) * 60 + float(seconds)) *
+               1000)
+
+
+def get_weekdays(days):
+    """
+    Function returns the weekday (0 for monday to 6 for sunday) of each day
+    of an array of datetime64[D].
+    """
+    return (days.astype(np.int64) + 3) % 7
+
+
+def get_last_sundays(years, month):
+    """
+    Function returns the last sunday of the given month of each year.
+    """
+    first = (years - 1970) * 12 + month
+    last = np.asarray(first, dtype="datetime64[M]").astype(
+        "datetime64[D]") - 1
+    return last - (get_weekdays(last) + 1) % 7
+
+
+def get_easter_sundays(years):
+    """
+    Function returns the easter sunday of each year (anonymous gregorian
+    algorithm).
+    """
+    a = years % 19
+    b = years // 100
+    c = years % 100
+    g = (b - (b + 8) // 25 + 1) // 3
+    h = (19 * a + b - b // 4 - g + 15) % 30
+    k = (32 + 2 * (b % 4) + 2 * (c // 4) - h - c % 4) % 7
+    f = h + k - 7 * ((a + 11 * h + 22 * k) // 451) + 114
+    months = (years - 1970) * 12 + f // 31 - 1
+    return np.asarray(months, dtype="datetime64[M]").astype(
+        "datetime64[D]") + f % 31
+
+
+def get_rule_dates(rule, years):
+    """
+    Function returns the date of a holiday rule in each of the given years.
+    The rule is either the name of a holiday or a date in the format of the
+    raw data (then the years are ignored).
+    """
+    fixed = {"new_year": (1, 1), "labour_day": (5, 1),
+             "christmas_eve": (12, 24), "christmas": (12, 25),
+             "boxing_day": (12, 26), "new_years_eve": (12, 31)}
+    if rule in fixed:
+        month, day = fixed[rule]
+        return np.asarray((years - 1970) * 12 + month - 1,
+                          dtype="datetime64[M]").astype(
+                              "datetime64[D]") + day - 1
+    if rule == "good_friday":
+        return get_easter_sundays(years) - 2
+    if rule == "easter_monday":
+        return get_easter_sundays(years) + 1
+    return np.array([np.datetime64(pd.to_datetime(rule, format=date_format),
+                                   "D")])
+
+
+def get_days(dates):
+    """
+    Returns the distinct dates of the raw data (strings) as datetime64[D].
+    """
+    return pd.to_datetime(pd.Series(dates).astype(str),
+                          format=date_format).values.astype("datetime64[D]")
+
+
+def get_sessions(days, calendar):
+    """
+    Function returns the session of each of the given days (datetime64[D]):
+    the offset of the local time to GMT, the beginning and the end of the
+    trading hours in milliseconds of local time (the end is before the
+    beginning on holidays, so that no time is within the session).
+    """
+    days = np.asarray(days, dtype="datetime64[D]")
+    years = days.astype("datetime64[Y]").astype(np.int64) + 1970
+    offsets = np.full(len(days), calendar["gmt_offset"], dtype=np.int64)
+    if calendar["dst"]:
+        # the time changes on sundays at 1 am GMT, so a trading day is
+        # either in standard time or in daylight saving time completely
+        offsets += (days >= get_last_sundays(years, 3)) & \
+            (days < get_last_sundays(years, 10))
+    bod = np.full(len(days), get_milliseconds_of_time(calendar["open"]),
+                  dtype=np.int64)
+    eod = np.full(len(days), get_milliseconds_of_time(calendar["close"]),
+                  dtype=np.int64)
+    distinct_years = np.unique(years)
+    for rule, close in calendar["half_days"].items():
+        selected = np.isin(days, get_rule_dates(rule, distinct_years))
+        eod[selected] = np.minimum(eod[selected],
+                                   get_milliseconds_of_time(close))
+    for rule in calendar["holidays"]:
+        eod[np.isin(days, get_rule_dates(rule, distinct_years))] = -1
+    return offsets * MS_PER_HOUR, bod, eod
+
+
+def get_session_mask(dates, times, calendar):
+    """
+    Function returns a mask of all rows within the trading session and the
+    offset of the local time to GMT in milliseconds of each row. The dates
+    are given as strings in the format of the raw data and the times as
+    integer milliseconds since midnight (GMT). The dates of a chunk of raw
+    data are contiguous, so the calendar is evaluated once per date.
+    """
+    days, codes = segments.factorize_dates(np.asarray(dates))
+    offsets, bod, eod = get_sessions(get_days(days), calendar)
+    offsets = offsets[codes]
+    local = np.asarray(times, dtype=np.int64) + offsets
+    return (local >= bod[codes]) & (local <= eod[codes]), offsets
+
+
+def get_time_of_day(milliseconds):
+    """
+    Returns the timestamp on 01.01.1900 of the given milliseconds since
+    midnight in local time like the bod and eod of the preprocessor class.
+    """
+    return pd.Timestamp("1900-01-01") + pd.Timedelta(
+        milliseconds=milliseconds)
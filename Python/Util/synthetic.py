@@ -0,0 +1,224 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The synthetic module provides a deterministic generator of TRTH-style raw
+files, because the original TRTH datasets can't be shipped with this
+project. The generated files have the same columns and formats as the raw
+files (one gzip compressed csv file per ticker with trades, quotes and a few
+rows of other types) and can therefore be used to measure the performance of
+all preprocessing steps. The number of tickers and days, the rates of trades
+and quotes, the intraday seasonality, the patterns of empty fields and the
+qualifiers are configurable. The same seed always yields the same rows.
+
+The pandas and numpy packages must be installed to use this module.
+"""
+
+import os
+import gzip
+import datetime
+import numpy as np
+import pandas as pd
+
+# define global settings for the synthetic data
+names = ['#RIC', 'Date[G]', 'Time[G]', 'GMT Offset', 'Type',
+         'Ex/Cntrb.ID', 'Price', 'Volume', 'Bid Price',
+         'Bid Size', 'Ask Price', 'Ask Size', 'Qualifiers']
+first_date = datetime.date(2018, 1, 2)
+session = (9 * 60, 17 * 60 + 30) # local trading hours in minutes (Berlin)
+margin = 60 # minutes with some rows in front of and behind the session
+off_session_weight = 0.05 # intensity outside of the trading hours
+seasonality = 3.0 # additional intensity at the open and the close (u-shape)
+tick_size = 0.01
+daily_volatility = 0.015
+max_spread = 3 # maximum spread in ticks
+mean_volume = 250
+other_share = 0.01 # share of rows of other types (e.g. corrections)
+empty_bid = 0.15 # share of quotes without bid price and size
+empty_ask = 0.15 # share of quotes without ask price and size
+trade_qualifiers = {" [ACT_FLAG1];": 0.70,
+                    " [ACT_FLAG1];[ACT_TP_1]": 0.15,
+                    " [AUC];[ACT_FLAG1]": 0.03,
+                    " [AUC]": 0.04,
+                    "": 0.08}
+
+
+def get_trading_days(days):
+    """
+    Returns the given number of business days (Monday to Friday) beginning
+    with the first date setting.
+    """
+    dates = []
+    date = first_date
+    while len(dates) < days:
+        if date.weekday() < 5:
+            dates.append(date)
+        date += datetime.timedelta(days=1)
+    return dates
+
+
+def get_gmt_offset(date):
+    """
+    Returns the GMT offset of Central European Time at the given date, i.e.
+    two hours between the last Sundays of March and October and one hour
+    otherwise.
+    """
+    def last_sunday(month):
+        day = datetime.date(date.year, month, 31)
+        return day - datetime.timedelta(days=(day.weekday() + 1) % 7)
+    return 2 if last_sunday(3) <= date < last_sunday(10) else 1
+
+
+def get_date_string(date):
+    """
+    Returns a date in the format of the Date[G] column, e.g. 02-JAN-2018.
+    """
+    return date.strftime("%d-%b-%Y").upper()
+
+
+def get_time_strings(milliseconds):
+    """
+    Function converts integer milliseconds since midnight into strings in
+    the format of the Time[G] column (HH:MM:SS.fff). It's the counterpart of
+    the get_milliseconds() function of the pandashelper module.
+    """
+    ms = np.asarray(milliseconds, dtype=np.int64)
+    chars = np.zeros((len(ms), 12), dtype=np.uint8)
+    parts = [ms // 3600000, ms // 60000 % 60, ms // 1000 % 60]
+    for k, part in enumerate(parts):
+        chars[:, 3 * k] = part // 10 + 48
+        chars[:, 3 * k + 1] = part % 10 + 48
+        chars[:, 3 * k + 2] = ord(":")
+    chars[:, 8] = ord(".")
+    chars[:, 9] = ms % 1000 // 100 + 48
+    chars[:, 10] = ms % 100 // 10 + 48
+    chars[:, 11] = ms % 10 + 48
+    return chars.view("S12").ravel().astype(str)
+
+
+def get_event_times(rng, n, offset):
+    """
+    Function draws the times of n events of one day in GMT milliseconds. The
+    intensity per minute is u-shaped within the trading hours and low in
+    front of and behind the session.
+    """
+    minutes = np.arange(session[0] - margin, session[1] + margin)
+    x = (minutes - session[0]) / float(session[1] - session[0])
+    weights = np.where((x >= 0) & (x < 1), 1 + seasonality * (
+        2 * x - 1) ** 2, off_session_weight)
+    picked = rng.choice(minutes, size=n, p=weights / weights.sum())
+    times = (picked - offset * 60) * 60000 + rng.randint(0, 60000, size=n)
+    return np.sort(times)
+
+
+def get_day(rng, ticker, date, start_price, trades, quotes):
+    """
+    Function generates all rows of one ticker and one day as a dataframe.
+    The number of trades and quotes are poisson distributed with the given
+    rates. The midpoint follows a random walk on the tick grid, trades are
+    done at the bid or the ask and quotes may lack one side.
+    """
+    offset = get_gmt_offset(date)
+    n_trades = rng.poisson(trades)
+    n_quotes = rng.poisson(quotes)
+    n_other = rng.poisson((trades + quotes) * other_share)
+    n = n_trades + n_quotes + n_other
+    times = get_event_times(rng, n, offset)
+    types = rng.permutation(np.repeat(np.array(
+        ["Trade", "Quote", "Correction"]), [n_trades, n_quotes, n_other]))
+
+    # the midpoint is a random walk with the daily volatility
+    steps = rng.normal(0, daily_volatility / np.sqrt(max(n, 1)), size=n)
+    mid = start_price * np.exp(np.cumsum(steps))
+    spread = rng.randint(1, max_spread + 1, size=n) * tick_size
+    bid = np.round(np.round(mid / tick_size) * tick_size - np.floor(
+        spread / tick_size / 2) * tick_size, 2)
+    ask = np.round(bid + spread, 2)
+
+    trade = types == "Trade"
+    quote = types == "Quote"
+    price = np.where(trade, np.where(rng.random_sample(n) < 0.5, bid, ask),
+                     np.nan)
+    # the volumes and sizes are written as integer texts (empty if missing)
+    volume = np.where(trade, rng.geometric(
+        1.0 / mean_volume, size=n).astype(str), "")
+    side = rng.random_sample(n)
+    has_bid = quote & (side >= empty_bid)
+    has_ask = quote & ((side < empty_bid) | (side >= empty_bid + empty_ask))
+    sizes = []
+    for has_side in [has_bid, has_ask]:
+        sizes.append(np.where(has_side, rng.geometric(
+            1.0 / mean_volume, size=n).astype(str), ""))
+    qualifiers = np.where(trade, rng.choice(
+        list(trade_qualifiers), size=n, p=list(trade_qualifiers.values())),
+        "")
+
+    return pd.DataFrame({
+        '#RIC': ticker,
+        'Date[G]': get_date_string(date),
+        'Time[G]': get_time_strings(times),
+        'GMT Offset': "%+d" % offset,
+        'Type': types,
+        'Ex/Cntrb.ID': "",
+        'Price': price,
+        'Volume': volume,
+        'Bid Price': np.where(has_bid, bid, np.nan),
+        'Bid Size': sizes[0],
+        'Ask Price': np.where(has_ask, ask, np.nan),
+        'Ask Size': sizes[1],
+        'Qualifiers': qualifiers
+    }, columns=names)
+
+
+def get_tickers(count):
+    """
+    Returns the given number of synthetic ticker names.
+    """
+    return ["S%03d.DE" % k for k in range(count)]
+
+
+def get_file_name(ticker):
+    """
+    Returns the name of the raw file of a ticker in the same pattern as the
+    original files (the ticker is the second part separated by underscores).
+    """
+    return "synthetic_" + ticker + "_1.csv.gz"
+
+
+def write_source(path, ticker, days, trades, quotes, seed=0):
+    """
+    Function writes one raw file of a ticker with the given number of days
+    and the average number of trades and quotes per day. The rows are
+    written day by day, so that the memory does only depend on the rates.
+    """
+    rng = np.random.RandomState([seed] + list(ticker.encode()))
+    start_price = rng.uniform(20, 200)
+    f = gzip.open(path, "wt")
+    try:
+        header = True
+        for date in get_trading_days(days):
+            df = get_day(rng, ticker, date, start_price, trades, quotes)
+            df.to_csv(f, header=header, index=False, float_format="%.2f",
+                      na_rep="")
+            header = False
+            start_price = df["Price"].dropna().iloc[-1] if df[
+                "Type"].eq("Trade").any() else start_price
+    finally:
+        f.close()
+
+
+def write_sources(folder, tickers=2, days=5, trades=5000, quotes=50000,
+                  seed=0):
+    """
+    Function writes the raw files of the given number of tickers into the
+    given folder and returns the list of file names. Files that exist
+    already are kept, because the same settings always yield the same rows.
+    """
+    os.makedirs(folder, exist_ok=True)
+    files = []
+    for ticker in get_tickers(tickers):
+        file = get_file_name(ticker)
+        if not os.path.isfile(os.path.join(folder, file)):
+            write_source(os.path.join(folder, file), ticker, days, trades,
+                         quotes, seed)
+        files.append(file)
+    return files
@@ -0,0 +1,168 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The volatility module provides a vectorized engine for the realized standard
+error of the log midpoint that is part of the aggregation of quotes. All days
+of a dataframe are processed at once with plain numpy operations instead of
+building and merging one even grid per day with pandas.
+
+The numpy package must be installed to use this module.
+"""
+
+import numpy as np
+import Util.segments as segments
+
+NS_PER_SECOND = 1000000000
+NS_PER_DAY = 86400 * NS_PER_SECOND
+
+
+def check_frequency(seconds):
+    """
+    Function raises a ValueError if the given sampling frequency (in seconds)
+    can't be aligned with full minutes.
+    """
+    if seconds <= 0 or (60 % seconds != 0 and seconds % 60 != 0):
+        raise ValueError("Sampling frequency of " + str(seconds) +
+                         " seconds is neither a divisor nor a multiple " +
+                         "of 60 seconds.")
+
+
+def get_first_grid_point(opening, seconds):
+    """
+    Function returns the first even timestamp (integer nanoseconds) of the
+    grid with the given frequency in seconds for the given opening timestamps.
+    The opening is rounded up to full seconds that are a multiple of the
+    frequency. To reproduce the former grid of the round_seconds_up() function
+    (with in_range set to True), an opening that would be rounded up into the
+    next minute is set to the beginning of its own minute for frequencies
+    below one minute.
+    """
+    midnight = opening - opening % NS_PER_DAY
+    open_seconds = (opening - midnight) // NS_PER_SECOND
+    first = -(-open_seconds // seconds) * seconds
+    if seconds < 60:
+        first = np.where(first // 60 != open_seconds // 60,
+                         open_seconds - open_seconds % 60, first)
+    return midnight + first * NS_PER_SECOND
+
+
+def get_even_grid(opening, closing, seconds):
+    """
+    Function returns all even timestamps within the given opening and closing
+    timestamps (integer nanoseconds) of each day with the given frequency in
+    seconds. The return value is a tuple of the day number and the timestamp
+    of each grid point. The closing is rounded down to full seconds that are a
+    multiple of the frequency.
+    """
+    step = seconds * NS_PER_SECOND
+    first = get_first_grid_point(opening, seconds)
+    midnight = closing - closing % NS_PER_DAY
+    close_seconds = (closing - midnight) // NS_PER_SECOND
+    last = midnight + (close_seconds - close_seconds % seconds) * \
+        NS_PER_SECOND
+    counts = np.maximum((last - first) // step + 1, 0)
+    day = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(
+        np.cumsum(counts) - counts, counts)
+    grid = np.repeat(first, counts) + offsets * step
+    return day, grid
+
+
+def get_segment_std(values, starts, ends):
+    """
+    Function returns the population standard deviation (ddof of 0) of each
+    segment of the given values while null values are skipped. The two-pass
+    algorithm of pandas is applied on every segment so that the results are
+    identical to numpy.std() of a pandas series.
+    """
+    result = np.full(len(starts), np.nan)
+    for k in range(len(starts)):
+        segment = values[starts[k]:ends[k]]
+        mask = np.isnan(segment)
+        count = len(segment) - mask.sum()
+        if count == 0:
+            continue
+        segment = np.where(mask, 0, segment)
+        avg = segment.sum(dtype=np.float64) / count
+        sqr = (avg - segment) ** 2
+        sqr[mask] = 0
+        result[k] = np.sqrt(sqr.sum(dtype=np.float64) / count)
+    return result
+
+
+def get_realized_stderr(dates, times, values, frequencies=(10,)):
+    """
+    Calculate the realized standard error of the given values (typically the
+    log midpoints of quotes) per day for one or more sampling frequencies in
+    seconds. The values are sampled on an even grid between the first and the
+    last timestamp of each day. Duplicates of the same timestamp are reduced
+    to the last value, the grid points are interpolated linearly in time and
+    consecutive duplicates (with variance of zero) are dropped before the
+    standard error is computed.
+
+    The times must be given as datetime64[ns] or integer nanoseconds. The
+    return value is a tuple of the sorted distinct dates and a dictionary
+    with one array of standard errors per frequency.
+    """
+    for seconds in frequencies:
+        check_frequency(seconds)
+    dates = np.asarray(dates)
+    times = np.asarray(times).view(np.int64) if np.asarray(
+        times).dtype.kind == "M" else np.asarray(times, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    days, codes = segments.factorize_dates(dates)
+    if len(days) == 0:
+        return days, {seconds: np.zeros(0) for seconds in frequencies}
+
+    # build a monotonic key of day and time, the margin of one minute keeps
+    # grid points in front of the first quote within the range of their day
+    base = times.min() - 60 * NS_PER_SECOND
+    span = times.max() - base + 1
+    keys = codes * span + (times - base)
+    order = None if np.all(keys[1:] >= keys[:-1]) else np.argsort(
+        keys, kind="mergesort")
+    if order is not None:
+        keys, codes = keys[order], codes[order]
+        times, values = times[order], values[order]
+
+    # opening and closing per day are taken before the duplicates are dropped
+    starts, ends = segments.get_segments(codes)
+    opening, closing = times[starts], times[ends - 1]
+
+    # keep the last occurance of each timestamp
+    last = np.concatenate((keys[1:] != keys[:-1], [True]))
+    keys, codes = keys[last], codes[last]
+    times, values = times[last], values[last]
+    starts, ends = segments.get_segments(codes)
+    points = times.astype(np.float64)
+
+    result = {}
+    for seconds in frequencies:
+        day, grid = get_even_grid(opening, closing, seconds)
+        grid_keys = day * span + (grid - base)
+        x = grid.astype(np.float64)
+
+        # interpolate linearly in time with the same arithmetic as numpy.interp
+        # but only inside the range of quotes of the same day
+        j = np.searchsorted(keys, grid_keys, side="right") - 1
+        inside = (j >= starts[day]) & (grid_keys <= keys[ends[day] - 1])
+        j = np.where(inside, j, 0)
+        exact = inside & (points[j] == x)
+        between = inside & ~exact
+        k = np.minimum(j + 1, len(keys) - 1)
+        sampled = np.full(len(grid), np.nan)
+        sampled[exact] = values[j[exact]]
+        slope = (values[k[between]] - values[j[between]]) / (
+            points[k[between]] - points[j[between]])
+        sampled[between] = slope * (x[between] - points[j[between]]) + \
+            values[j[between]]
+
+        # drop consecutive duplicates within each day
+        keep = np.ones(len(grid), dtype=bool)
+        keep[1:] = (sampled[1:] != sampled[:-1]) | (day[1:] != day[:-1])
+        day, sampled = day[keep], sampled[keep]
+
+        grid_starts = np.searchsorted(day, np.arange(len(days)), side="left")
+        grid_ends = np.searchsorted(day, np.arange(len(days)), side="right")
+        result[seconds] = get_segment_std(sampled, grid_starts, grid_ends)
+    return days, result
@@ -0,0 +1,230 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The ztests module provides a vectorized engine for the z-tests by
+Paternoster that are done in z tests.R, i.e. the test whether the slope
+coefficients a of two regressions are equal:
+
+    z = (a1 - a2) / sqrt(a_se1^2 + a_se2^2)
+
+Instead of a double loop per pair the z-scores of all pairs of items (e.g.
+stocks, venues or periods) within each group (e.g. venue and model) are
+calculated at once from the vectors of coefficients and standard errors.
+The pairs of one group are in the order of a condensed matrix (the upper
+triangle row by row), so that the results can be returned in long format or
+as condensed or square matrices. The two-sided p-values can be adjusted for
+multiple testing within families of tests.
+
+The numpy and pandas packages must be installed to use this module. Required
+packages are the segments and regression modules that are also included in
+this project.
+"""
+
+import math
+import numpy as np
+import pandas as pd
+import Util.segments as segments
+import Util.regression as regression
+
+# define global settings for the z-tests
+correction = "none" # correction of the p-values for multiple testing
+                    # ("none", "bonferroni", "holm" or "bh" for the false
+                    # discovery rate of Benjamini and Hochberg)
+
+
+def get_z_scores(a1, se1, a2, se2):
+    """
+    Returns the z-scores of the differences of the given slope coefficients
+    with their standard errors (arrays of the same shape or broadcastable).
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (np.asarray(a1) - np.asarray(a2)) / np.sqrt(
+            np.asarray(se1) ** 2 + np.asarray(se2) ** 2)
+
+
+def get_p_values(z):
+    """
+    Returns the two-sided p-values of the given z-scores under the standard
+    normal distribution (null where the z-score is null).
+    """
+    z = np.asarray(z, dtype=np.float64)
+    p = np.fromiter(map(math.erfc, (np.abs(z.ravel()) / math.sqrt(2)).
+                        tolist()), np.float64, z.size)
+    return p.reshape(z.shape)
+
+
+def get_condensed(a, se):
+    """
+    Function returns the z-scores and p-values of all pairs of the given
+    coefficients as condensed matrices, i.e. the upper triangle row by row
+    (the pairs (0, 1), (0, 2), ..., (1, 2), ...).
+    """
+    first, second = np.triu_indices(len(a), 1)
+    a, se = np.asarray(a), np.asarray(se)
+    z = get_z_scores(a[first], se[first], a[second], se[second])
+    return z, get_p_values(z)
+
+
+def get_square_matrix(condensed, n, antisymmetric=False):
+    """
+    Returns the square matrix of n items from a condensed matrix. The
+    diagonal is null. The z-scores are antisymmetric (z of the pair (j, i)
+    is -z of the pair (i, j)), the p-values are symmetric.
+    """
+    matrix = np.full((n, n), np.nan)
+    first, second = np.triu_indices(n, 1)
+    matrix[first, second] = condensed
+    matrix[second, first] = -np.asarray(condensed) if antisymmetric else \
+        condensed
+    return matrix
+
+
+def get_adjusted_p_values(p, families=None, method=None):
+    """
+    Function adjusts the given p-values for multiple testing within each
+    family (an array of integer codes, all p-values form one family if it's
+    None) with the given method or with the correction setting of this
+    module. Null values are kept and not counted like in p.adjust() of R.
+    """
+    method = correction if method is None else method
+    p = np.asarray(p, dtype=np.float64)
+    if method == "none" or len(p) == 0:
+        return p.copy()
+    families = np.zeros(len(p), dtype=np.int64) if families is None else \
+        np.asarray(families, dtype=np.int64)
+    missing = np.isnan(p)
+    # sort by family and p-value (null values at the end of each family)
+    order = np.lexsort((np.where(missing, np.inf, p), families))
+    sorted_p = p[order]
+    starts, ends = segments.get_segments(families[order])
+    ranks, _ = segments.get_positions(starts, ends)
+    counts = np.repeat(segments.get_sums(~missing[order], starts),
+                       ends - starts)
+    offsets = families[order] * 2.0
+    if method == "bonferroni":
+        adjusted = np.minimum(sorted_p * counts, 1)
+    elif method == "holm":
+        # running maximum within each family, the offset of 2 per family
+        # separates the families in one accumulation
+        adjusted = np.maximum.accumulate(offsets + np.where(
+            np.isnan(sorted_p), 0, np.minimum(
+                sorted_p * (counts - ranks), 1))) - offsets
+    elif method == "bh":
+        # running minimum from the largest p-value of each family
+        adjusted = (np.minimum.accumulate((offsets + np.where(
+            np.isnan(sorted_p), 1, np.minimum(
+                sorted_p * counts / (ranks + 1), 1)))[::-1]))[::-1] - \
+            offsets
+    else:
+        raise ValueError("Unknown correction method: " + str(method))
+    result = np.empty(len(p))
+    result[order] = np.where(np.isnan(sorted_p), np.nan, adjusted)
+    return result
+
+
+def get_pair_rows(starts, ends):
+    """
+    Function returns the rows of the first and the second item of all pairs
+    within each segment (in the order of condensed matrices per segment).
+    Segments of the same size are processed at once. The return value is a
+    tuple of the segment and both rows of each pair.
+    """
+    groups, firsts, seconds = [], [], []
+    sizes = ends - starts
+    for size in np.unique(sizes[sizes > 1]):
+        selected = np.flatnonzero(sizes == size)
+        first, second = np.triu_indices(size, 1)
+        groups.append(np.repeat(selected, len(first)))
+        firsts.append((starts[selected][:, None] + first).ravel())
+        seconds.append((starts[selected][:, None] + second).ravel())
+    if not groups:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    groups = np.concatenate(groups)
+    # restore the order of the segments
+    order = np.argsort(groups, kind="stable")
+    return groups[order], np.concatenate(firsts)[order], \
+        np.concatenate(seconds)[order]
+
+
+def get_pairwise_tests(coefficients, group_columns, item_column,
+                       family_columns=None, method=None):
+    """
+    Test the slope coefficients of all pairs of items within each group of
+    a table of coefficients (with the columns a and a_se like the result of
+    regression.get_coefficients()), e.g. all pairs of stocks per venue and
+    model or all pairs of venues per stock and model. The p-values are
+    adjusted within each family of tests (given by columns, by default the
+    group) with the given method or the correction setting.
+
+    The return value is a dataframe in long format with the group columns,
+    both items (the item column with the suffixes 1 and 2), the z-score z,
+    the p-value p and the adjusted p-value p_adjusted. The pairs of each
+    group follow the order of the rows in the table of coefficients.
+    """
+    coefficients = coefficients.dropna(subset=group_columns)
+    group_codes = coefficients.groupby(group_columns, sort=True).ngroup(
+        ).values
+    order = np.argsort(group_codes, kind="stable")
+    starts, ends = segments.get_segments(group_codes[order])
+    groups, first, second = get_pair_rows(starts, ends)
+    first, second = order[first], order[second]
+    a = coefficients["a"].values.astype(np.float64)
+    se = coefficients["a_se"].values.astype(np.float64)
+    tests = coefficients[group_columns].iloc[first].reset_index(drop=True)
+    tests[item_column + "1"] = coefficients[item_column].values[first]
+    tests[item_column + "2"] = coefficients[item_column].values[second]
+    tests["z"] = get_z_scores(a[first], se[first], a[second], se[second])
+    tests["p"] = get_p_values(tests["z"].values)
+    # the families are coded on the rows of the coefficients (much fewer
+    # than the pairs), by default each group is one family
+    families = groups if family_columns is None else coefficients.groupby(
+        family_columns, sort=True).ngroup().values[first]
+    tests["p_adjusted"] = get_adjusted_p_values(tests["p"].values,
+                                                families, method)
+    return tests
+
+
+def get_stock_tests(coefficients, method=None):
+    """
+    Test the slope coefficients of all pairs of stocks per venue and model
+    (part 1 of z tests.R).
+    """
+    return get_pairwise_tests(coefficients, ["venue", "model"], "symbol",
+                              method=method)
+
+
+def get_venue_tests(coefficients, method=None):
+    """
+    Test the slope coefficients of all pairs of venues per stock (the
+    primary ticker symbol_rm) and model (part 2 of z tests.R).
+    """
+    return get_pairwise_tests(coefficients, ["index", "symbol_rm", "model"],
+                              "venue", method=method)
+
+
+def get_period_tests(coefficients, method=None):
+    """
+    Test the slope coefficients of all pairs of periods per stock and model.
+    The coefficients must be estimated with windows (see
+    regression.get_coefficients()) or be given as list of tables, one per
+    period (part 3 of z tests.R with two tables).
+    """
+    if isinstance(coefficients, list):
+        coefficients = pd.concat([df.assign(first_date=str(i + 1))
+                                  for i, df in enumerate(coefficients)],
+                                 ignore_index=True)
+    return get_pairwise_tests(coefficients, ["venue", "symbol", "model"],
+                              "first_date", method=method)
+
+
+def get_wide_z_scores(tests, columns):
+    """
+    Returns the z-scores of all models side by side (z1 to z6 in the order
+    of the models of the regression module) with one row per combination of
+    the given columns like the csv files of z tests.R.
+    """
+    wide = tests.set_index(columns + ["model"])["z"].unstack("model")
+    wide = wide.reindex(columns=regression.models)
+    wide.columns = ["z" + str(i + 1) for i in range(len(wide.columns))]
+    return wide.reset_index()
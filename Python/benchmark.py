@@ -0,0 +1,33 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+This benchmark module is the entry point to measure the performance of the
+preprocessing stages. Since the TRTH datasets can't be shipped with this
+project, synthetic raw files of several sizes are generated once and all
+stages are timed on them. The results are compared with the baseline of a
+former run to detect regressions.
+
+Required package is the benchmark module that is also included in this
+project.
+"""
+
+import os
+import tempfile
+import Common.benchmark as benchmark
+
+if __name__ == "__main__":
+
+    # folder of the synthetic raw files (they are generated only once)
+    folder = os.path.join(tempfile.gettempdir(), "InvarianceHypothesis")
+    # sizes of the synthetic data as defined in the benchmark module
+    sizes = ["small", "medium"]
+    # file with the results of a former run to detect regressions
+    target = "Benchmark Baseline.json"
+    # save the results as new baseline after the run
+    save_baseline = False
+
+    baseline = benchmark.load_baseline(target)
+    results = benchmark.run(sizes, folder)
+    benchmark.print_report(results, baseline)
+    if save_baseline or not baseline:
+        benchmark.save_baseline(results, target)
@@ -13,7 +13,7 @@ version number can be found in the requirements.txt file.
 The typical working procedure with this module is a cycle that consists of the
 following five steps:
  - read all files to get the starting row for each date (*)
- - write these row numbers in a file (*)
+ - write these row numbers in a binary index file (*)
  - load these row numbers from a file
  - aggregate the raw data (and get the distribution of data optionally)
  - save these aggregations to a csv file
@@ -21,12 +21,34 @@ following five steps:
 (*) while these steps are done only once typically, the following three steps
 can be iterated more quickly if the row numbers are accessible by a file
 easily, but you can iterate all five steps in a row of course
+
+Alternatively, all stages that are needed for a trading venue (or for the
+container and the regressions of all venues) can be run from the command line
+by the workflow module, which runs only those stages whose inputs, parameters
+or code changed since their last run, e.g.
+    python program.py "DAX Xetra" --data <folder of the venue folders>
+    python program.py all --data <folder> --target regression
+(see python program.py --help for all options)
 """
 
+import os
+import sys
 import Common.preprocessing as preprocessing
+import Common.parallel as parallel
+import Common.container as container
+import Util.regression as regression
+import Util.ztests as ztests
+import Util.panel as panel
+import Common.workflow as workflow
 
 if __name__ == "__main__":
 
+    # with arguments on the command line the stages are run by the workflow
+    # module instead of the procedure below
+    if len(sys.argv) > 1:
+        workflow.main(sys.argv[1:])
+        sys.exit()
+
     # text filter for names of raw files
     additional_filter = {"xetra": "",
                          "euronext": "",
@@ -43,6 +65,57 @@ if __name__ == "__main__":
               ("CAC MTF", "turquoise"),
               ("CAC MTF", "chix")]
 
+    # mode of the aggregation, the modes are alternatives:
+    #  - "rows": aggregate the raw files by the row numbers of the index file
+    #  - "cache": aggregate the columnar cache (see init_cache() below)
+    #  - "streaming": aggregate the raw files without row numbers
+    #  - "incremental": aggregate only new or changed days of the raw files
+    #    and merge them into the saved output files
+    mode = "rows"
+
+    # number of worker processes to aggregate the tickers of all venues in
+    # parallel in the "rows" mode (set to 0 for the serial mode)
+    workers = 0
+    preprocessors = []
+
+    # run the analyses of all trading venues after the aggregation (the
+    # container, the regressions, the z-tests and the panel regressions
+    # that are saved in the folder Regression)
+    analyses = False
+
+    # csv backend to read the raw files ("pandas" or the multi-threaded and
+    # typed "arrow" backend that requires the optional pyarrow package)
+    preprocessing.pandashelper.csv_backend = "pandas"
+
+    # output format of the aggregations ("csv" or the partitioned "parquet"
+    # files in the folder Aggregationen that require the optional pyarrow
+    # package and can be loaded in R with the arrow package)
+    preprocessing.pandashelper.output_format = "csv"
+
+    # number of chunks that are read ahead in a background thread while the
+    # current chunk is aggregated (0 to read in sequence, each chunk needs
+    # about as much memory as the rows_limit_per_iter setting implies)
+    preprocessing.pandashelper.prefetch_depth = 0
+
+    # resolutions of intraday bars of trades and quotes in seconds that are
+    # calculated in the same pass as the daily aggregations (empty for none)
+    preprocessing.pandashelper.bar_resolutions = []
+
+    # calendars of the trading sessions per index (trading hours in local
+    # time, holidays and half-days with an earlier end of trading), e.g.
+    # preprocessing.sessions.calendars["DAX"]["holidays"].append("15-JUN-2018")
+
+    # screening rules of the trades per venue by the flags of their
+    # qualifiers (all other venues use the default rule of ACT_FLAG1), e.g.
+    # preprocessing.qualifiers.rules["CAC Paris"] = {
+    #     "require": ["act_flag1"], "exclude": ["auction"]}
+
+    # file to which the time, rows, bytes and peak memory of every stage are
+    # appended as json lines (None to print the summary table only) and the
+    # ticker that is profiled with the sampling profiler (None to turn it off)
+    preprocessing.instrumentation.log_file = None
+    preprocessing.instrumentation.profile_ticker = None
+
     # iterate through all eight trading venues
     for i in range(8):
 
@@ -53,9 +126,69 @@ if __name__ == "__main__":
         # instanciate new preprocessor class with input folder and text filter
         pp = preprocessing.PreProcessor(input_folder, additional_filter[folder_and_filter[i][1]])
 
-        # do the desired preprocessing operations
+        # do the desired preparations that are needed only once (the index
+        # file for the "rows" mode, the cache for the "cache" mode)
         # pp.init_rows_per_date()
-        # pp.save_rows_to_json()
-        pp.load_rows_per_date()
-        pp.init_aggregations()
-        pp.save_aggregations_to_csv()
+        # pp.save_rows_to_index()
+        # pp.init_checkpoints()
+        # pp.init_cache()
+
+        # aggregate the trading venue in the selected mode
+        if mode == "rows":
+            pp.load_rows_per_date()
+            if workers:
+                preprocessors.append(pp)
+                continue
+            pp.init_aggregations()
+        elif mode == "cache":
+            pp.init_aggregations_from_cache()
+        elif mode == "streaming":
+            pp.init_aggregations_streaming()
+        elif mode == "incremental":
+            # the output files are saved after each raw file already
+            pp.init_aggregations_incremental()
+            continue
+        else:
+            raise ValueError("Unknown mode of the aggregation: " + str(mode))
+        pp.save_aggregations()
+
+    # in parallel mode the tickers of all venues are spread across the
+    # workers at once
+    if workers:
+        parallel.init_aggregations(preprocessors, workers)
+        for pp in preprocessors:
+            pp.save_aggregations()
+
+    if not analyses:
+        sys.exit()
+
+    # build the panel of the aggregations of all trading venues (merged
+    # trades and quotes with the invariance variables) that is loaded by the
+    # analyses, it's cached in the folder of the aggregations and only built
+    # again if any aggregation changed (the folder follows the output format
+    # setting above)
+    df = container.ContainerBuilder().get_container()
+    os.makedirs("Regression", exist_ok=True)
+
+    # estimate the six models of the invariance hypothesis per ticker (and
+    # optionally per window of dates, e.g. regression.get_rolling_windows(
+    # df, 3) for rolling windows of three months) in one batched pass and
+    # save the coefficients like regression.R
+    coefficients = regression.get_coefficients(df)
+    coefficients.to_csv("Regression/coefficient.csv", index=False)
+
+    # do the z-tests by Paternoster of the slope coefficients of all pairs of
+    # stocks per venue and model (or of venues per stock with
+    # get_venue_tests and of periods with get_period_tests), the p-values
+    # are adjusted with the correction setting of the ztests module, e.g.
+    # ztests.correction = "holm"
+    ztests.get_stock_tests(coefficients).to_csv(
+        "Regression/z_tests_stocks.csv", index=False)
+
+    # estimate the fixed effects panel regressions of all models per index
+    # and venue (like panel regression.R) with the given number of worker
+    # processes, optionally with twoways effects and cluster-robust standard
+    # errors (effect and cluster settings of the panel module), e.g.
+    # panel.cluster = "entity"
+    panel.get_panel_coefficients(df, workers=workers).to_csv(
+        "Regression/coefficient_panel.csv", index=False)